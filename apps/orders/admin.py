@@ -2,14 +2,29 @@
 from typing import Optional
 
 # Django
-from django.contrib import admin
+from django.contrib import (
+    admin,
+    messages,
+)
 from django.core.handlers.wsgi import WSGIRequest
+from django.db.models import QuerySet
+from django.forms import ModelForm
+
+# Stripe
+import stripe
 
 # Local
+from .catalog import (
+    SyncResult,
+    sync_catalog,
+)
 from .models import (
     Item,
     Order,
+    OrderLine,
     Discount,
+    DiscountItem,
+    Payment,
     Tax
 )
 
@@ -32,13 +47,38 @@ class ItemAdmin(admin.ModelAdmin):
                 'currency',
             )
         }),
+        ('Stripe', {
+            'fields': (
+                'stripe_product_id',
+                'stripe_price_id',
+            )
+        }),
+    )
+    readonly_fields = (
+        'stripe_product_id',
+        'stripe_price_id',
     )
-    readonly_fields = ()
     list_display = (
         'name',
         'price',
         'currency',
     )
+    actions = (
+        'sync_stripe_catalog',
+    )
+
+    @admin.action(description='Синхронизировать со Stripe')
+    def sync_stripe_catalog(
+        self,
+        request: WSGIRequest,
+        queryset: QuerySet[Item]
+    ) -> None:
+        result: SyncResult = sync_catalog(queryset)
+        self.message_user(
+            request,
+            f'Synced: {result.synced}, failed: {len(result.failed)}',
+            messages.WARNING if result.failed else messages.SUCCESS
+        )
 
     def get_readonly_fields(
         self, 
@@ -53,18 +93,64 @@ class ItemAdmin(admin.ModelAdmin):
         )
 
 
+class OrderLineInline(admin.TabularInline):
+
+    model = OrderLine
+    raw_id_fields = (
+        'item',
+    )
+    readonly_fields = (
+        'unit_amount',
+    )
+    extra = 1
+
+
 class OrderAdmin(admin.ModelAdmin):
 
     model = Order
+    inlines = (
+        OrderLineInline,
+    )
+    readonly_fields = (
+        'total_amount',
+        'status',
+    )
+    list_display = (
+        '__str__',
+        'full_price',
+        'status',
+    )
+    list_filter = (
+        'status',
+    )
+
+
+class DiscountItemInline(admin.TabularInline):
+
+    model = DiscountItem
+    raw_id_fields = (
+        'item',
+    )
+    extra = 1
 
 
 class DiscountAdmin(admin.ModelAdmin):
 
     model = Discount
+    inlines = (
+        DiscountItemInline,
+    )
+    readonly_fields = (
+        'stripe_coupon_id',
+    )
     list_display = (
+        '__str__',
         'persent',
     )
 
+    def get_queryset(self, request: WSGIRequest) -> QuerySet[Discount]:
+        return super().get_queryset(request).prefetch_related('item')
+
 
 class TaxAdmin(admin.ModelAdmin):
 
@@ -77,6 +163,7 @@ class TaxAdmin(admin.ModelAdmin):
                 'percentage',
                 'country',
                 'description',
+                'stripe_id',
             )
         }),
         ('Предмет', {
@@ -85,6 +172,9 @@ class TaxAdmin(admin.ModelAdmin):
             )
         }),
     )
+    readonly_fields = (
+        'stripe_id',
+    )
     list_display = (
         'items_name',
         'display_name',
@@ -92,8 +182,56 @@ class TaxAdmin(admin.ModelAdmin):
         'country',
     )
 
+    def get_queryset(self, request: WSGIRequest) -> QuerySet[Tax]:
+        return super().get_queryset(request).prefetch_related('item')
+
+    def save_model(
+        self,
+        request: WSGIRequest,
+        obj: Tax,
+        form: ModelForm,
+        change: bool
+    ) -> None:
+        super().save_model(request, obj, form, change)
+        try:
+            obj.sync_stripe()
+        except stripe.error.StripeError as e:
+            self.message_user(
+                request,
+                f'Stripe TaxRate is not synced: {e}',
+                messages.WARNING
+            )
+
+
+class PaymentAdmin(admin.ModelAdmin):
+
+    model = Payment
+    raw_id_fields = (
+        'order',
+    )
+    readonly_fields = (
+        'stripe_session_id',
+        'stripe_payment_intent_id',
+        'event_created',
+    )
+    list_display = (
+        'stripe_session_id',
+        'order',
+        'status',
+        'amount_total',
+        'currency',
+        'event_created',
+    )
+    list_select_related = (
+        'order',
+    )
+    list_filter = (
+        'status',
+    )
+
 
 admin.site.register(Order, OrderAdmin)
+admin.site.register(Payment, PaymentAdmin)
 admin.site.register(Item, ItemAdmin)
 admin.site.register(Discount, DiscountAdmin)
 admin.site.register(Tax, TaxAdmin)
@@ -1,6 +1,14 @@
+# Django
 from django.apps import AppConfig
 
 
 class OrdersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'orders'
+
+    def ready(self) -> None:
+        from . import (  # noqa: F401
+            queries,
+            signals,
+            tracing,
+        )
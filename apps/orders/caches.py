@@ -0,0 +1,195 @@
+# Python
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Hashable,
+    Optional,
+)
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
+import asyncio
+import time
+
+# Django
+from django.core.cache import cache
+from django.db import transaction
+
+# Local
+from .metrics import record_cache
+
+
+class LocalCache:
+    """Thread-safe in-process LRU cache with optional expiry.
+
+    Hits and misses of a named cache are counted in metrics.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        name: Optional[str] = None
+    ) -> None:
+
+        self.maxsize: int = maxsize
+        self.name: Optional[str] = name
+        self._data: OrderedDict = OrderedDict()
+        self._lock: Lock = Lock()
+
+    def get(
+        self,
+        key: Hashable,
+        default: Any = None
+    ) -> Any:
+
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                value, expires = default, None
+            else:
+                if expires is not None and expires <= time.monotonic():
+                    del self._data[key]
+                    value = default
+                else:
+                    self._data.move_to_end(key)
+
+        if self.name:
+            record_cache(self.name, value is not default, value is default)
+        return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        timeout: Optional[float] = None
+    ) -> None:
+
+        expires: Optional[float] = None
+        if timeout is not None:
+            expires = time.monotonic() + timeout
+
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key onto one call.
+
+    The first caller runs the function and every caller arriving while
+    it runs gets its result or exception. Threads and event loops are
+    coalesced separately.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, Future] = {}
+        self._tasks: dict[tuple[int, Hashable], asyncio.Task] = {}
+        self._lock: Lock = Lock()
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        with self._lock:
+            future: Optional[Future] = self._calls.get(key)
+            leader: bool = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            result: Any = function()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def ado(
+        self,
+        key: Hashable,
+        function: Callable[[], Awaitable[Any]]
+    ) -> Any:
+
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        task_key: tuple[int, Hashable] = (id(loop), key)
+        task: Optional[asyncio.Task] = self._tasks.get(task_key)
+        if task is None:
+            task = self._tasks[task_key] = loop.create_task(function())
+            task.add_done_callback(
+                lambda _: self._tasks.pop(task_key, None)
+            )
+
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._calls) + len(self._tasks)
+
+
+def get_version(name: str) -> int:
+    """Version of a cached data family shared by all processes."""
+
+    return get_versions(name)[0]
+
+
+def get_versions(*names: str) -> tuple[int, ...]:
+    """Versions of several data families in one cache round-trip."""
+
+    keys: list[str] = [f'orders:version:{name}' for name in names]
+    found: dict[str, int] = cache.get_many(keys)
+
+    key: str
+    for key in keys:
+        if key not in found:
+            cache.add(key, 1, None)
+
+    return tuple(found.get(key, 1) for key in keys)
+
+
+def bump_version(name: str) -> None:
+    """Invalidates every cache key built with the version."""
+
+    key: str = f'orders:version:{name}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+
+
+def invalidate_version(name: str) -> None:
+    """Bumps version now and once more after the transaction commits.
+
+    The second bump drops entries that other processes rendered from
+    data this transaction had not committed yet.
+    """
+
+    bump_version(name)
+    transaction.on_commit(lambda: bump_version(name))
+
+
+# (tax version, item id) -> tuple of Stripe TaxRate ids.
+tax_rates_cache: LocalCache = LocalCache(maxsize=4096, name='tax_rates')
+
+# (coupon version, discount fingerprint) -> Stripe Coupon id.
+coupons_cache: LocalCache = LocalCache(maxsize=1024, name='coupons')
+
+# Checkout session key -> session being created.
+checkout_flights: SingleFlight = SingleFlight()
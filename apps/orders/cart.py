@@ -0,0 +1,452 @@
+# Python
+from typing import (
+    Iterable,
+    Optional,
+)
+import asyncio
+import logging
+import time
+
+# Django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+# Stripe
+import stripe
+
+# Local
+from .caches import (
+    checkout_flights,
+    get_version,
+)
+from .gateway import get_gateway
+from .metrics import record_cache
+from .models import (
+    Item,
+    Order,
+    Tax,
+    Discount,
+    get_fingerprint,
+)
+from .resilience import CircuitOpenError
+from .tracing import start_span
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class CheckoutCart:
+    """Stripe checkout line items keyed by item id."""
+
+    def __init__(self, items: Iterable[Item] = ()) -> None:
+        self._items: dict[int, Item] = {}
+        self._quantities: dict[int, int] = {}
+        self._unit_amounts: dict[int, int] = {}
+        self._discounts: Optional[dict[int, Discount]] = None
+        self.reference: Optional[str] = None
+
+        item: Item
+        for item in items:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @classmethod
+    def from_order(cls, order: Order) -> 'CheckoutCart':
+        """Cart of order lines, expects prefetched lines with items."""
+
+        cart: CheckoutCart = cls()
+        cart.reference = str(order.id)
+        for line in order.lines.all():
+            cart.add(
+                line.item,
+                quantity=line.quantity,
+                unit_amount=line.unit_amount
+            )
+
+        return cart
+
+    def add(
+        self,
+        item: Item,
+        quantity: int = 1,
+        unit_amount: Optional[int] = None
+    ) -> None:
+        """Adds item to cart, aggregating repeated items."""
+
+        self._items.setdefault(item.id, item)
+        if unit_amount is not None:
+            self._unit_amounts.setdefault(item.id, unit_amount)
+        self._quantities[item.id] = self._quantities.get(
+            item.id, 0
+        ) + quantity
+        self._discounts = None
+
+    def sync_stripe(self) -> None:
+        """Syncs catalog of unsynced items with one bulk update."""
+
+        unsynced: list[Item] = [
+            item for item in self._items.values()
+            if not item.is_stripe_synced
+        ]
+        item: Item
+        for item in unsynced:
+            item.sync_stripe(commit=False)
+
+        Item.objects.bulk_update(unsynced, Item.STRIPE_FIELDS)
+
+    async def async_stripe(self) -> None:
+        """Async ``sync_stripe`` creating products concurrently."""
+
+        unsynced: list[Item] = [
+            item for item in self._items.values()
+            if not item.is_stripe_synced
+        ]
+        await asyncio.gather(*(
+            sync_to_async(item.sync_stripe, thread_sensitive=False)(
+                commit=False
+            )
+            for item in unsynced
+        ))
+
+        if unsynced:
+            await Item.objects.abulk_update(unsynced, Item.STRIPE_FIELDS)
+
+    def get_item_discounts(self) -> dict[int, Discount]:
+        """Active discount of every discounted item in the cart."""
+
+        if self._discounts is None:
+            discounted: list[int] = [
+                item_id for item_id, item in self._items.items()
+                if item.is_discounted
+            ]
+            self._discounts = Discount.objects.active_for(
+                discounted
+            ) if discounted else {}
+
+        return self._discounts
+
+    def get_coupon_discount(self) -> Optional[Discount]:
+        """Discount when every item in the cart shares one.
+
+        Stripe applies a single coupon to the whole session, so carts
+        with mixed discounts get discounted prices per line instead.
+        """
+
+        disconts: dict[int, Discount] = self.get_item_discounts()
+        if not disconts or len(disconts) != len(self._items):
+            return None
+
+        discont_ids: set[int] = {d.id for d in disconts.values()}
+        if len(discont_ids) != 1:
+            return None
+
+        return next(iter(disconts.values()))
+
+    def get_coupon_id(self) -> Optional[str]:
+        """Coupon of the discount shared by the whole cart."""
+
+        discont: Optional[Discount] = self.get_coupon_discount()
+        return discont.get_stripe_coupon_id() if discont else None
+
+    def get_line_items(self) -> list[dict]:
+        """Stripe line items of the whole cart."""
+
+        self.sync_stripe()
+        return self.build_line_items(
+            Tax.objects.get_stripe_ids_for(self._items),
+            self.get_coupon_id()
+        )
+
+    def build_line_items(
+        self,
+        tax_ids: dict[int, list[str]],
+        coupon_id: Optional[str]
+    ) -> list[dict]:
+        """Line items of a synced cart with its tax rates and coupon."""
+
+        disconts: dict[int, Discount] = (
+            {} if coupon_id else self.get_item_discounts()
+        )
+        line_items: list[dict] = []
+
+        item_id: int
+        item: Item
+        for item_id, item in self._items.items():
+            line_item: dict = {
+                'quantity': self._quantities[item_id],
+                'tax_rates': tax_ids[item_id]
+            }
+            unit_amount: int = self._unit_amounts.get(item_id, item.amount)
+            if item_id in disconts:
+                unit_amount = disconts[item_id].get_discounted_amount(
+                    unit_amount
+                )
+
+            if unit_amount == item.amount:
+                line_item['price'] = item.stripe_price_id
+            else:
+                line_item['price_data'] = {
+                    'currency': item.currency,
+                    'product': item.stripe_product_id,
+                    'unit_amount': unit_amount,
+                }
+            line_items.append(line_item)
+
+        return line_items
+
+    def get_discounts(self) -> list[dict]:
+        """Stripe discounts of the cart."""
+
+        return self.build_discounts(self.get_coupon_id())
+
+    def build_discounts(self, coupon_id: Optional[str]) -> list[dict]:
+        if not coupon_id:
+            return []
+
+        return [{
+            'coupon': coupon_id
+        }]
+
+    def get_session_params(
+        self,
+        session_key: str,
+        line_items: list[dict],
+        discounts: list[dict]
+    ) -> dict:
+
+        params: dict = {
+            'line_items': line_items,
+            'mode': 'payment',
+            'success_url': settings.DOMAIN + '/success',
+            'cancel_url': settings.DOMAIN + '/cancel',
+            'discounts': discounts,
+            'metadata': {
+                'session_key': session_key,
+            },
+        }
+        if self.reference:
+            params['client_reference_id'] = self.reference
+
+        return params
+
+    def get_session_key(self) -> str:
+        """Fingerprint of everything the checkout session is built of.
+
+        Identical carts with the same discounts and taxes share a key,
+        so they coalesce onto one session.
+        """
+
+        disconts: dict[int, Discount] = self.get_item_discounts()
+        return get_fingerprint(
+            self.reference,
+            [
+                (
+                    item_id,
+                    self._quantities[item_id],
+                    self._unit_amounts.get(item_id, item.amount),
+                    item.price_key,
+                    item.product_fingerprint,
+                )
+                for item_id, item in sorted(self._items.items())
+            ],
+            [
+                (item_id, disconts[item_id].fingerprint)
+                for item_id in sorted(disconts)
+            ],
+            get_version('tax'),
+        )
+
+    def get_idempotency_key(self, session_key: str) -> str:
+        """Stripe idempotency key of a session, rotated every window.
+
+        Processes that miss each other's cache still get one session,
+        and a new one is created once the cached one has expired or
+        webhooks report it finished.
+        """
+
+        return get_fingerprint(
+            session_key,
+            int(time.time() // settings.CHECKOUT_IDEMPOTENCY_WINDOW),
+            cache.get(f'orders:session-generation:{session_key}', 0)
+        )
+
+    def get_session_timeout(
+        self,
+        checkout_session: stripe.checkout.Session
+    ) -> int:
+
+        return int(
+            checkout_session.expires_at
+            - time.time()
+            - settings.CHECKOUT_SESSION_MARGIN
+        )
+
+    def load_session(
+        self,
+        data: Optional[dict]
+    ) -> Optional[stripe.checkout.Session]:
+
+        if data is None:
+            return None
+        return stripe.util.convert_to_stripe_object(data)
+
+    def get_stripe_session(self) -> Optional[stripe.checkout.Session]:
+        """Checkout session of the cart, reused until it nearly expires.
+
+        Concurrent requests for an identical cart wait for one session
+        to be created instead of creating their own. Returns None on
+        Stripe errors and raises CircuitOpenError while Stripe is down.
+        """
+
+        with start_span('checkout', attributes={
+            'orders.item_count': len(self._items),
+        }) as span:
+            try:
+                session_key: str = self.get_session_key()
+                checkout_session: Optional[stripe.checkout.Session] =\
+                    self.load_session(
+                        cache.get(f'orders:session:{session_key}')
+                    )
+                record_cache(
+                    'session',
+                    checkout_session is not None,
+                    checkout_session is None
+                )
+                span.set_attribute(
+                    'orders.session_cached',
+                    checkout_session is not None
+                )
+                if checkout_session is None:
+                    checkout_session = checkout_flights.do(
+                        session_key,
+                        lambda: self.create_stripe_session(session_key)
+                    )
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                span.set_error(str(e))
+                self.report_error(e)
+                return None
+
+        return checkout_session
+
+    def create_stripe_session(
+        self,
+        session_key: str
+    ) -> stripe.checkout.Session:
+
+        checkout_session: stripe.checkout.Session =\
+            get_gateway().create_checkout_session(
+                idempotency_key=self.get_idempotency_key(session_key),
+                **self.get_session_params(
+                    session_key,
+                    self.get_line_items(),
+                    self.get_discounts()
+                )
+            )
+        timeout: int = self.get_session_timeout(checkout_session)
+        if timeout > 0:
+            cache.set(
+                f'orders:session:{session_key}',
+                checkout_session.to_dict_recursive(),
+                timeout
+            )
+
+        return checkout_session
+
+    async def aget_stripe_session(self) -> Optional[stripe.checkout.Session]:
+        """Async ``get_stripe_session``."""
+
+        with start_span('checkout', attributes={
+            'orders.item_count': len(self._items),
+        }) as span:
+            try:
+                session_key: str = await sync_to_async(
+                    self.get_session_key
+                )()
+                checkout_session: Optional[stripe.checkout.Session] =\
+                    self.load_session(
+                        await cache.aget(f'orders:session:{session_key}')
+                    )
+                record_cache(
+                    'session',
+                    checkout_session is not None,
+                    checkout_session is None
+                )
+                span.set_attribute(
+                    'orders.session_cached',
+                    checkout_session is not None
+                )
+                if checkout_session is None:
+                    checkout_session = await checkout_flights.ado(
+                        session_key,
+                        lambda: self.acreate_stripe_session(session_key)
+                    )
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                span.set_error(str(e))
+                self.report_error(e)
+                return None
+
+        return checkout_session
+
+    async def acreate_stripe_session(
+        self,
+        session_key: str
+    ) -> stripe.checkout.Session:
+        """Async ``create_stripe_session``.
+
+        Products, tax rates and the coupon do not depend on each other,
+        so their Stripe calls run concurrently in worker threads while
+        database work stays on the async ORM.
+        """
+
+        # Also loads the item discounts that line items are built from.
+        discont: Optional[Discount] = await sync_to_async(
+            self.get_coupon_discount
+        )()
+        tax_ids: dict[int, list[str]]
+        coupon_id: Optional[str]
+        _, tax_ids, coupon_id = await asyncio.gather(
+            self.async_stripe(),
+            Tax.objects.aget_stripe_ids_for(self._items),
+            discont.aget_stripe_coupon_id() if discont
+            else asyncio.sleep(0),
+        )
+        idempotency_key: str = await sync_to_async(
+            self.get_idempotency_key
+        )(session_key)
+        checkout_session: stripe.checkout.Session = await sync_to_async(
+            get_gateway().create_checkout_session,
+            thread_sensitive=False
+        )(
+            idempotency_key=idempotency_key,
+            **self.get_session_params(
+                session_key,
+                self.build_line_items(tax_ids, coupon_id),
+                self.build_discounts(coupon_id)
+            )
+        )
+        timeout: int = self.get_session_timeout(checkout_session)
+        if timeout > 0:
+            await cache.aset(
+                f'orders:session:{session_key}',
+                checkout_session.to_dict_recursive(),
+                timeout
+            )
+
+        return checkout_session
+
+    def report_error(self, e: Exception) -> None:
+        """Reports a failed checkout of the cart."""
+
+        logger.error(
+            'Stripe exeption by item ids %s: %s',
+            list(self._items),
+            e,
+            exc_info=e
+        )
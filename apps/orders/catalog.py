@@ -0,0 +1,83 @@
+# Python
+from typing import (
+    Iterable,
+    Iterator,
+    Optional,
+)
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import (
+    dataclass,
+    field,
+)
+from itertools import islice
+import logging
+
+# Stripe
+import stripe
+
+# Local
+from .models import Item
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SyncResult:
+    """Counters of one catalog sync run."""
+
+    checked: int = 0
+    synced: int = 0
+    failed: list[int] = field(default_factory=list)
+
+
+def batched(
+    items: Iterable[Item],
+    batch_size: int
+) -> Iterator[list[Item]]:
+
+    iterator: Iterator[Item] = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def _sync_item(item: Item) -> Optional[bool]:
+    try:
+        return item.sync_stripe(commit=False)
+    except stripe.error.StripeError:
+        logger.exception(
+            'Stripe catalog sync failed for item id %s',
+            item.id
+        )
+        return None
+
+
+def sync_catalog(
+    items: Iterable[Item],
+    batch_size: int = 100,
+    workers: int = 8,
+    force: bool = False
+) -> SyncResult:
+    """Syncs Stripe Products and Prices of items in concurrent batches."""
+
+    result: SyncResult = SyncResult()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        batch: list[Item]
+        for batch in batched(items, batch_size):
+            if force:
+                item: Item
+                for item in batch:
+                    item.stripe_product_fingerprint = ''
+
+            changed: list[Item] = []
+            for item, synced in zip(batch, executor.map(_sync_item, batch)):
+                if synced is None:
+                    result.failed.append(item.id)
+                elif synced:
+                    changed.append(item)
+
+            Item.objects.bulk_update(changed, Item.STRIPE_FIELDS)
+            result.checked += len(batch)
+            result.synced += len(changed)
+
+    return result
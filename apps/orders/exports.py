@@ -0,0 +1,164 @@
+# Python
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Optional,
+)
+import csv
+import datetime
+import json
+
+# Django
+from django.db.models import (
+    F,
+    QuerySet,
+)
+from django.utils.dateparse import (
+    parse_date,
+    parse_datetime,
+)
+from django.utils import timezone
+
+# Local
+from .models import (
+    Order,
+    OrderLine,
+)
+
+
+# One row per order line; orders without lines get one row of blanks.
+EXPORT_FIELDS = (
+    'order_id',
+    'created',
+    'status',
+    'order_total',
+    'line_id',
+    'item_id',
+    'item_name',
+    'currency',
+    'quantity',
+    'unit_amount',
+    'line_amount',
+)
+
+ORDER_VALUES = {
+    'order_id': F('id'),
+    'created': F('datetime_created'),
+    'order_total': F('total_amount'),
+}
+
+LINE_VALUES = {
+    'line_id': F('id'),
+    'item_name': F('item__name'),
+    'currency': F('item__currency'),
+    'line_amount': F('unit_amount') * F('quantity'),
+}
+
+
+def parse_moment(value: str) -> Optional[datetime.datetime]:
+    """Datetime of an ISO datetime or date string, None if invalid."""
+
+    try:
+        moment: Optional[datetime.datetime] = parse_datetime(value)
+        if moment is None and (day := parse_date(value)):
+            moment = datetime.datetime.combine(day, datetime.time())
+    except ValueError:
+        return None
+    if moment and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def get_export_orders(
+    status: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None
+) -> QuerySet[Order]:
+
+    orders: QuerySet[Order] = Order.objects.all()
+    if status:
+        orders = orders.filter(status=status)
+    if since:
+        orders = orders.filter(datetime_created__gte=since)
+    if until:
+        orders = orders.filter(datetime_created__lt=until)
+    return orders
+
+
+def iter_order_rows(
+    orders: QuerySet[Order],
+    chunk_size: int = 2000
+) -> Iterator[dict[str, Any]]:
+    """Export rows of orders, two queries per chunk of orders.
+
+    Orders are paged by id (keyset), and lines of a page come joined
+    with their items, so memory does not depend on the export size.
+    """
+
+    last_id: int = 0
+    while page := list(
+        orders.filter(
+            id__gt=last_id
+        ).order_by(
+            'id'
+        ).values(
+            'status',
+            **ORDER_VALUES
+        )[:chunk_size]
+    ):
+        last_id = page[-1]['order_id']
+        lines: Iterator[dict[str, Any]] = OrderLine.objects.filter(
+            order_id__in=[order['order_id'] for order in page]
+        ).order_by(
+            'order_id',
+            'id'
+        ).values(
+            'order_id',
+            'item_id',
+            'quantity',
+            'unit_amount',
+            **LINE_VALUES
+        ).iterator(chunk_size=chunk_size)
+
+        line: Optional[dict[str, Any]] = next(lines, None)
+        order: dict[str, Any]
+        for order in page:
+            if line is None or line['order_id'] != order['order_id']:
+                yield order
+                continue
+            while line is not None and line['order_id'] == order['order_id']:
+                yield {**order, **line}
+                line = next(lines, None)
+
+
+class Echo:
+    """File-like object returning what is written, for csv.writer."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def iter_csv(rows: Iterable[dict[str, Any]]) -> Iterator[str]:
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    row: dict[str, Any]
+    for row in rows:
+        yield writer.writerow([row.get(name, '') for name in EXPORT_FIELDS])
+
+
+def iter_jsonl(rows: Iterable[dict[str, Any]]) -> Iterator[str]:
+    row: dict[str, Any]
+    for row in rows:
+        yield json.dumps(
+            {name: row.get(name) for name in EXPORT_FIELDS},
+            default=str
+        ) + '\n'
+
+
+# Format -> row encoder and its content type.
+FORMATS: dict[str, tuple[Callable[[Iterable[dict]], Iterator[str]], str]] = {
+    'csv': (iter_csv, 'text/csv'),
+    'jsonl': (iter_jsonl, 'application/x-ndjson'),
+}
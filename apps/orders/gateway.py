@@ -0,0 +1,440 @@
+# Python
+from typing import (
+    Any,
+    Optional,
+)
+from collections import (
+    defaultdict,
+    deque,
+)
+from functools import (
+    lru_cache,
+    reduce,
+)
+from threading import Lock
+import hashlib
+import json
+import random
+import time
+
+# Django
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+# Stripe
+import stripe
+from stripe.stripe_object import StripeObject
+
+# Local
+from .http_client import PooledRequestsClient
+from .metrics import (
+    observe_stripe_call,
+    registry,
+)
+from .tracing import trace_stripe_call
+
+
+class StripeGateway:
+    """Interface of the Stripe API used by the shop.
+
+    Backends implement ``call`` for methods named like the library
+    ones, e.g. ``'TaxRate.create'``, and raise ``stripe.error``
+    exceptions on failure.
+    """
+
+    def call(
+        self,
+        method: str,
+        *args: Any,
+        **params: Any
+    ) -> StripeObject:
+        raise NotImplementedError
+
+    def create_tax_rate(self, **params: Any) -> StripeObject:
+        return self.call('TaxRate.create', **params)
+
+    def archive_tax_rate(self, id: str) -> StripeObject:
+        return self.call('TaxRate.modify', id, active=False)
+
+    def create_coupon(self, **params: Any) -> StripeObject:
+        return self.call('Coupon.create', **params)
+
+    def delete_coupon(self, id: str) -> StripeObject:
+        return self.call('Coupon.delete', id)
+
+    def create_product(self, **params: Any) -> StripeObject:
+        return self.call('Product.create', **params)
+
+    def modify_product(self, id: str, **params: Any) -> StripeObject:
+        return self.call('Product.modify', id, **params)
+
+    def create_price(self, **params: Any) -> StripeObject:
+        return self.call('Price.create', **params)
+
+    def archive_price(self, id: str) -> StripeObject:
+        return self.call('Price.modify', id, active=False)
+
+    def create_checkout_session(self, **params: Any) -> StripeObject:
+        return self.call('checkout.Session.create', **params)
+
+    def list_objects(self, resource: str, **params: Any) -> StripeObject:
+        """One page of ``resource`` objects, newest first.
+
+        Takes the list parameters of the API: ``limit``,
+        ``starting_after`` and ``created`` ranges.
+        """
+
+        return self.call(f'{resource}.list', **params)
+
+
+class StripeAPIGateway(StripeGateway):
+    """Gateway calling the real Stripe API through the library.
+
+    All calls share one pooled keep-alive client configured by
+    ``settings.STRIPE_HTTP_CLIENT``, so checkouts reuse open TLS
+    connections instead of handshaking per request.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        http_client: Optional[dict] = None
+    ) -> None:
+
+        self.api_key: str = api_key or settings.STRIPE_PRIVATE_KEY
+        options: dict = {
+            **settings.STRIPE_HTTP_CLIENT,
+            **(http_client or {}),
+        }
+        self.http_client: PooledRequestsClient = PooledRequestsClient(
+            **{key.lower(): value for key, value in options.items()}
+        )
+        stripe.default_http_client = self.http_client
+
+    def get_stats(self) -> dict[str, dict[str, int]]:
+        """Connection pool statistics by Stripe host."""
+
+        return self.http_client.get_stats()
+
+    @trace_stripe_call
+    @observe_stripe_call
+    def call(
+        self,
+        method: str,
+        *args: Any,
+        **params: Any
+    ) -> StripeObject:
+
+        function = reduce(getattr, method.split('.'), stripe)
+        return function(*args, api_key=self.api_key, **params)
+
+
+class FakeStripeGateway(StripeGateway):
+    """In-process Stripe with configurable latency and failures.
+
+    Objects live in memory and ids are sequential per prefix, so tests
+    and benchmarks run offline and deterministically.
+    """
+
+    PREFIXES = {
+        'TaxRate': 'txr',
+        'Coupon': 'co',
+        'Product': 'prod',
+        'Price': 'price',
+        'checkout.Session': 'cs',
+        'PaymentIntent': 'pi',
+    }
+    OBJECTS = {
+        'TaxRate': 'tax_rate',
+        'Coupon': 'coupon',
+        'Product': 'product',
+        'Price': 'price',
+        'checkout.Session': 'checkout.session',
+        'PaymentIntent': 'payment_intent',
+    }
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: Optional[int] = None
+    ) -> None:
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.failure_rate: float = failure_rate
+        self.objects: dict[str, dict[str, dict]] = defaultdict(dict)
+        self.calls: list[tuple[str, tuple, dict]] = []
+        self.in_flight: int = 0
+        self._idempotent: dict[str, tuple[tuple, dict]] = {}
+        self.max_in_flight: int = 0
+        self._counters: dict[str, int] = defaultdict(int)
+        self._random: random.Random = random.Random(seed)
+        self._lock: Lock = Lock()
+
+    @trace_stripe_call
+    @observe_stripe_call
+    def call(
+        self,
+        method: str,
+        *args: Any,
+        **params: Any
+    ) -> StripeObject:
+
+        resource, action = method.rsplit('.', 1)
+        with self._lock:
+            self.calls.append((method, args, dict(params)))
+            delay: float = self.latency + self._random.uniform(
+                0,
+                self.jitter
+            )
+            failed: bool = self._random.random() < self.failure_rate
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        try:
+            if delay:
+                time.sleep(delay)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        if failed:
+            raise stripe.error.APIConnectionError(
+                f'Fake Stripe failure on {method}'
+            )
+
+        idempotency_key: Optional[str] = params.pop('idempotency_key', None)
+        request: tuple = (method, args, params)
+        with self._lock:
+            if idempotency_key in self._idempotent:
+                replayed_request, data = self._idempotent[idempotency_key]
+                if replayed_request != request:
+                    raise stripe.error.IdempotencyError(
+                        'Keys for idempotent requests can only be used '
+                        'with the same parameters they were first used with'
+                    )
+            else:
+                data = getattr(self, f'_{action}')(
+                    resource,
+                    *args,
+                    **params
+                )
+                if idempotency_key:
+                    self._idempotent[idempotency_key] = (request, data)
+
+        return stripe.util.convert_to_stripe_object(data)
+
+    def _get(self, resource: str, id: str) -> dict:
+        try:
+            return self.objects[resource][id]
+        except KeyError:
+            raise stripe.error.InvalidRequestError(
+                f'No such {self.OBJECTS[resource]}: {id}',
+                'id'
+            )
+
+    def _create(self, resource: str, **params: Any) -> dict:
+        prefix: str = self.PREFIXES[resource]
+        self._counters[prefix] += 1
+        obj: dict = {
+            'id': f'{prefix}_{self._counters[prefix]}',
+            'object': self.OBJECTS[resource],
+            'created': int(time.time()),
+            'livemode': False,
+            'active': True,
+        }
+        if resource == 'checkout.Session':
+            obj.update({
+                'url': f'https://checkout.stripe.test/{obj["id"]}',
+                'status': 'open',
+                'payment_status': 'unpaid',
+                'expires_at': obj['created'] + 24 * 60 * 60,
+            })
+        obj.update(params)
+        self.objects[resource][obj['id']] = obj
+        return obj
+
+    def _modify(self, resource: str, id: str, **params: Any) -> dict:
+        obj: dict = self._get(resource, id)
+        obj.update(params)
+        return obj
+
+    def _retrieve(self, resource: str, id: str) -> dict:
+        return self._get(resource, id)
+
+    def _list(
+        self,
+        resource: str,
+        limit: int = 10,
+        starting_after: Optional[str] = None,
+        created: Optional[dict] = None
+    ) -> dict:
+
+        objects: list[dict] = sorted(
+            reversed(self.objects[resource].values()),
+            key=lambda obj: obj['created'],
+            reverse=True
+        )
+        if created:
+            objects = [
+                obj for obj in objects
+                if obj['created'] >= created.get('gte', obj['created'])
+                and obj['created'] < created.get('lt', obj['created'] + 1)
+            ]
+        if starting_after:
+            ids: list[str] = [obj['id'] for obj in objects]
+            objects = objects[ids.index(starting_after) + 1:]
+
+        return {
+            'object': 'list',
+            'data': objects[:limit],
+            'has_more': len(objects) > limit,
+        }
+
+    def _delete(self, resource: str, id: str) -> dict:
+        obj: dict = self._get(resource, id)
+        del self.objects[resource][id]
+        return {
+            'id': id,
+            'object': obj['object'],
+            'deleted': True,
+        }
+
+
+class RecordReplayGateway(StripeGateway):
+    """Records responses of another backend to a file or replays them.
+
+    Responses are keyed by method and parameters; repeated calls replay
+    recorded responses in order and then keep the last one.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: str = 'replay',
+        backend: str = 'orders.gateway.StripeAPIGateway',
+        options: Optional[dict] = None
+    ) -> None:
+        self.path: str = path
+        self.mode: str = mode
+        self._lock: Lock = Lock()
+        self._recorded: dict[str, deque] = defaultdict(deque)
+        if mode == 'record':
+            self.backend: StripeGateway = import_string(backend)(
+                **(options or {})
+            )
+        else:
+            self._load()
+
+    def _load(self) -> None:
+        with open(self.path) as file:
+            for line in file:
+                record: dict = json.loads(line)
+                self._recorded[record['key']].append(record['response'])
+
+    @staticmethod
+    def get_key(
+        method: str,
+        args: tuple,
+        params: dict
+    ) -> str:
+        """Key of a call; idempotency keys are left out as they rotate."""
+
+        params = {
+            key: value for key, value in params.items()
+            if key != 'idempotency_key'
+        }
+        return hashlib.sha256(
+            json.dumps(
+                [method, args, params],
+                sort_keys=True,
+                default=str
+            ).encode()
+        ).hexdigest()
+
+    def call(
+        self,
+        method: str,
+        *args: Any,
+        **params: Any
+    ) -> StripeObject:
+
+        key: str = self.get_key(method, args, params)
+        if self.mode == 'record':
+            response: StripeObject = self.backend.call(
+                method,
+                *args,
+                **params
+            )
+            with self._lock, open(self.path, 'a') as file:
+                file.write(json.dumps({
+                    'key': key,
+                    'method': method,
+                    'response': response.to_dict_recursive(),
+                }) + '\n')
+            return response
+
+        with self._lock:
+            responses: deque = self._recorded[key]
+            if not responses:
+                raise stripe.error.APIConnectionError(
+                    f'No recorded response for {method}'
+                )
+            data: dict = (
+                responses.popleft() if len(responses) > 1 else responses[0]
+            )
+
+        return stripe.util.convert_to_stripe_object(data)
+
+
+@lru_cache(maxsize=None)
+def get_gateway() -> StripeGateway:
+    """Gateway configured by ``settings.STRIPE_GATEWAY``."""
+
+    config: dict = settings.STRIPE_GATEWAY
+    return import_string(config['BACKEND'])(
+        **config.get('OPTIONS', {})
+    )
+
+
+@receiver(setting_changed)
+def reset_gateway(setting: str, **kwargs: Any) -> None:
+    if setting in ('STRIPE_GATEWAY', 'STRIPE_HTTP_CLIENT'):
+        get_gateway.cache_clear()
+
+
+CIRCUIT_STATES = {
+    'closed': 0,
+    'half_open': 1,
+    'open': 2,
+}
+
+STRIPE_CIRCUIT = registry.gauge(
+    'orders_stripe_circuit_state',
+    'Stripe circuit breaker state: 0 closed, 1 half open, 2 open.',
+)
+STRIPE_POOL = registry.gauge(
+    'orders_stripe_pool',
+    'Stripe HTTP pool connections, requests and idle sockets by host.',
+    ('host', 'kind'),
+)
+
+
+@registry.add_collector
+def collect_gateway_metrics() -> None:
+    """Breaker state and connection pool of the gateway in this process."""
+
+    gateway: StripeGateway = get_gateway()
+    breaker: Any = getattr(gateway, 'breaker', None)
+    if breaker is not None:
+        STRIPE_CIRCUIT.set(CIRCUIT_STATES[breaker.get_stats()['state']])
+
+    backend: StripeGateway = getattr(gateway, 'backend', gateway)
+    if isinstance(backend, StripeAPIGateway):
+        host: str
+        stats: dict[str, int]
+        for host, stats in backend.get_stats().items():
+            for kind in ('connections', 'requests', 'idle'):
+                STRIPE_POOL.set(stats[kind], host=host, kind=kind)
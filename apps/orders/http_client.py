@@ -0,0 +1,140 @@
+# Python
+from typing import (
+    Any,
+    Optional,
+    Union,
+)
+from contextvars import ContextVar
+import socket
+import time
+
+# Requests
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+# Stripe
+from stripe.http_client import RequestsClient
+
+
+# Monotonic time by which the current Stripe call has to finish.
+request_deadline: ContextVar[Optional[float]] = ContextVar(
+    'stripe_request_deadline',
+    default=None
+)
+
+
+def get_keepalive_options(idle: int) -> list[tuple[int, int, int]]:
+    """Socket options enabling TCP keep-alive probes after ``idle`` s."""
+
+    options: list[tuple[int, int, int]] = [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ]
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        options += [
+            (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle),
+            (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, idle),
+        ]
+    return options
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter with keep-alive sockets and per-pool statistics."""
+
+    __attrs__ = HTTPAdapter.__attrs__ + ['keepalive']
+
+    def __init__(
+        self,
+        keepalive: Optional[int] = None,
+        **kwargs: Any
+    ) -> None:
+        self.keepalive: Optional[int] = keepalive
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        if self.keepalive:
+            kwargs['socket_options'] = (
+                HTTPConnection.default_socket_options
+                + get_keepalive_options(self.keepalive)
+            )
+        super().init_poolmanager(*args, **kwargs)
+
+    def get_stats(self) -> dict[str, dict[str, int]]:
+        """Connections opened, requests sent and idle sockets by host."""
+
+        stats: dict[str, dict[str, int]] = {}
+        for key in self.poolmanager.pools.keys():
+            pool = self.poolmanager.pools[key]
+            stats[f'{key.key_scheme}://{key.key_host}:{key.key_port}'] = {
+                'connections': pool.num_connections,
+                'requests': pool.num_requests,
+                'idle': sum(
+                    connection is not None
+                    for connection in list(pool.pool.queue)
+                ),
+                'maxsize': pool.pool.maxsize,
+            }
+        return stats
+
+
+class PooledRequestsClient(RequestsClient):
+    """Stripe HTTP client sharing one pooled session across threads.
+
+    The stock client opens a session per thread, so every worker pays
+    its own TLS handshakes; here urllib3 pools are shared and bounded.
+    """
+
+    name = 'requests-pooled'
+
+    def __init__(
+        self,
+        pool_connections: int = 4,
+        pool_maxsize: int = 16,
+        pool_block: bool = False,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        keepalive: Optional[int] = 60,
+        **kwargs: Any
+    ) -> None:
+
+        self.adapter: PooledHTTPAdapter = PooledHTTPAdapter(
+            keepalive=keepalive,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block
+        )
+        session: requests.Session = requests.Session()
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        super().__init__(
+            timeout=(connect_timeout, read_timeout),
+            session=session,
+            **kwargs
+        )
+
+    @property
+    def _timeout(self) -> Union[float, tuple[float, float]]:
+        """Socket timeouts, cut down to what is left of the deadline."""
+
+        deadline: Optional[float] = request_deadline.get()
+        if deadline is None:
+            return self.timeout
+
+        remaining: float = max(0.001, deadline - time.monotonic())
+        connect_timeout: float
+        read_timeout: float
+        connect_timeout, read_timeout = self.timeout
+        return (
+            min(connect_timeout, remaining),
+            min(read_timeout, remaining),
+        )
+
+    @_timeout.setter
+    def _timeout(self, timeout: tuple[float, float]) -> None:
+        self.timeout: tuple[float, float] = timeout
+
+    def get_stats(self) -> dict[str, dict[str, int]]:
+        return self.adapter.get_stats()
+
+    def close(self) -> None:
+        self._session.close()
@@ -0,0 +1,487 @@
+# Python
+from typing import (
+    Any,
+    Callable,
+    IO,
+    Iterable,
+    Iterator,
+    Optional,
+)
+from dataclasses import (
+    dataclass,
+    field,
+)
+import csv
+import datetime
+import json
+import logging
+import time
+
+# Django
+from django.core.exceptions import ValidationError
+from django.db import (
+    models,
+    transaction,
+)
+from django.db.models import (
+    OuterRef,
+    QuerySet,
+    Subquery,
+)
+from django.utils import timezone
+
+# Local
+from .caches import (
+    tax_rates_cache,
+    invalidate_version,
+)
+from .catalog import batched
+from .models import (
+    Discount,
+    DiscountItem,
+    Item,
+    Tax,
+)
+from .scheduler import refresh_effective_prices
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Numbered input row: line number and raw values.
+Row = tuple[int, dict[str, Any]]
+
+
+@dataclass
+class ImportResult:
+    """Counters of one catalog import run."""
+
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    failed: list[tuple[int, str]] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        """Rows per second."""
+
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def read_rows(stream: IO[str], format: str) -> Iterator[Row]:
+    """Lazily reads numbered rows of a CSV or JSON Lines stream."""
+
+    if format == 'csv':
+        reader: csv.DictReader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    number: int
+    line: str
+    for number, line in enumerate(stream, start=1):
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, {}
+
+
+def parse_ids(value: Any) -> list[int]:
+    """Ids from a JSON list or a CSV cell like ``'1;2;3'``."""
+
+    if isinstance(value, str):
+        value = [v for v in value.replace(',', ';').split(';') if v.strip()]
+    return [int(v) for v in value]
+
+
+@dataclass
+class Link:
+    """M2M column of an import: through model and its two FK columns."""
+
+    through: type[models.Model]
+    own: str
+    other: str
+    model: type[models.Model]
+
+
+class CatalogImporter:
+    """Upserts rows of one model with a few queries per batch.
+
+    Rows with an ``id`` update that object, other rows create new ones.
+    A batch is validated column by column, written with ``bulk_create``
+    and ``bulk_update`` in one transaction, and its M2M links are
+    replaced by diffing them against the stored ones. Invalid rows are
+    reported and skipped, the rest of their batch is still written.
+
+    Bulk writes skip ``save()``, so Stripe objects are not synced here;
+    checkout syncs them lazily, or run ``sync_stripe_catalog``.
+    """
+
+    model: type[models.Model]
+    fields: tuple[str, ...] = ()
+    links: dict[str, Link] = {}
+    cache_name: str = ''
+
+    def __init__(
+        self,
+        batch_size: int = 1000,
+        progress: Optional[Callable[[ImportResult], None]] = None
+    ) -> None:
+
+        self.batch_size: int = batch_size
+        self.progress: Optional[Callable[[ImportResult], None]] = progress
+
+    def validate_columns(
+        self,
+        columns: dict[str, list],
+        valid: list[int]
+    ) -> dict[int, str]:
+        """Checks spanning several fields, by row index; none by default."""
+
+        return {}
+
+    def clean(
+        self,
+        rows: list[Row]
+    ) -> tuple[list[dict[str, Any]], dict[int, str]]:
+        """Cleaned values of rows and errors by row index."""
+
+        errors: dict[int, str] = {}
+        values: list[dict[str, Any]] = [{} for _ in rows]
+        columns: dict[str, list] = {}
+
+        name: str
+        for name in self.fields:
+            model_field: models.Field = self.model._meta.get_field(name)
+            default: Any = (
+                model_field.get_default() if model_field.has_default()
+                else None
+            )
+            column: list = []
+            i: int
+            for i, (_, raw) in enumerate(rows):
+                value: Any = raw.get(name)
+                if value is None or (
+                    value == '' and model_field.has_default()
+                ):
+                    value = default
+                if i not in errors:
+                    try:
+                        value = model_field.clean(value, None)
+                    except ValidationError as e:
+                        errors[i] = f'{name}: {"; ".join(e.messages)}'
+                column.append(value)
+                values[i][name] = value
+            columns[name] = column
+
+        errors.update(self.validate_columns(
+            columns,
+            [i for i in range(len(rows)) if i not in errors]
+        ))
+
+        for i, (_, raw) in enumerate(rows):
+            if i in errors:
+                continue
+            try:
+                pk: Any = raw.get('id')
+                values[i]['id'] = int(pk) if pk not in (None, '') else None
+            except (TypeError, ValueError):
+                errors[i] = f'id: {pk!r} is not an integer'
+                continue
+            for name in self.links:
+                if raw.get(name) is None:
+                    continue
+                try:
+                    values[i][name] = parse_ids(raw[name])
+                except (TypeError, ValueError):
+                    errors[i] = f'{name}: {raw[name]!r} is not a list of ids'
+                    break
+
+        return values, errors
+
+    def check_references(
+        self,
+        values: list[dict[str, Any]],
+        errors: dict[int, str]
+    ) -> None:
+        """Rejects rows updating missing objects or linking to them."""
+
+        rows: list[int] = [i for i in range(len(values)) if i not in errors]
+        existing: set[int] = set(self.model.objects.filter(
+            id__in={values[i]['id'] for i in rows if values[i]['id']}
+        ).values_list('id', flat=True))
+
+        seen: dict[int, int] = {}
+        for i in rows:
+            pk: Optional[int] = values[i]['id']
+            if pk is None:
+                continue
+            if pk not in existing:
+                errors[i] = f'id: {self.model.__name__} {pk} does not exist'
+            elif pk in seen:
+                errors[seen[pk]] = f'id: {pk} is repeated later in the batch'
+            seen[pk] = i
+
+        name: str
+        link: Link
+        for name, link in self.links.items():
+            known: set[int] = set(link.model.objects.filter(
+                id__in={
+                    pk for i in rows if i not in errors
+                    for pk in values[i].get(name, ())
+                }
+            ).values_list('id', flat=True))
+            for i in rows:
+                missing: set[int] = set(values[i].get(name, ())) - known
+                if i not in errors and missing:
+                    errors[i] = f'{name}: unknown ids {sorted(missing)}'
+
+    def get_object(self, values: dict[str, Any]) -> models.Model:
+        return self.model(
+            id=values['id'],
+            **{name: values[name] for name in self.fields}
+        )
+
+    def write_links(
+        self,
+        link: Link,
+        wanted: dict[int, list[int]]
+    ) -> set[tuple[int, int]]:
+        """Replaces links of objects, returns added and removed pairs."""
+
+        stored: dict[tuple[int, int], int] = {
+            (own, other): pk
+            for pk, own, other in link.through.objects.filter(**{
+                f'{link.own}__in': wanted
+            }).values_list('id', link.own, link.other)
+        }
+        pairs: set[tuple[int, int]] = {
+            (own, other) for own, others in wanted.items() for other in others
+        }
+        removed: list[int] = [
+            pk for pair, pk in stored.items() if pair not in pairs
+        ]
+        added: list[tuple[int, int]] = [
+            pair for pair in pairs if pair not in stored
+        ]
+
+        if removed:
+            link.through.objects.filter(id__in=removed).delete()
+        link.through.objects.bulk_create(
+            [
+                link.through(**{link.own: own, link.other: other})
+                for own, other in added
+            ],
+            ignore_conflicts=True
+        )
+        return set(added) | (set(stored) - pairs)
+
+    def after_write(
+        self,
+        objects: list[models.Model],
+        changed_links: dict[str, set[tuple[int, int]]]
+    ) -> None:
+        """Refreshes state derived from written rows, in their transaction."""
+
+        invalidate_version(self.cache_name)
+
+    def write(
+        self,
+        values: list[dict[str, Any]],
+        result: ImportResult
+    ) -> None:
+        now: datetime.datetime = timezone.now()
+        objects: list[models.Model] = [self.get_object(v) for v in values]
+        created: list[models.Model] = [o for o in objects if o.id is None]
+        updated: list[models.Model] = [o for o in objects if o.id]
+        obj: models.Model
+        for obj in updated:
+            obj.updated_at = now
+
+        with transaction.atomic():
+            self.model.objects.bulk_create(created)
+            self.model.objects.bulk_update(
+                updated,
+                self.fields + ('updated_at',)
+            )
+
+            changed_links: dict[str, set[tuple[int, int]]] = {}
+            name: str
+            link: Link
+            for name, link in self.links.items():
+                wanted: dict[int, list[int]] = {
+                    obj.id: row_values[name]
+                    for obj, row_values in zip(objects, values)
+                    if name in row_values
+                }
+                if wanted:
+                    changed_links[name] = self.write_links(link, wanted)
+
+            self.after_write(objects, changed_links)
+
+        result.created += len(created)
+        result.updated += len(updated)
+
+    def run(self, rows: Iterable[Row]) -> ImportResult:
+        result: ImportResult = ImportResult()
+        start: float = time.monotonic()
+
+        batch: list[Row]
+        for batch in batched(rows, self.batch_size):
+            values: list[dict[str, Any]]
+            errors: dict[int, str]
+            values, errors = self.clean(batch)
+            self.check_references(values, errors)
+            self.write(
+                [v for i, v in enumerate(values) if i not in errors],
+                result
+            )
+
+            result.rows += len(batch)
+            result.failed += [
+                (batch[i][0], error) for i, error in sorted(errors.items())
+            ]
+            result.seconds = time.monotonic() - start
+            if self.progress:
+                self.progress(result)
+
+        logger.info(
+            'Imported %s %s rows: %s created, %s updated, %s failed, %.1fs',
+            result.rows,
+            self.model.__name__,
+            result.created,
+            result.updated,
+            len(result.failed),
+            result.seconds
+        )
+        return result
+
+
+def fill_discount_endings(links: QuerySet[DiscountItem]) -> None:
+    """Copies ending time of discounts to their links."""
+
+    links.update(
+        datetime_ending=Subquery(
+            Discount.objects.filter(
+                id=OuterRef('discount_id')
+            ).values(
+                'datetime_ending'
+            )[:1]
+        )
+    )
+
+
+class ItemImporter(CatalogImporter):
+    model = Item
+    fields = (
+        'name',
+        'description',
+        'price',
+        'currency',
+    )
+    links = {
+        'taxes': Link(Tax.item.through, 'item_id', 'tax_id', Tax),
+        'discounts': Link(DiscountItem, 'item_id', 'discount_id', Discount),
+    }
+    cache_name = 'item'
+
+    def validate_columns(
+        self,
+        columns: dict[str, list],
+        valid: list[int]
+    ) -> dict[int, str]:
+
+        prices: list = columns['price']
+        return {
+            i: f'price: must be above {Item.MIN_PRICE} '
+               f'and below {Item.MAX_PRICE}'
+            for i in valid
+            if not Item.MIN_PRICE < prices[i] < Item.MAX_PRICE
+        }
+
+    def get_object(self, values: dict[str, Any]) -> Item:
+        item: Item = super().get_object(values)
+        if item.id is None:
+            item.effective_price = item.price
+        return item
+
+    def after_write(
+        self,
+        objects: list[Item],
+        changed_links: dict[str, set[tuple[int, int]]]
+    ) -> None:
+
+        super().after_write(objects, changed_links)
+        if changed_links.get('taxes'):
+            tax_rates_cache.clear()
+            invalidate_version('tax')
+        if changed_links.get('discounts'):
+            fill_discount_endings(DiscountItem.objects.filter(
+                datetime_ending__isnull=True
+            ))
+            invalidate_version('discount')
+        refresh_effective_prices(
+            item.id for item in objects
+        )
+
+
+class TaxImporter(CatalogImporter):
+    model = Tax
+    fields = (
+        'display_name',
+        'inclusive',
+        'percentage',
+        'country',
+        'description',
+    )
+    links = {
+        'items': Link(Tax.item.through, 'tax_id', 'item_id', Item),
+    }
+    cache_name = 'tax'
+
+    def after_write(
+        self,
+        objects: list[Tax],
+        changed_links: dict[str, set[tuple[int, int]]]
+    ) -> None:
+
+        super().after_write(objects, changed_links)
+        tax_rates_cache.clear()
+
+
+class DiscountImporter(CatalogImporter):
+    model = Discount
+    fields = (
+        'persent',
+        'datetime_ending',
+    )
+    links = {
+        'items': Link(DiscountItem, 'discount_id', 'item_id', Item),
+    }
+    cache_name = 'discount'
+
+    def after_write(
+        self,
+        objects: list[Discount],
+        changed_links: dict[str, set[tuple[int, int]]]
+    ) -> None:
+
+        super().after_write(objects, changed_links)
+        discount_ids: list[int] = [discount.id for discount in objects]
+        fill_discount_endings(DiscountItem.objects.filter(
+            discount_id__in=discount_ids
+        ))
+        refresh_effective_prices(
+            {item_id for _, item_id in changed_links.get('items', ())}
+            | set(DiscountItem.objects.filter(
+                discount_id__in=discount_ids
+            ).values_list('item_id', flat=True))
+        )
+
+
+IMPORTERS: dict[str, type[CatalogImporter]] = {
+    'item': ItemImporter,
+    'tax': TaxImporter,
+    'discount': DiscountImporter,
+}
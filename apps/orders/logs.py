@@ -0,0 +1,127 @@
+# Python
+from typing import (
+    IO,
+    Any,
+    Optional,
+)
+from contextvars import ContextVar
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+)
+import atexit
+import copy
+import datetime
+import json
+import logging
+import queue
+import sys
+
+
+# Id of the request being handled, copied into sync_to_async threads.
+request_id: ContextVar[str] = ContextVar('request_id', default='-')
+
+# Attributes every LogRecord has; the rest came from ``extra``.
+RECORD_ATTRS = frozenset(
+    logging.LogRecord('', 0, '', 0, '', (), None).__dict__
+) | {'message', 'asctime', 'request_id', 'request'}
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the id of the current request.
+
+    Records logged with a ``request``, as Django does after the
+    response, take the id stored on it.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = getattr(
+            getattr(record, 'request', None),
+            'request_id',
+            None
+        ) or request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with ``extra`` fields kept."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: dict[str, Any] = {
+            'time': datetime.datetime.fromtimestamp(
+                record.created,
+                tz=datetime.timezone.utc
+            ).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+        }
+        data.update(
+            (key, value) for key, value in record.__dict__.items()
+            if key not in RECORD_ATTRS
+        )
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class BackgroundHandler(QueueHandler):
+    """Queues records for a listener thread that formats and writes them.
+
+    Logging costs the caller a queue put; when the queue is full the
+    record is dropped and counted rather than blocking the request.
+    """
+
+    def __init__(
+        self,
+        stream: Optional[IO[str]] = None,
+        maxsize: int = 10000
+    ) -> None:
+
+        super().__init__(queue.Queue(maxsize))
+        self.dropped: int = 0
+        self.target: logging.StreamHandler = logging.StreamHandler(
+            stream or sys.stderr
+        )
+        self.listener: QueueListener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        self.running: bool = True
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt: Optional[logging.Formatter]) -> None:
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Copy of the record with its message and traceback frozen."""
+
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info
+            )
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self) -> None:
+        """Waits until queued records are written."""
+
+        if self.running:
+            self.queue.join()
+
+    def close(self) -> None:
+        if self.running:
+            self.running = False
+            self.listener.stop()
+        self.target.close()
+        super().close()
@@ -0,0 +1,112 @@
+# Python
+from datetime import datetime
+from typing import (
+    IO,
+    Any,
+    Iterator,
+    Optional,
+)
+import sys
+
+# Django
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+    CommandParser,
+)
+from django.db.models import QuerySet
+
+# Local
+from orders.exports import (
+    FORMATS,
+    get_export_orders,
+    iter_order_rows,
+    parse_moment,
+)
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    """Custom command for exporting orders."""
+
+    help = (
+        'Writes one row per order line, with order status and totals, '
+        'as CSV or JSON Lines to a file or stdout.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--format',
+            choices=tuple(FORMATS),
+            default='csv'
+        )
+        parser.add_argument(
+            '--output',
+            default='-',
+            help='File to write, "-" for stdout.'
+        )
+        parser.add_argument(
+            '--status',
+            choices=[status for status, _ in Order.STATUSES]
+        )
+        parser.add_argument(
+            '--since',
+            help='Orders created at or after this date or datetime.'
+        )
+        parser.add_argument(
+            '--until',
+            help='Orders created before this date or datetime.'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Orders fetched per query.'
+        )
+
+    def get_moment(self, value: Optional[str]) -> Optional[datetime]:
+        if not value:
+            return None
+        moment: Optional[datetime] = parse_moment(value)
+        if moment is None:
+            raise CommandError(f'Invalid date: {value}')
+        return moment
+
+    def count(self, rows: Iterator[dict]) -> Iterator[dict]:
+        row: dict
+        for row in rows:
+            self.rows += 1
+            yield row
+
+    def handle(self, *args: Any, **kwargs: Any) -> None:
+        """Handles orders export."""
+
+        start: datetime = datetime.now()
+        orders: QuerySet[Order] = get_export_orders(
+            status=kwargs['status'],
+            since=self.get_moment(kwargs['since']),
+            until=self.get_moment(kwargs['until'])
+        )
+        output: IO[str] = sys.stdout if kwargs['output'] == '-' else open(
+            kwargs['output'],
+            'w',
+            newline='',
+            encoding='utf-8'
+        )
+        self.rows: int = 0
+        try:
+            chunk: str
+            for chunk in FORMATS[kwargs['format']][0](self.count(
+                iter_order_rows(orders, chunk_size=kwargs['chunk_size'])
+            )):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        # Keep stdout clean for the exported data.
+        seconds: float = (datetime.now() - start).total_seconds()
+        self.stderr.write(
+            f'Exported: {self.rows} rows in {seconds} seconds '
+            f'({self.rows / (seconds or 1):.0f} rows/s)'
+        )
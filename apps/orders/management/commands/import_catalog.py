@@ -0,0 +1,99 @@
+# Python
+from typing import (
+    IO,
+    Any,
+)
+import sys
+
+# Django
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+    CommandParser,
+)
+
+# Local
+from orders.importer import (
+    IMPORTERS,
+    ImportResult,
+    read_rows,
+)
+
+
+class Command(BaseCommand):
+    """Custom command for bulk importing the catalog."""
+
+    help = (
+        'Imports items, taxes or discounts from CSV or JSON Lines, '
+        'a file or stdin. Rows with an id update that object, others '
+        'create one. Link columns (taxes, discounts, items) hold ids '
+        'separated by ";" in CSV or a list in JSON and replace the '
+        'stored links. Stripe objects are synced at checkout or by '
+        'sync_stripe_catalog.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            'model',
+            choices=tuple(IMPORTERS)
+        )
+        parser.add_argument(
+            'path',
+            help='File to import, "-" for stdin.'
+        )
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'jsonl'),
+            help='Input format, by default from the file extension.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows validated and written per transaction.'
+        )
+
+    def report(self, result: ImportResult) -> None:
+        self.stderr.write(
+            f'{result.rows} rows, {result.rate:.0f} rows/s',
+            ending='\r'
+        )
+
+    def handle(self, *args: Any, **kwargs: Any) -> None:
+        """Handles catalog import."""
+
+        path: str = kwargs['path']
+        format: str = kwargs['format'] or (
+            'csv' if path.endswith('.csv') else 'jsonl'
+        )
+        try:
+            stream: IO[str] = sys.stdin if path == '-' else open(
+                path,
+                newline='',
+                encoding='utf-8'
+            )
+        except OSError as e:
+            raise CommandError(e)
+
+        try:
+            result: ImportResult = IMPORTERS[kwargs['model']](
+                batch_size=kwargs['batch_size'],
+                progress=self.report
+            ).run(read_rows(stream, format))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stderr.write('')
+        print(
+            f'Imported: {result.rows}, created: {result.created}, '
+            f'updated: {result.updated}, failed: {len(result.failed)}'
+        )
+        line: int
+        error: str
+        for line, error in result.failed:
+            print(f'Line {line}: {error}')
+        print(
+            f'Imported in: {result.seconds} seconds '
+            f'({result.rate:.0f} rows/s)'
+        )
@@ -0,0 +1,57 @@
+# Python
+from datetime import datetime
+from typing import Any
+import time
+
+# Django
+from django.core.management.base import (
+    BaseCommand,
+    CommandParser,
+)
+
+# Local
+from orders.webhooks import process_queue
+
+
+class Command(BaseCommand):
+    """Custom command for processing Stripe webhook events."""
+
+    help = 'Drains queued Stripe webhook events into payments and orders.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the queue once and exit.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Events processed per transaction.'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1,
+            help='Sleep between polls of an empty queue, in seconds.'
+        )
+
+    def handle(self, *args: Any, **kwargs: Any) -> None:
+        """Handles queue processing."""
+
+        if kwargs['once']:
+            start: datetime = datetime.now()
+            processed: int = process_queue(kwargs['batch_size'])
+            print(
+                f'Processed: {processed} in '
+                f'{(datetime.now()-start).total_seconds()} seconds'
+            )
+            return
+
+        try:
+            while True:
+                if not process_queue(kwargs['batch_size']):
+                    time.sleep(kwargs['interval'])
+        except KeyboardInterrupt:
+            pass
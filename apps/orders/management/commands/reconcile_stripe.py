@@ -0,0 +1,91 @@
+# Python
+from datetime import datetime
+from typing import Any
+import time
+
+# Django
+from django.core.management.base import (
+    BaseCommand,
+    CommandParser,
+)
+
+# Local
+from orders.models import ReconcileCursor
+from orders.reconcile import (
+    RESOURCES,
+    Reconciler,
+    ReconcileResult,
+)
+
+
+class Command(BaseCommand):
+    """Custom command for reconciling local state with Stripe."""
+
+    help = (
+        'Pages through Stripe checkout sessions, payment intents and '
+        'coupons and fixes payments, orders and discounts. Resumes an '
+        'interrupted run from its stored cursors.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--resource',
+            choices=tuple(RESOURCES),
+            action='append',
+            help='Resource to reconcile, all by default.'
+        )
+        parser.add_argument(
+            '--days',
+            type=float,
+            default=30,
+            help='Reconcile objects created in the last days.'
+        )
+        parser.add_argument(
+            '--partitions',
+            type=int,
+            default=16,
+            help='Time windows paged concurrently.'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Pages fetched at once.'
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=100,
+            help='Objects per page, at most 100.'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Forget stored cursors and start over.'
+        )
+
+    def handle(self, *args: Any, **kwargs: Any) -> None:
+        """Handles reconciliation."""
+
+        resources: list[str] = kwargs['resource'] or list(RESOURCES)
+        if kwargs['restart']:
+            ReconcileCursor.objects.filter(resource__in=resources).delete()
+
+        until: int = int(time.time()) + 1
+        resource: str
+        for resource in resources:
+            start: datetime = datetime.now()
+            result: ReconcileResult = Reconciler(
+                resource,
+                since=until - int(kwargs['days'] * 24 * 60 * 60),
+                until=until,
+                partitions=kwargs['partitions'],
+                page_size=kwargs['page_size'],
+                workers=kwargs['workers']
+            ).run()
+            seconds: float = (datetime.now() - start).total_seconds()
+            print(
+                f'{resource}: checked {result.checked} in {result.pages} '
+                f'pages, fixed {result.fixed} in {seconds} seconds '
+                f'({result.checked / (seconds or 1):.0f}/s)'
+            )
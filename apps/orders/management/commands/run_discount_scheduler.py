@@ -0,0 +1,51 @@
+# Python
+from datetime import datetime
+from typing import Any
+
+# Django
+from django.core.management.base import (
+    BaseCommand,
+    CommandParser,
+)
+
+# Local
+from orders.scheduler import DiscountScheduler
+
+
+class Command(BaseCommand):
+    """Custom command for expiring discounts."""
+
+    help = 'Keeps effective item prices in sync with discount endings.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Refresh every item once and exit.'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=60,
+            help='Longest sleep between runs, in seconds.'
+        )
+
+    def handle(self, *args: Any, **kwargs: Any) -> None:
+        """Handles scheduler run."""
+
+        scheduler: DiscountScheduler = DiscountScheduler(
+            poll_interval=kwargs['interval']
+        )
+        if kwargs['once']:
+            start: datetime = datetime.now()
+            changed: int = scheduler.run_once()
+            print(
+                f'Updated: {changed} in '
+                f'{(datetime.now()-start).total_seconds()} seconds'
+            )
+            return
+
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            scheduler.stop()
@@ -0,0 +1,61 @@
+# Python
+from datetime import datetime
+from typing import Any
+
+# Django
+from django.core.management.base import (
+    BaseCommand,
+    CommandParser,
+)
+
+# Local
+from orders.catalog import (
+    SyncResult,
+    sync_catalog,
+)
+from orders.models import Item
+
+
+class Command(BaseCommand):
+    """Custom command for syncing items with Stripe."""
+
+    help = 'Creates or updates Stripe Product and Price for every item.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Push product data even if it looks up to date.'
+        )
+
+    def handle(self, *args: Any, **kwargs: Any) -> None:
+        """Handles catalog sync."""
+
+        start: datetime = datetime.now()
+        result: SyncResult = sync_catalog(
+            Item.objects.order_by('id').iterator(
+                chunk_size=kwargs['batch_size']
+            ),
+            batch_size=kwargs['batch_size'],
+            workers=kwargs['workers'],
+            force=kwargs['force']
+        )
+        print(
+            f'Checked: {result.checked}, synced: {result.synced}, '
+            f'failed: {len(result.failed)}'
+        )
+        if result.failed:
+            print(f'Failed item ids: {result.failed}')
+        print(
+            f'Synced in: {(datetime.now()-start).total_seconds()} seconds'
+        )
@@ -0,0 +1,436 @@
+# Python
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Optional,
+)
+from contextvars import ContextVar
+from functools import wraps
+from threading import (
+    Lock,
+    Thread,
+)
+import atexit
+import bisect
+import json
+import os
+import tempfile
+import time
+
+# Django
+from django.conf import settings
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+# Label values of one series, in the order of the metric's label names.
+Labels = tuple[str, ...]
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+QUERY_BUCKETS = (
+    0, 1, 2, 5, 10, 20, 50, 100,
+)
+
+
+class Metric:
+    """Series of one metric by label values, kept in this process.
+
+    Updates take a per-metric lock for a dict lookup and an addition,
+    which costs far less than the request they describe.
+    """
+
+    type: str = ''
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = ()
+    ) -> None:
+
+        self.name: str = name
+        self.help: str = help
+        self.labelnames: tuple[str, ...] = labelnames
+        self._series: dict[Labels, Any] = {}
+        self._lock: Lock = Lock()
+
+    def get_labels(self, labels: dict[str, Any]) -> Labels:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self) -> dict[Labels, Any]:
+        with self._lock:
+            return {
+                labels: list(value) if isinstance(value, list) else value
+                for labels, value in self._series.items()
+            }
+
+    def merge(self, value: Any, other: Any) -> Any:
+        return value + other
+
+    def format_labels(
+        self,
+        labels: Labels,
+        **extra: str
+    ) -> str:
+
+        pairs: list[tuple[str, str]] = [
+            *zip(self.labelnames, labels),
+            *extra.items(),
+        ]
+        if not pairs:
+            return ''
+        return '{%s}' % ','.join(
+            '{}="{}"'.format(
+                name,
+                value.replace('\\', '\\\\').replace('"', '\\"')
+            ) for name, value in pairs
+        )
+
+    def expose(self, series: dict[Labels, Any]) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key: Labels = self.get_labels(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def expose(self, series: dict[Labels, float]) -> list[str]:
+        return [
+            f'{self.name}{self.format_labels(labels)} {value}'
+            for labels, value in sorted(series.items())
+        ]
+
+
+class Histogram(Metric):
+    """Counts of observations per bucket, with their sum and count.
+
+    A series is a list of per-bucket counts followed by the sum; the
+    cumulative ``le`` buckets are built on exposition.
+    """
+
+    type = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ) -> None:
+
+        super().__init__(name, help, labelnames)
+        self.buckets: tuple[float, ...] = buckets
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key: Labels = self.get_labels(labels)
+        index: int = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series: Optional[list] = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def merge(self, value: list, other: list) -> list:
+        return [a + b for a, b in zip(value, other)]
+
+    def expose(self, series: dict[Labels, list]) -> list[str]:
+        lines: list[str] = []
+        labels: Labels
+        counts: list
+        for labels, counts in sorted(series.items()):
+            total: int = 0
+            bound: str
+            for bound, count in zip(
+                [*(str(b) for b in self.buckets), '+Inf'],
+                counts
+            ):
+                total += count
+                lines.append(
+                    f'{self.name}_bucket'
+                    f'{self.format_labels(labels, le=bound)} {total}'
+                )
+            lines.append(
+                f'{self.name}_sum{self.format_labels(labels)} {counts[-1]}'
+            )
+            lines.append(
+                f'{self.name}_count{self.format_labels(labels)} {total}'
+            )
+        return lines
+
+
+class Gauge(Metric):
+    """Value read at scrape time, from this process only."""
+
+    type = 'gauge'
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._series[self.get_labels(labels)] = value
+
+    def expose(self, series: dict[Labels, float]) -> list[str]:
+        return [
+            f'{self.name}{self.format_labels(labels)} {value}'
+            for labels, value in sorted(series.items())
+        ]
+
+
+class Registry:
+    """Metrics of this process, merged with the other workers on scrape.
+
+    With ``settings.METRICS['DIRECTORY']`` set, every process writes a
+    snapshot of its counters and histograms there from a background
+    thread, and a scrape adds up the snapshots of all processes. Gauges
+    are filled by collectors of the scraping process.
+    """
+
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+        self.collectors: list[Callable[[], None]] = []
+        self._flusher: Optional[Thread] = None
+        self._lock: Lock = Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, *args: Any, **kwargs: Any) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args: Any, **kwargs: Any) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def gauge(self, *args: Any, **kwargs: Any) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def add_collector(
+        self,
+        collector: Callable[[], None]
+    ) -> Callable[[], None]:
+        """Registers a function setting gauges before every scrape."""
+
+        self.collectors.append(collector)
+        return collector
+
+    @property
+    def directory(self) -> str:
+        return settings.METRICS['DIRECTORY']
+
+    def snapshot(self) -> dict[str, dict[Labels, Any]]:
+        return {
+            name: metric.snapshot()
+            for name, metric in self.metrics.items()
+            if not isinstance(metric, Gauge)
+        }
+
+    def flush(self) -> None:
+        """Writes the snapshot of this process for the others to read."""
+
+        if not self.directory:
+            return
+
+        data: dict[str, list] = {
+            name: [[list(labels), value] for labels, value in series.items()]
+            for name, series in self.snapshot().items()
+        }
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            json.dump(data, file)
+        os.replace(path, os.path.join(
+            self.directory,
+            f'metrics-{os.getpid()}.json'
+        ))
+
+    def run_flusher(self) -> None:
+        while True:
+            time.sleep(settings.METRICS['FLUSH_INTERVAL'])
+            self.flush()
+
+    def start_flusher(self) -> None:
+        """Starts flushing snapshots in the background, once per process."""
+
+        if not self.directory or self._flusher is not None:
+            return
+
+        with self._lock:
+            if self._flusher is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._flusher = Thread(
+                    target=self.run_flusher,
+                    name='metrics-flusher',
+                    daemon=True
+                )
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def read_snapshots(self) -> Iterable[dict[str, list]]:
+        """Snapshots flushed by the other processes."""
+
+        own: str = f'metrics-{os.getpid()}.json'
+        name: str
+        for name in os.listdir(self.directory):
+            if name.startswith('metrics-') and name.endswith('.json') and (
+                name != own
+            ):
+                try:
+                    with open(os.path.join(self.directory, name)) as file:
+                        yield json.load(file)
+                except (OSError, ValueError):
+                    continue
+
+    def collect(self) -> dict[str, dict[Labels, Any]]:
+        collector: Callable[[], None]
+        for collector in self.collectors:
+            collector()
+
+        merged: dict[str, dict[Labels, Any]] = self.snapshot()
+        if self.directory and os.path.isdir(self.directory):
+            data: dict[str, list]
+            for data in self.read_snapshots():
+                for name, series in data.items():
+                    metric: Optional[Metric] = self.metrics.get(name)
+                    if metric is None:
+                        continue
+                    target: dict[Labels, Any] = merged.setdefault(name, {})
+                    for labels, value in series:
+                        labels = tuple(labels)
+                        target[labels] = (
+                            metric.merge(target[labels], value)
+                            if labels in target else value
+                        )
+
+        for name, metric in self.metrics.items():
+            if isinstance(metric, Gauge):
+                merged[name] = metric.snapshot()
+        return merged
+
+    def expose(self) -> str:
+        """Metrics of all processes in the Prometheus text format."""
+
+        lines: list[str] = []
+        name: str
+        series: dict[Labels, Any]
+        for name, series in self.collect().items():
+            metric: Metric = self.metrics[name]
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            lines += metric.expose(series)
+        return '\n'.join(lines) + '\n'
+
+
+registry: Registry = Registry()
+
+REQUEST_DURATION: Histogram = registry.histogram(
+    'orders_request_duration_seconds',
+    'Request latency by view.',
+    ('view', 'method', 'status'),
+)
+DB_QUERIES: Histogram = registry.histogram(
+    'orders_db_queries_per_request',
+    'Database queries per request by view.',
+    ('view',),
+    buckets=QUERY_BUCKETS,
+)
+DB_DURATION: Counter = registry.counter(
+    'orders_db_query_seconds_total',
+    'Time spent in database queries by view.',
+    ('view',),
+)
+STRIPE_DURATION: Histogram = registry.histogram(
+    'orders_stripe_call_duration_seconds',
+    'Stripe API call latency by method.',
+    ('method',),
+)
+STRIPE_ERRORS: Counter = registry.counter(
+    'orders_stripe_call_errors_total',
+    'Failed Stripe API calls by method and error.',
+    ('method', 'error'),
+)
+CACHE_REQUESTS: Counter = registry.counter(
+    'orders_cache_requests_total',
+    'Cache lookups by cache and result.',
+    ('cache', 'result'),
+)
+
+
+def record_cache(name: str, hits: int, misses: int = 0) -> None:
+    """Counts cache hits and misses of ``name``."""
+
+    if hits:
+        CACHE_REQUESTS.inc(hits, cache=name, result='hit')
+    if misses:
+        CACHE_REQUESTS.inc(misses, cache=name, result='miss')
+
+
+def observe_stripe_call(call: Callable) -> Callable:
+    """Decorates gateway ``call`` to time it and count its errors."""
+
+    @wraps(call)
+    def wrapper(self: Any, method: str, *args: Any, **params: Any) -> Any:
+        start: float = time.perf_counter()
+        try:
+            return call(self, method, *args, **params)
+        except Exception as e:
+            STRIPE_ERRORS.inc(method=method, error=type(e).__name__)
+            raise
+        finally:
+            STRIPE_DURATION.observe(
+                time.perf_counter() - start,
+                method=method
+            )
+
+    return wrapper
+
+
+class QueryStats:
+    """Number and time of database queries of one request."""
+
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.duration: float = 0.0
+
+
+# Query stats of the current request; copied into sync_to_async threads.
+request_queries: ContextVar[Optional[QueryStats]] = ContextVar(
+    'request_queries',
+    default=None
+)
+
+
+def record_query(
+    execute: Callable,
+    sql: str,
+    params: Any,
+    many: bool,
+    context: dict
+) -> Any:
+    """Database execute wrapper adding queries to the current request."""
+
+    stats: Optional[QueryStats] = request_queries.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    start: float = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.count += 1
+        stats.duration += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def install_query_recorder(
+    connection: BaseDatabaseWrapper,
+    **kwargs: Any
+) -> None:
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
@@ -0,0 +1,284 @@
+# Python
+from typing import (
+    Any,
+    Callable,
+)
+from collections import Counter
+import asyncio
+import random
+import re
+import time
+import uuid
+
+# Django
+from asgiref.sync import markcoroutinefunction
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+)
+
+# Local
+from .logs import request_id
+from .metrics import (
+    DB_DURATION,
+    DB_QUERIES,
+    REQUEST_DURATION,
+    QueryStats,
+    registry,
+    request_queries,
+)
+from .profiling import (
+    PROFILE_HEADER,
+    Profiler,
+    get_profiler,
+)
+from .queries import (
+    check_query_budget,
+    get_url_name,
+)
+from .tracing import (
+    SPAN_KIND_SERVER,
+    Span,
+    get_tracer,
+    parse_traceparent,
+    start_span,
+)
+
+
+# Incoming request ids are trusted only if they look like one.
+REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9._-]{8,64}')
+
+
+def get_view_name(request: HttpRequest) -> str:
+    """Class or function name of the view that handled the request."""
+
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+
+    view: Callable = getattr(
+        match.func,
+        'view_class',
+        getattr(match.func, 'cls', match.func)
+    )
+    return view.__name__
+
+
+class HybridMiddleware:
+    """Middleware running sync or async, like the rest of the chain.
+
+    Keeps async views off the thread that sync middleware would pin
+    them to.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable) -> None:
+        self.get_response: Callable = get_response
+        self.is_async: bool = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """Records latency and database queries of every request.
+
+    Queries are attributed through a context variable, so concurrent
+    async requests sharing a connection thread are counted apart, and
+    queries of worker threads count too. The stats are kept on the
+    request as ``query_stats``; requests over their ``QUERY_BUDGETS``
+    entry are logged.
+    """
+
+    def __init__(self, get_response: Callable) -> None:
+        super().__init__(get_response)
+        registry.start_flusher()
+
+    def record(
+        self,
+        request: HttpRequest,
+        response: HttpResponse,
+        start: float,
+        queries: QueryStats
+    ) -> None:
+
+        view: str = get_view_name(request)
+        REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            view=view,
+            method=request.method,
+            status=f'{response.status_code // 100}xx'
+        )
+        DB_QUERIES.observe(queries.count, view=view)
+        DB_DURATION.inc(queries.duration, view=view)
+        check_query_budget(request, queries.count)
+
+    def __call__(self, request: HttpRequest) -> Any:
+        if self.is_async:
+            return self.__acall__(request)
+
+        start: float = time.perf_counter()
+        queries: QueryStats = QueryStats()
+        request.query_stats = queries
+        token = request_queries.set(queries)
+        try:
+            response: HttpResponse = self.get_response(request)
+        finally:
+            request_queries.reset(token)
+
+        self.record(request, response, start, queries)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        start: float = time.perf_counter()
+        queries: QueryStats = QueryStats()
+        request.query_stats = queries
+        token = request_queries.set(queries)
+        try:
+            response: HttpResponse = await self.get_response(request)
+        finally:
+            request_queries.reset(token)
+
+        self.record(request, response, start, queries)
+        return response
+
+
+class RequestIdMiddleware(HybridMiddleware):
+    """Tags logs of a request with its ``X-Request-ID``.
+
+    The id of a proxy is reused when it looks valid, otherwise a new
+    one is generated; either way it is echoed in the response.
+    """
+
+    def get_request_id(self, request: HttpRequest) -> str:
+        incoming: str = request.headers.get('X-Request-ID', '')
+        if REQUEST_ID_PATTERN.fullmatch(incoming):
+            return incoming
+        return uuid.uuid4().hex
+
+    def __call__(self, request: HttpRequest) -> Any:
+        if self.is_async:
+            return self.__acall__(request)
+
+        request.request_id = self.get_request_id(request)
+        token = request_id.set(request.request_id)
+        try:
+            response: HttpResponse = self.get_response(request)
+            response['X-Request-ID'] = request.request_id
+        finally:
+            request_id.reset(token)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        request.request_id = self.get_request_id(request)
+        token = request_id.set(request.request_id)
+        try:
+            response: HttpResponse = await self.get_response(request)
+            response['X-Request-ID'] = request.request_id
+        finally:
+            request_id.reset(token)
+        return response
+
+
+class ProfilerMiddleware(HybridMiddleware):
+    """Samples stacks of a share of requests, or of signed ones.
+
+    A request is profiled with probability ``PROFILER['SAMPLE_RATE']``
+    or when it carries a valid ``X-Profile`` header, and its stacks are
+    added to the profile of its view. Others cost one random number.
+    Async requests are sampled on their event loop thread while their
+    task runs; work they hand to ``sync_to_async`` threads is not seen.
+    """
+
+    def is_profiled(self, request: HttpRequest, profiler: Profiler) -> bool:
+        token: str = request.headers.get(PROFILE_HEADER, '')
+        if token:
+            return profiler.is_signed(token)
+        return random.random() < profiler.sample_rate
+
+    def __call__(self, request: HttpRequest) -> Any:
+        if self.is_async:
+            return self.__acall__(request)
+
+        profiler: Profiler = get_profiler()
+        if not self.is_profiled(request, profiler):
+            return self.get_response(request)
+
+        samples: Counter = Counter()
+        profiler.sampler.start(samples)
+        try:
+            response: HttpResponse = self.get_response(request)
+        finally:
+            profiler.sampler.stop()
+
+        profiler.store.add(get_view_name(request), samples)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        profiler: Profiler = get_profiler()
+        if not self.is_profiled(request, profiler):
+            return await self.get_response(request)
+
+        samples: Counter = Counter()
+        task: asyncio.Task = asyncio.current_task()
+        profiler.sampler.start(samples, task)
+        try:
+            response: HttpResponse = await self.get_response(request)
+        finally:
+            profiler.sampler.stop(task)
+
+        profiler.store.add(get_view_name(request), samples)
+        return response
+
+
+class TracingMiddleware(HybridMiddleware):
+    """Records every request as the server span of its trace.
+
+    A W3C ``traceparent`` header continues the trace of the caller.
+    While tracing is disabled requests pass straight through.
+    """
+
+    def get_span_options(self, request: HttpRequest) -> dict[str, Any]:
+        return {
+            'name': request.method,
+            'kind': SPAN_KIND_SERVER,
+            'attributes': {
+                'http.method': request.method,
+                'http.target': request.path,
+                'request_id': getattr(request, 'request_id', ''),
+            },
+            'parent': parse_traceparent(
+                request.headers.get('traceparent', '')
+            ),
+        }
+
+    def finish(
+        self,
+        span: Span,
+        request: HttpRequest,
+        response: HttpResponse
+    ) -> None:
+
+        span.update_name(f'{request.method} {get_view_name(request)}')
+        span.set_attribute('http.route', get_url_name(request))
+        span.set_attribute('http.status_code', response.status_code)
+        if response.status_code >= 500:
+            span.set_error(response.reason_phrase)
+
+    def __call__(self, request: HttpRequest) -> Any:
+        if not get_tracer().enabled:
+            return self.get_response(request)
+        if self.is_async:
+            return self.__acall__(request)
+
+        with start_span(**self.get_span_options(request)) as span:
+            response: HttpResponse = self.get_response(request)
+            self.finish(span, request, response)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        with start_span(**self.get_span_options(request)) as span:
+            response: HttpResponse = await self.get_response(request)
+            self.finish(span, request, response)
+        return response
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.6 on 2026-10-18 07:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_alter_tax_country_alter_tax_percentage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tax',
+            name='stripe_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='stripe отпечаток'),
+        ),
+        migrations.AddField(
+            model_name='tax',
+            name='stripe_id',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='stripe id'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.6 on 2026-10-18 07:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_tax_stripe_fingerprint_tax_stripe_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discount',
+            name='stripe_coupon_id',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='stripe купон'),
+        ),
+        migrations.AddField(
+            model_name='discount',
+            name='stripe_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='stripe отпечаток'),
+        ),
+    ]
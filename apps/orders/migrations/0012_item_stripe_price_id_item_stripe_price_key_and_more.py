@@ -0,0 +1,33 @@
+# Generated by Django 4.1.6 on 2026-10-18 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_discount_stripe_coupon_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='stripe_price_id',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='stripe цена'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='stripe_price_key',
+            field=models.CharField(blank=True, editable=False, max_length=32, verbose_name='stripe ключ цены'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='stripe_product_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='stripe отпечаток продукта'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='stripe_product_id',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='stripe продукт'),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 4.1.6 on 2026-10-18 07:45
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.migrations.exceptions import IrreversibleError
+import django.db.models.deletion
+
+
+def copy_order_items(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderLine = apps.get_model('orders', 'OrderLine')
+
+    orders = []
+    lines = []
+    for order in Order.objects.select_related('item').iterator():
+        amount = int(order.item.price * 100)
+        lines.append(
+            OrderLine(
+                order_id=order.id,
+                item_id=order.item_id,
+                quantity=1,
+                unit_amount=amount,
+            )
+        )
+        order.total_amount = amount
+        orders.append(order)
+
+    OrderLine.objects.bulk_create(lines, batch_size=500)
+    Order.objects.bulk_update(
+        orders,
+        ['total_amount'],
+        batch_size=500
+    )
+
+
+def restore_order_items(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderLine = apps.get_model('orders', 'OrderLine')
+
+    if Order.objects.filter(lines__isnull=True).exists():
+        raise IrreversibleError(
+            'Orders without lines cannot get their single item back'
+        )
+
+    orders = []
+    seen = set()
+    for line in OrderLine.objects.order_by('order_id', 'id').iterator():
+        if line.order_id not in seen:
+            seen.add(line.order_id)
+            orders.append(Order(id=line.order_id, item_id=line.item_id))
+
+    Order.objects.bulk_update(orders, ['item'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_item_stripe_price_id_item_stripe_price_key_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_amount',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='сумма, центы'),
+        ),
+        migrations.CreateModel(
+            name='OrderLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)], verbose_name='количество')),
+                ('unit_amount', models.PositiveIntegerField(blank=True, verbose_name='цена за единицу, центы')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_lines', to='orders.item', verbose_name='товар')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='orders.order', verbose_name='заказ')),
+            ],
+            options={
+                'verbose_name': 'позиция заказа',
+                'verbose_name_plural': 'позиции заказа',
+                'ordering': ('id',),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='orderline',
+            constraint=models.UniqueConstraint(fields=('order', 'item'), name='unique_order_line_item'),
+        ),
+        # Nullable while the data moves, so the column can be re-added
+        # empty on the way back and filled from the first order lines.
+        migrations.AlterField(
+            model_name='order',
+            name='item',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='order', to='orders.item', verbose_name='товар'),
+        ),
+        migrations.RunPython(
+            copy_order_items,
+            restore_order_items
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='item',
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.1.6 on 2026-10-18 08:10
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_endings(apps, schema_editor):
+    Discount = apps.get_model('orders', 'Discount')
+    DiscountItem = apps.get_model('orders', 'DiscountItem')
+
+    DiscountItem.objects.update(
+        datetime_ending=Subquery(
+            Discount.objects.filter(
+                id=OuterRef('discount_id')
+            ).values('datetime_ending')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_order_total_amount_orderline'),
+    ]
+
+    operations = [
+        # Adopt the auto-created M2M table as an explicit through model.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='DiscountItem',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('discount', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='orders.discount', verbose_name='скидка')),
+                        ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='orders.item', verbose_name='товар')),
+                    ],
+                    options={
+                        'verbose_name': 'товар скидки',
+                        'verbose_name_plural': 'товары скидки',
+                        'db_table': 'orders_discount_item',
+                        'unique_together': {('discount', 'item')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='discount',
+                    name='item',
+                    field=models.ManyToManyField(related_name='discont', through='orders.DiscountItem', to='orders.item', verbose_name='товар'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='discountitem',
+            name='datetime_ending',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='время завершения скидки'),
+        ),
+        migrations.RunPython(
+            fill_endings,
+            migrations.RunPython.noop
+        ),
+        migrations.AddIndex(
+            model_name='discountitem',
+            index=models.Index(fields=['item', 'datetime_ending'], name='discount_item_ending_idx'),
+        ),
+    ]
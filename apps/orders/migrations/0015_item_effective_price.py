@@ -0,0 +1,48 @@
+# Generated by Django 4.1.6 on 2026-10-18 07:48
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def fill_effective_prices(apps, schema_editor):
+    Item = apps.get_model('orders', 'Item')
+    DiscountItem = apps.get_model('orders', 'DiscountItem')
+
+    Item.objects.update(effective_price=F('price'))
+    best = {}
+    links = DiscountItem.objects.filter(
+        datetime_ending__gt=timezone.now()
+    ).select_related('discount', 'item')
+    for link in links:
+        if link.discount.persent > best.get(link.item_id, (0, None))[0]:
+            best[link.item_id] = (link.discount.persent, link.item)
+
+    items = []
+    for persent, item in best.values():
+        item.effective_price = (
+            item.price * (100 - persent) / 100
+        ).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        items.append(item)
+    Item.objects.bulk_update(items, ['effective_price'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0014_discountitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='effective_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=6, null=True, verbose_name='цена со скидкой'),
+        ),
+        migrations.RunPython(
+            fill_effective_prices,
+            migrations.RunPython.noop
+        ),
+    ]
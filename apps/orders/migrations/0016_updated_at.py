@@ -0,0 +1,38 @@
+# Generated by Django 4.1.6 on 2026-10-18 09:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0015_item_effective_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discount',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='время изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='время изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='время изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='tax',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='время изменения'),
+            preserve_default=False,
+        ),
+    ]
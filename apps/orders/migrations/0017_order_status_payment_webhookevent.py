@@ -0,0 +1,62 @@
+# Generated by Django 4.1.6 on 2026-10-18 08:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0016_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe_session_id', models.CharField(max_length=255, unique=True, verbose_name='stripe сессия')),
+                ('stripe_payment_intent_id', models.CharField(blank=True, max_length=255, verbose_name='stripe платёж')),
+                ('status', models.CharField(choices=[('pending', 'ожидает оплаты'), ('paid', 'оплачен'), ('failed', 'ошибка оплаты'), ('expired', 'истёк')], max_length=16, verbose_name='статус')),
+                ('amount_total', models.PositiveIntegerField(default=0, verbose_name='сумма, центы')),
+                ('currency', models.CharField(blank=True, max_length=3, verbose_name='валюта')),
+                ('event_created', models.DateTimeField(verbose_name='время события')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='время изменения')),
+            ],
+            options={
+                'verbose_name': 'платёж',
+                'verbose_name_plural': 'платежи',
+                'ordering': ('-event_created',),
+            },
+        ),
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe_id', models.CharField(max_length=255, unique=True, verbose_name='stripe id')),
+                ('type', models.CharField(max_length=255, verbose_name='тип')),
+                ('payload', models.JSONField(verbose_name='данные')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='время получения')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='время обработки')),
+            ],
+            options={
+                'verbose_name': 'событие stripe',
+                'verbose_name_plural': 'события stripe',
+                'ordering': ('id',),
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('new', 'новый'), ('pending', 'ожидает оплаты'), ('paid', 'оплачен'), ('failed', 'ошибка оплаты')], default='new', editable=False, max_length=16, verbose_name='статус'),
+        ),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(fields=['processed_at', 'id'], name='webhook_event_queue_idx'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='orders.order', verbose_name='заказ'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.1.6 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0017_order_status_payment_webhookevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconcileCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource', models.CharField(max_length=64, verbose_name='ресурс')),
+                ('created_gte', models.PositiveBigIntegerField(verbose_name='создан с')),
+                ('created_lt', models.PositiveBigIntegerField(verbose_name='создан до')),
+                ('starting_after', models.CharField(blank=True, max_length=255, verbose_name='последний id')),
+                ('done', models.BooleanField(default=False, verbose_name='завершён')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='время изменения')),
+            ],
+            options={
+                'verbose_name': 'курсор сверки',
+                'verbose_name_plural': 'курсоры сверки',
+                'unique_together': {('resource', 'created_gte')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.6 on 2026-10-18 08:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0018_reconcilecursor'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='item',
+            constraint=models.CheckConstraint(check=models.Q(('price__gt', 0), ('price__lt', 999)), name='item_price_range'),
+        ),
+    ]
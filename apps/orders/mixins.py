@@ -1,12 +1,26 @@
 # Python
 from typing import (
+    Any,
     Union,
     Optional
 )
+import datetime
+import math
 
 # Django
+from django.conf import settings
+from django.core.cache import cache
 from django.core.handlers.wsgi import WSGIRequest
-from django.http import HttpResponse
+from django.db.models import Model
+from django.http import (
+    HttpResponse,
+    HttpResponseBase,
+)
+from django.utils.cache import (
+    get_conditional_response,
+    quote_etag,
+)
+from django.utils.http import http_date
 from django.template import (
     loader,
     Template,
@@ -15,6 +29,10 @@ from django.template import (
 # DRF
 from rest_framework.response import Response as DRF_Response
 
+# Local
+from .caches import get_versions
+from .metrics import record_cache
+
 
 class HttpResponseMixin:
     """Mixin for send http response."""
@@ -56,6 +74,152 @@ class HttpResponseMixin:
         )
 
 
+class ConditionalResponseMixin:
+    """Mixin for answering conditional GET with 304."""
+
+    def get_not_modified_response(
+        self,
+        request: WSGIRequest,
+        etag: Optional[str],
+        last_modified: Optional[datetime.datetime] = None
+    ) -> Optional[HttpResponse]:
+
+        return get_conditional_response(
+            request,
+            etag=etag and quote_etag(etag),
+            last_modified=last_modified and int(last_modified.timestamp())
+        )
+
+    def set_validators(
+        self,
+        response: HttpResponseBase,
+        etag: Optional[str],
+        last_modified: Optional[datetime.datetime] = None
+    ) -> HttpResponseBase:
+
+        if etag:
+            response['ETag'] = quote_etag(etag)
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+
+        return response
+
+
+class CachedHttpResponseMixin(HttpResponseMixin, ConditionalResponseMixin):
+    """Mixin for caching rendered pages until their data changes.
+
+    Keys include versions of ``cache_versions`` families, which signals
+    bump on model changes, so a hit costs one cache round-trip and no
+    database queries. Pages are stored with their validators, so
+    conditional requests get 304 without rendering.
+    """
+
+    cache_prefix: str = ''
+    cache_versions: tuple[str, ...] = ()
+
+    def get_object(self, pk: int) -> Optional[Model]:
+        raise NotImplementedError
+
+    def get_context_data(self, obj: Model) -> dict:
+        raise NotImplementedError
+
+    def get_validators(
+        self,
+        obj: Model
+    ) -> tuple[str, datetime.datetime]:
+        raise NotImplementedError
+
+    def get_page_cache_key(self, key: Any) -> str:
+        versions: tuple[int, ...] = get_versions(*self.cache_versions)
+        return 'orders:page:{}:{}:{}'.format(
+            self.cache_prefix,
+            key,
+            ':'.join(str(v) for v in versions)
+        )
+
+    def get(
+        self,
+        request: WSGIRequest,
+        pk: int,
+        *args: tuple,
+        **kwargs: dict
+    ) -> HttpResponse:
+
+        cache_key: str = self.get_page_cache_key(pk)
+        page: Optional[dict] = cache.get(cache_key)
+        record_cache('page', page is not None, page is None)
+        if page is None:
+            return self.render_page(request, pk, cache_key)
+
+        not_modified: Optional[HttpResponse] = self.get_not_modified_response(
+            request,
+            page['etag'],
+            page['last_modified']
+        )
+        if not_modified:
+            return self.set_validators(
+                not_modified,
+                page['etag'],
+                page['last_modified']
+            )
+
+        return self.set_validators(
+            HttpResponse(
+                page['content'],
+                content_type=self.content_type
+            ),
+            page['etag'],
+            page['last_modified']
+        )
+
+    def render_page(
+        self,
+        request: WSGIRequest,
+        pk: int,
+        cache_key: str
+    ) -> HttpResponse:
+
+        etag: Optional[str] = None
+        last_modified: Optional[datetime.datetime] = None
+        obj: Optional[Model] = self.get_object(pk)
+        if not obj:
+            response: HttpResponse = self.get_http_error(
+                request=request,
+                error_message=f"Object {pk} does not exist"
+            )
+        else:
+            etag, last_modified = self.get_validators(obj)
+            not_modified: Optional[HttpResponse] =\
+                self.get_not_modified_response(
+                    request,
+                    etag,
+                    last_modified
+                )
+            if not_modified:
+                return self.set_validators(
+                    not_modified,
+                    etag,
+                    last_modified
+                )
+
+            response = self.get_http_response(
+                request=request,
+                template_name=self.template_name,
+                context=self.get_context_data(obj)
+            )
+
+        cache.set(
+            cache_key,
+            {
+                'content': response.content,
+                'etag': etag,
+                'last_modified': last_modified,
+            },
+            settings.PAGE_CACHE_TIMEOUT
+        )
+        return self.set_validators(response, etag, last_modified)
+
+
 class JsonResponseMixin:
     """Json response mixin for DRF ViewSet."""
 
@@ -72,3 +236,13 @@ class JsonResponseMixin:
         )
 
         return response
+
+    def get_unavailable_response(self, retry_after: float) -> DRF_Response:
+        """503 response telling clients when to retry."""
+
+        response: DRF_Response = self.get_json_response({
+            'message': 'Payment service unavailable'
+        }, 503)
+        response['Retry-After'] = str(math.ceil(retry_after))
+
+        return response
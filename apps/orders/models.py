@@ -2,26 +2,68 @@
 from typing import (
     Optional, 
     Any, 
+    Iterable,
 )
+import asyncio
 import datetime
+import decimal
+import hashlib
+import logging
 from functools import cached_property
 
 # Django
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.db import (
+    models,
+    transaction,
+)
+from django.core.cache import cache
+from django.utils import timezone
 from django.core.exceptions import (
     ValidationError,
     ObjectDoesNotExist
 )
-from django.conf import settings
 from django.db.models import (
     QuerySet,
     Sum,
+    F,
+    OuterRef,
+    Subquery,
+)
+from django.db.models.functions import Coalesce
+from django.core.validators import (
+    MaxValueValidator,
+    MinValueValidator,
 )
-from django.core.validators import MaxValueValidator
 
 # Stripe
 import stripe
 
+# Local
+from .caches import (
+    tax_rates_cache,
+    coupons_cache,
+    get_version,
+)
+from .gateway import get_gateway
+from .metrics import record_cache
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Item prices lie strictly between these, in validation and in the database.
+# Item exposes them as Item.MIN_PRICE and Item.MAX_PRICE.
+MIN_PRICE = 0
+MAX_PRICE = 999
+
+
+def get_fingerprint(*values: Any) -> str:
+    """Stable hash of the fields Stripe objects are built from."""
+
+    return hashlib.sha256(
+        '|'.join(str(v) for v in values).encode()
+    ).hexdigest()
+
 
 class ItemManager(models.Manager):
     """Manager for item."""
@@ -40,8 +82,8 @@ class ItemManager(models.Manager):
 class Item(models.Model):
     """Model for Stripe."""
 
-    MAX_PRICE = 999
-    MIN_PRICE = 0
+    MAX_PRICE = MAX_PRICE
+    MIN_PRICE = MIN_PRICE
     CURRENCY_PATTERN = (
         ("usd", "USD"),
         ("eur", "EUR"),
@@ -59,16 +101,66 @@ class Item(models.Model):
         max_digits=6,
         decimal_places=2
     )
+    effective_price = models.DecimalField(
+        verbose_name="цена со скидкой",
+        max_digits=6,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        editable=False
+    )
     currency = models.CharField(
         max_length=3, 
         choices=CURRENCY_PATTERN
     )
+    stripe_product_id = models.CharField(
+        verbose_name="stripe продукт",
+        max_length=255,
+        blank=True,
+        editable=False
+    )
+    stripe_product_fingerprint = models.CharField(
+        verbose_name="stripe отпечаток продукта",
+        max_length=64,
+        blank=True,
+        editable=False
+    )
+    stripe_price_id = models.CharField(
+        verbose_name="stripe цена",
+        max_length=255,
+        blank=True,
+        editable=False
+    )
+    stripe_price_key = models.CharField(
+        verbose_name="stripe ключ цены",
+        max_length=32,
+        blank=True,
+        editable=False
+    )
+    updated_at = models.DateTimeField(
+        verbose_name="время изменения",
+        auto_now=True
+    )
     objects = ItemManager()
 
+    STRIPE_FIELDS = (
+        'stripe_product_id',
+        'stripe_product_fingerprint',
+        'stripe_price_id',
+        'stripe_price_key',
+    )
+
     class Meta:
         ordering = (
             '-id',
         )
+        constraints = (
+            # MIN_PRICE < price < MAX_PRICE, also for bulk writes.
+            models.CheckConstraint(
+                check=models.Q(price__gt=MIN_PRICE, price__lt=MAX_PRICE),
+                name='item_price_range'
+            ),
+        )
         verbose_name = "предмет"
         verbose_name_plural = "предметы"
 
@@ -80,93 +172,91 @@ class Item(models.Model):
         )
 
     def save(self, *args, **kwags) -> None:
+        if self._state.adding and self.effective_price is None:
+            self.effective_price = self.price
+
         self.full_clean()
-        return super().save( *args, **kwags)
+        super().save( *args, **kwags)
+        if not self.is_stripe_synced:
+            transaction.on_commit(self._sync_stripe_on_commit)
 
-    def get_stripe_dict(
-        self, 
-        list_items: list[dict]
-    ) -> list[dict]:
+    def _sync_stripe_on_commit(self) -> None:
+        try:
+            self.sync_stripe()
+        except stripe.error.StripeError:
+            logger.exception(
+                'Stripe catalog sync failed for item id %s',
+                self.id
+            )
+
+    @property
+    def price_key(self) -> str:
+        return f'{self.currency}:{self.amount}'
 
-        tax_list: list[int] = []
-        taxs: QuerySet[Tax] = Tax.objects.filter(
-            item=self.id
+    @property
+    def product_fingerprint(self) -> str:
+        return get_fingerprint(
+            self.name,
+            self.description,
         )
-        print(self.id)
-        tax: Tax
-        for tax in taxs:
-            stripe_tax = stripe.TaxRate.create(
-                display_name=tax.display_name,
-                inclusive=tax.inclusive,
-                percentage=tax.percentage,
-                country=tax.country,
-                description=tax.description,
-            )
-            tax_list.append(stripe_tax.id)
-
-        print("===========================")
-        print(tax_list)
-        if not hasattr(self, '_data_obj'):
-            self._data_obj: dict = {
-                'price_data': {
-                    'currency': self.currency,
-                    'unit_amount': self.amount,
-                    'product_data': {
-                        'name': self.name,
-                        'description': self.description
-                    },
-                },
-                'quantity': 0,
-                'tax_rates': tax_list
-            }
-        else:
-            index: int = list_items.index(self._data_obj)
-            list_items.pop(index)
-
-        self._data_obj['quantity'] += 1
-        list_items.append(self._data_obj)
-        return list_items
-
-    def get_stripe_session(
-        self, 
-        line_items: list[dict]
-    ) -> Optional[stripe.checkout.Session]:
 
-        try:
-            disconts_list: list[dict] = []
-            disconts: QuerySet[Discount] = Discount.objects.filter(
-                item=self.id
+    @property
+    def is_stripe_synced(self) -> bool:
+        return bool(
+            self.stripe_product_id
+        ) and bool(
+            self.stripe_price_id
+        ) and (
+            self.stripe_product_fingerprint == self.product_fingerprint
+        ) and (
+            self.stripe_price_key == self.price_key
+        )
+
+    def sync_stripe(self, commit: bool = True) -> bool:
+        """Keeps Stripe Product and Price of the item up to date."""
+
+        if self.is_stripe_synced:
+            return False
+
+        product_fingerprint: str = self.product_fingerprint
+        if not self.stripe_product_id:
+            product = get_gateway().create_product(
+                name=self.name,
+                description=self.description,
+                metadata={
+                    'item_id': self.id
+                }
             )
-            if disconts:
-                coupon = stripe.Coupon.create(
-                    percent_off=disconts.last().persent, 
-                    duration="once"
-                )
-                disconts_list.append({
-                    "coupon": coupon.id
-                })
-
-            checkout_session = stripe.checkout.Session.create(
-                line_items=line_items,
-                mode='payment',
-                success_url=settings.DOMAIN + '/success',
-                cancel_url=settings.DOMAIN + '/cancel',
-                discounts=disconts_list,
+            self.stripe_product_id = product.id
+            self.stripe_price_id = ''
+        elif self.stripe_product_fingerprint != product_fingerprint:
+            get_gateway().modify_product(
+                self.stripe_product_id,
+                name=self.name,
+                description=self.description,
             )
-        except Exception as e:
-            print(
-                '----------------------',
-                (
-                    f'[{datetime.datetime.now()} ERROR] '
-                    f'Stripe exeption by item id {self.id}'
-                ),
-                e,
-                '----------------------',
-                sep='\n'
+        self.stripe_product_fingerprint = product_fingerprint
+
+        if not self.stripe_price_id or self.stripe_price_key != self.price_key:
+            price = get_gateway().create_price(
+                product=self.stripe_product_id,
+                unit_amount=self.amount,
+                currency=self.currency,
             )
-            return None
+            if self.stripe_price_id:
+                try:
+                    get_gateway().archive_price(self.stripe_price_id)
+                except stripe.error.InvalidRequestError:
+                    pass
+            self.stripe_price_id = price.id
+            self.stripe_price_key = self.price_key
 
-        return checkout_session
+        if commit:
+            Item.objects.filter(id=self.id).update(**{
+                field: getattr(self, field)
+                for field in self.STRIPE_FIELDS
+            })
+        return True
 
     def clean(self) -> None:
         if (
@@ -189,6 +279,19 @@ class Item(models.Model):
     def amount(self) -> int:
         return int(self.price * 100)
 
+    @property
+    def is_discounted(self) -> bool:
+        return self.effective_price is not None and (
+            self.effective_price != self.price
+        )
+
+    @property
+    def discount_persent(self) -> int:
+        if not self.is_discounted:
+            return 0
+
+        return round(100 - self.effective_price * 100 / self.price)
+
 
 class OrderManager(models.Manager):
     """Manager for order."""
@@ -203,20 +306,62 @@ class OrderManager(models.Manager):
         except ObjectDoesNotExist:
             return None
 
+    def update_total(self, order_id: int) -> None:
+        """Recalculates denormalized total of the order in one query."""
+
+        self.filter(id=order_id).update(
+            updated_at=timezone.now(),
+            total_amount=Coalesce(
+                Subquery(
+                    OrderLine.objects.filter(
+                        order_id=OuterRef('id')
+                    ).values(
+                        'order_id'
+                    ).annotate(
+                        total=Sum(F('unit_amount') * F('quantity'))
+                    ).values(
+                        'total'
+                    )
+                ),
+                0
+            )
+        )
+
 
 class Order(models.Model):
     """Order have one or many items."""
 
+    NEW = 'new'
+    PENDING = 'pending'
+    PAID = 'paid'
+    FAILED = 'failed'
+    STATUSES = (
+        (NEW, 'новый'),
+        (PENDING, 'ожидает оплаты'),
+        (PAID, 'оплачен'),
+        (FAILED, 'ошибка оплаты'),
+    )
+
     datetime_created = models.DateTimeField(
         verbose_name="время создания",
         auto_created=True,
         auto_now=True
     )
-    item = models.ForeignKey(
-        to=Item,
-        on_delete=models.CASCADE,
-        verbose_name="товар",
-        related_name='order'
+    total_amount = models.PositiveIntegerField(
+        verbose_name="сумма, центы",
+        default=0,
+        editable=False
+    )
+    status = models.CharField(
+        verbose_name="статус",
+        max_length=16,
+        choices=STATUSES,
+        default=NEW,
+        editable=False
+    )
+    updated_at = models.DateTimeField(
+        verbose_name="время изменения",
+        auto_now=True
     )
     objects = OrderManager()
 
@@ -230,16 +375,147 @@ class Order(models.Model):
     def __str__(self) -> str:
         return f'Order by {self.datetime_created}'
 
-    @cached_property
+    @property
     def full_price(self) -> float:
-        items: QuerySet[Item] = self.item.get_queryset()
-        return float(
-            items.aggregate(
-                sum=Sum('price')
-            ).get(
-                'sum'
-            )
+        return self.total_amount / 100
+
+
+class OrderLine(models.Model):
+    """Item of the order with quantity and price snapshot.
+
+    ``save`` and every delete, cascades included, keep the order total;
+    after ``bulk_create`` or queryset ``update`` of lines call
+    ``Order.objects.update_total``.
+    """
+
+    order = models.ForeignKey(
+        to=Order,
+        on_delete=models.CASCADE,
+        verbose_name="заказ",
+        related_name='lines'
+    )
+    item = models.ForeignKey(
+        to=Item,
+        on_delete=models.CASCADE,
+        verbose_name="товар",
+        related_name='order_lines'
+    )
+    quantity = models.PositiveIntegerField(
+        verbose_name="количество",
+        default=1,
+        validators=[
+            MinValueValidator(1)
+        ]
+    )
+    unit_amount = models.PositiveIntegerField(
+        verbose_name="цена за единицу, центы",
+        blank=True
+    )
+
+    class Meta:
+        ordering = (
+            'id',
+        )
+        constraints = (
+            models.UniqueConstraint(
+                fields=('order', 'item'),
+                name='unique_order_line_item'
+            ),
+        )
+        verbose_name = 'позиция заказа'
+        verbose_name_plural = 'позиции заказа'
+
+    def __str__(self) -> str:
+        return f'{self.item_id} x {self.quantity}'
+
+    def save(self, *args, **kwargs) -> None:
+        if self.unit_amount is None:
+            self.unit_amount = self.item.amount
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Order.objects.update_total(self.order_id)
+
+    @property
+    def amount(self) -> int:
+        return self.unit_amount * self.quantity
+
+
+class DiscountManager(models.Manager):
+    """Manager for discount."""
+
+    NO_DISCOUNT = 0
+
+    def active_for(
+        self,
+        item_ids: Iterable[int],
+        now: Optional[datetime.datetime] = None
+    ) -> dict[int, 'Discount']:
+        """Best active discount of every item in one query.
+
+        Results are cached until the earliest discount in them ends,
+        or until any discount changes.
+        """
+
+        item_ids = set(item_ids)
+        if now is not None:
+            return self._active_for(item_ids, now)
+
+        version: int = get_version('discount')
+        keys: dict[str, int] = {
+            f'orders:discount:{version}:{item_id}': item_id
+            for item_id in item_ids
+        }
+        cached: dict[str, Any] = cache.get_many(keys)
+        result: dict[int, Discount] = {
+            keys[key]: discont
+            for key, discont in cached.items()
+            if discont != self.NO_DISCOUNT
+        }
+        missing: set[int] = item_ids - {keys[key] for key in cached}
+        record_cache('discounts', len(cached), len(missing))
+        if not missing:
+            return result
+
+        now = timezone.now()
+        found: dict[int, Discount] = self._active_for(missing, now)
+        timeout: Optional[int] = None
+        if found:
+            timeout = max(1, int(min(
+                (d.datetime_ending - now).total_seconds()
+                for d in found.values()
+            )))
+
+        cache.set_many({
+            key: found.get(item_id, self.NO_DISCOUNT)
+            for key, item_id in keys.items()
+            if item_id in missing
+        }, timeout)
+        result.update(found)
+        return result
+
+    def _active_for(
+        self,
+        item_ids: Iterable[int],
+        now: datetime.datetime
+    ) -> dict[int, 'Discount']:
+
+        result: dict[int, Discount] = {}
+        links: QuerySet[DiscountItem] = DiscountItem.objects.filter(
+            item_id__in=item_ids,
+            datetime_ending__gt=now
+        ).select_related(
+            'discount'
+        ).order_by(
+            'item_id',
+            '-discount__persent',
+            '-datetime_ending',
         )
+        link: DiscountItem
+        for link in links:
+            result.setdefault(link.item_id, link.discount)
+
+        return result
 
 
 class Discount(models.Model):
@@ -253,6 +529,7 @@ class Discount(models.Model):
     )
     item = models.ManyToManyField(
         to=Item,
+        through='DiscountItem',
         verbose_name="товар",
         related_name='discont'
     )
@@ -262,6 +539,23 @@ class Discount(models.Model):
             MaxValueValidator(MAX_PERSENT)
         ]
     )
+    stripe_coupon_id = models.CharField(
+        verbose_name="stripe купон",
+        max_length=255,
+        blank=True,
+        editable=False
+    )
+    stripe_fingerprint = models.CharField(
+        verbose_name="stripe отпечаток",
+        max_length=64,
+        blank=True,
+        editable=False
+    )
+    updated_at = models.DateTimeField(
+        verbose_name="время изменения",
+        auto_now=True
+    )
+    objects = DiscountManager()
 
     @cached_property
     def items_name(self) -> str:
@@ -283,6 +577,297 @@ class Discount(models.Model):
     def __str__(self) -> str:
         return f"{self.items_name} {self.persent}%"
 
+    def get_discounted_amount(self, amount: int) -> int:
+        """Amount in cents with the discount applied."""
+
+        return (amount * (self.MAX_PERSENT - self.persent) + 50) // 100
+
+    def get_discounted_price(
+        self,
+        price: decimal.Decimal
+    ) -> decimal.Decimal:
+        """Price with the discount applied, rounded like amounts."""
+
+        return (
+            price * (self.MAX_PERSENT - self.persent) / self.MAX_PERSENT
+        ).quantize(
+            decimal.Decimal('0.01'),
+            rounding=decimal.ROUND_HALF_UP
+        )
+
+    @property
+    def fingerprint(self) -> str:
+        return get_fingerprint(
+            self.id,
+            self.persent,
+            int(self.datetime_ending.timestamp()),
+        )
+
+    def get_stripe_coupon_id(self) -> Optional[str]:
+        """Stripe Coupon of the discount, created once on first use.
+
+        Cached ids belong to the shared coupon version, which is bumped
+        when a coupon is dropped on the server side.
+        """
+
+        ttl: float = (
+            self.datetime_ending - timezone.now()
+        ).total_seconds()
+        if ttl <= 0:
+            return None
+
+        version: int = get_version('coupon')
+        fingerprint: str = self.fingerprint
+        cache_key: str = f'orders:coupon:{version}:{fingerprint}'
+        coupon_id: Optional[str] = coupons_cache.get((version, fingerprint))
+        if coupon_id:
+            return coupon_id
+
+        coupon_id = cache.get(cache_key)
+        if not coupon_id:
+            coupon_id = self.sync_stripe()
+            cache.set(cache_key, coupon_id, int(ttl))
+
+        coupons_cache.set((version, fingerprint), coupon_id, ttl)
+        return coupon_id
+
+    async def aget_stripe_coupon_id(self) -> Optional[str]:
+        """Async ``get_stripe_coupon_id`` calling Stripe off the loop."""
+
+        ttl: float = (
+            self.datetime_ending - timezone.now()
+        ).total_seconds()
+        if ttl <= 0:
+            return None
+
+        version: int = await sync_to_async(get_version)('coupon')
+        fingerprint: str = self.fingerprint
+        cache_key: str = f'orders:coupon:{version}:{fingerprint}'
+        coupon_id: Optional[str] = coupons_cache.get((version, fingerprint))
+        if coupon_id:
+            return coupon_id
+
+        coupon_id = await cache.aget(cache_key)
+        if not coupon_id:
+            coupon_id = await sync_to_async(
+                self.sync_stripe,
+                thread_sensitive=False
+            )(commit=False)
+            await Discount.objects.filter(id=self.id).aupdate(
+                stripe_coupon_id=self.stripe_coupon_id,
+                stripe_fingerprint=self.stripe_fingerprint
+            )
+            await cache.aset(cache_key, coupon_id, int(ttl))
+
+        coupons_cache.set((version, fingerprint), coupon_id, ttl)
+        return coupon_id
+
+    def sync_stripe(self, commit: bool = True) -> str:
+        """Creates Stripe Coupon once and recreates it on change."""
+
+        fingerprint: str = self.fingerprint
+        if self.stripe_coupon_id and self.stripe_fingerprint == fingerprint:
+            return self.stripe_coupon_id
+
+        coupon = get_gateway().create_coupon(
+            percent_off=self.persent,
+            duration="once",
+            redeem_by=int(self.datetime_ending.timestamp()),
+        )
+        if self.stripe_coupon_id:
+            try:
+                get_gateway().delete_coupon(self.stripe_coupon_id)
+            except stripe.error.InvalidRequestError:
+                pass
+
+        self.stripe_coupon_id = coupon.id
+        self.stripe_fingerprint = fingerprint
+        if commit:
+            Discount.objects.filter(id=self.id).update(
+                stripe_coupon_id=self.stripe_coupon_id,
+                stripe_fingerprint=self.stripe_fingerprint
+            )
+        return self.stripe_coupon_id
+
+
+class DiscountItem(models.Model):
+    """Item of the discount with denormalized ending time."""
+
+    discount = models.ForeignKey(
+        to=Discount,
+        on_delete=models.CASCADE,
+        verbose_name="скидка"
+    )
+    item = models.ForeignKey(
+        to=Item,
+        on_delete=models.CASCADE,
+        verbose_name="товар"
+    )
+    datetime_ending = models.DateTimeField(
+        verbose_name="время завершения скидки",
+        null=True,
+        editable=False
+    )
+
+    class Meta:
+        db_table = 'orders_discount_item'
+        unique_together = (
+            ('discount', 'item'),
+        )
+        indexes = (
+            models.Index(
+                fields=('item', 'datetime_ending'),
+                name='discount_item_ending_idx'
+            ),
+        )
+        verbose_name = 'товар скидки'
+        verbose_name_plural = 'товары скидки'
+
+    def __str__(self) -> str:
+        return f'{self.discount_id} -> {self.item_id}'
+
+    def save(self, *args, **kwargs) -> None:
+        if self.datetime_ending is None:
+            self.datetime_ending = self.discount.datetime_ending
+
+        return super().save(*args, **kwargs)
+
+
+class TaxManager(models.Manager):
+    """Manager for tax."""
+
+    def _get_cached_stripe_ids(
+        self,
+        item_ids: Iterable[int],
+        version: int
+    ) -> tuple[dict[int, list[str]], list[int]]:
+        """Cached ids of the shared tax version.
+
+        Other processes bump the version when a tax changes and its
+        old TaxRate is archived, so stale ids are never reused here.
+        """
+
+        result: dict[int, list[str]] = {}
+        missing: list[int] = []
+        item_id: int
+        for item_id in item_ids:
+            tax_ids: Optional[tuple] = tax_rates_cache.get(
+                (version, item_id)
+            )
+            if tax_ids is None:
+                missing.append(item_id)
+                result[item_id] = []
+            else:
+                result[item_id] = list(tax_ids)
+
+        return result, missing
+
+    def _get_links(self, item_ids: list[int]) -> QuerySet:
+        return Tax.item.through.objects.filter(
+            item_id__in=item_ids
+        ).select_related(
+            'tax'
+        ).order_by(
+            '-tax__percentage'
+        )
+
+    def _set_cached_stripe_ids(
+        self,
+        result: dict[int, list[str]],
+        links: Iterable,
+        missing: list[int],
+        version: int
+    ) -> dict[int, list[str]]:
+
+        for link in links:
+            result[link.item_id].append(link.tax.stripe_id)
+
+        for item_id in missing:
+            tax_rates_cache.set((version, item_id), tuple(result[item_id]))
+
+        return result
+
+    def get_stripe_ids_for(
+        self,
+        item_ids: Iterable[int]
+    ) -> dict[int, list[str]]:
+        """Stripe TaxRate ids of items, synced once and cached."""
+
+        version: int = get_version('tax')
+        result: dict[int, list[str]]
+        missing: list[int]
+        result, missing = self._get_cached_stripe_ids(item_ids, version)
+        if not missing:
+            return result
+
+        links: list = list(self._get_links(missing))
+        taxes: dict[int, Tax] = {}
+        for link in links:
+            link.tax = taxes.setdefault(link.tax_id, link.tax)
+
+        changed: list[Tax] = []
+        tax: Tax
+        for tax in taxes.values():
+            stripe_id: str = tax.stripe_id
+            if tax.sync_stripe(commit=False) != stripe_id:
+                changed.append(tax)
+        if changed:
+            Tax.objects.bulk_update(
+                changed,
+                ('stripe_id', 'stripe_fingerprint')
+            )
+
+        return self._set_cached_stripe_ids(
+            result,
+            links,
+            missing,
+            version
+        )
+
+    async def aget_stripe_ids_for(
+        self,
+        item_ids: Iterable[int]
+    ) -> dict[int, list[str]]:
+        """Async ``get_stripe_ids_for`` syncing taxes concurrently."""
+
+        version: int = await sync_to_async(get_version)('tax')
+        result: dict[int, list[str]]
+        missing: list[int]
+        result, missing = self._get_cached_stripe_ids(item_ids, version)
+        if not missing:
+            return result
+
+        links: list = [link async for link in self._get_links(missing)]
+        taxes: dict[int, Tax] = {}
+        for link in links:
+            link.tax = taxes.setdefault(link.tax_id, link.tax)
+
+        stripe_ids: dict[int, str] = {
+            tax.id: tax.stripe_id for tax in taxes.values()
+        }
+        await asyncio.gather(*(
+            sync_to_async(tax.sync_stripe, thread_sensitive=False)(
+                commit=False
+            )
+            for tax in taxes.values()
+        ))
+        changed: list[Tax] = [
+            tax for tax in taxes.values()
+            if tax.stripe_id != stripe_ids[tax.id]
+        ]
+        if changed:
+            await Tax.objects.abulk_update(
+                changed,
+                ('stripe_id', 'stripe_fingerprint')
+            )
+
+        return self._set_cached_stripe_ids(
+            result,
+            links,
+            missing,
+            version
+        )
+
 
 class Tax(models.Model):
     """Tax for item."""
@@ -319,6 +904,23 @@ class Tax(models.Model):
     description = models.TextField(
         verbose_name='описание'
     )
+    stripe_id = models.CharField(
+        verbose_name="stripe id",
+        max_length=255,
+        blank=True,
+        editable=False
+    )
+    stripe_fingerprint = models.CharField(
+        verbose_name="stripe отпечаток",
+        max_length=64,
+        blank=True,
+        editable=False
+    )
+    updated_at = models.DateTimeField(
+        verbose_name="время изменения",
+        auto_now=True
+    )
+    objects = TaxManager()
 
     class Meta:
         ordering = (
@@ -336,3 +938,188 @@ class Tax(models.Model):
             result += i.name
 
         return result
+
+    @property
+    def fingerprint(self) -> str:
+        return get_fingerprint(
+            self.display_name,
+            self.inclusive,
+            self.percentage,
+            self.country,
+            self.description,
+        )
+
+    def sync_stripe(self, commit: bool = True) -> str:
+        """Creates Stripe TaxRate once and recreates it on change."""
+
+        fingerprint: str = self.fingerprint
+        if self.stripe_id and self.stripe_fingerprint == fingerprint:
+            return self.stripe_id
+
+        stripe_tax = get_gateway().create_tax_rate(
+            display_name=self.display_name,
+            inclusive=self.inclusive,
+            percentage=self.percentage,
+            country=self.country,
+            description=self.description,
+        )
+        if self.stripe_id:
+            try:
+                get_gateway().archive_tax_rate(self.stripe_id)
+            except stripe.error.InvalidRequestError:
+                pass
+
+        self.stripe_id = stripe_tax.id
+        self.stripe_fingerprint = fingerprint
+        if commit:
+            Tax.objects.filter(id=self.id).update(
+                stripe_id=self.stripe_id,
+                stripe_fingerprint=self.stripe_fingerprint
+            )
+        return self.stripe_id
+
+
+class Payment(models.Model):
+    """Stripe checkout session and its payment state."""
+
+    PENDING = 'pending'
+    PAID = 'paid'
+    FAILED = 'failed'
+    EXPIRED = 'expired'
+    STATUSES = (
+        (PENDING, 'ожидает оплаты'),
+        (PAID, 'оплачен'),
+        (FAILED, 'ошибка оплаты'),
+        (EXPIRED, 'истёк'),
+    )
+
+    order = models.ForeignKey(
+        to=Order,
+        on_delete=models.SET_NULL,
+        verbose_name="заказ",
+        related_name='payments',
+        null=True,
+        blank=True
+    )
+    stripe_session_id = models.CharField(
+        verbose_name="stripe сессия",
+        max_length=255,
+        unique=True
+    )
+    stripe_payment_intent_id = models.CharField(
+        verbose_name="stripe платёж",
+        max_length=255,
+        blank=True
+    )
+    status = models.CharField(
+        verbose_name="статус",
+        max_length=16,
+        choices=STATUSES
+    )
+    amount_total = models.PositiveIntegerField(
+        verbose_name="сумма, центы",
+        default=0
+    )
+    currency = models.CharField(
+        verbose_name="валюта",
+        max_length=3,
+        blank=True
+    )
+    event_created = models.DateTimeField(
+        verbose_name="время события"
+    )
+    updated_at = models.DateTimeField(
+        verbose_name="время изменения",
+        auto_now=True
+    )
+
+    class Meta:
+        ordering = (
+            '-event_created',
+        )
+        verbose_name = 'платёж'
+        verbose_name_plural = 'платежи'
+
+    def __str__(self) -> str:
+        return f'Payment {self.stripe_session_id}: {self.status}'
+
+
+class WebhookEvent(models.Model):
+    """Stripe webhook event queued until a worker processes it."""
+
+    stripe_id = models.CharField(
+        verbose_name="stripe id",
+        max_length=255,
+        unique=True
+    )
+    type = models.CharField(
+        verbose_name="тип",
+        max_length=255
+    )
+    payload = models.JSONField(
+        verbose_name="данные"
+    )
+    received_at = models.DateTimeField(
+        verbose_name="время получения",
+        auto_now_add=True
+    )
+    processed_at = models.DateTimeField(
+        verbose_name="время обработки",
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        ordering = (
+            'id',
+        )
+        indexes = (
+            models.Index(
+                fields=('processed_at', 'id'),
+                name='webhook_event_queue_idx'
+            ),
+        )
+        verbose_name = 'событие stripe'
+        verbose_name_plural = 'события stripe'
+
+    def __str__(self) -> str:
+        return f'{self.type} {self.stripe_id}'
+
+
+class ReconcileCursor(models.Model):
+    """Position of a reconciliation scan in one window of Stripe objects."""
+
+    resource = models.CharField(
+        verbose_name="ресурс",
+        max_length=64
+    )
+    created_gte = models.PositiveBigIntegerField(
+        verbose_name="создан с"
+    )
+    created_lt = models.PositiveBigIntegerField(
+        verbose_name="создан до"
+    )
+    starting_after = models.CharField(
+        verbose_name="последний id",
+        max_length=255,
+        blank=True
+    )
+    done = models.BooleanField(
+        verbose_name="завершён",
+        default=False
+    )
+    updated_at = models.DateTimeField(
+        verbose_name="время изменения",
+        auto_now=True
+    )
+
+    class Meta:
+        unique_together = (
+            'resource',
+            'created_gte',
+        )
+        verbose_name = 'курсор сверки'
+        verbose_name_plural = 'курсоры сверки'
+
+    def __str__(self) -> str:
+        return f'{self.resource} [{self.created_gte}, {self.created_lt})'
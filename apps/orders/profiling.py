@@ -0,0 +1,201 @@
+# Python
+from typing import (
+    Any,
+    Optional,
+)
+from collections import Counter
+from functools import lru_cache
+from threading import (
+    Event,
+    Lock,
+    Thread,
+    get_ident,
+)
+from types import FrameType
+import asyncio
+import sys
+import time
+
+# Django
+from django.conf import settings
+from django.core import signing
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_SALT = 'orders.profiling'
+
+# Stacks of one endpoint beyond MAX_STACKS are counted under this name.
+TRUNCATED = '[truncated]'
+
+
+def get_stack(frame: Optional[FrameType], max_depth: int) -> str:
+    """Collapsed stack of a frame, root first, like ``a;b;c``."""
+
+    names: list[str] = []
+    while frame is not None and len(names) < max_depth:
+        code = frame.f_code
+        names.append(
+            f'{frame.f_globals.get("__name__", "?")}:{code.co_qualname}'
+        )
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler:
+    """Thread sampling the stacks of registered threads periodically.
+
+    It sleeps on an event while no thread is registered, so requests
+    that are not profiled cost nothing here. A thread registered with
+    an asyncio task is sampled only while that task runs on it.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64) -> None:
+        self.interval: float = interval
+        self.max_depth: int = max_depth
+        self._targets: dict[
+            tuple[int, Optional[asyncio.Task]],
+            Counter
+        ] = {}
+        self._lock: Lock = Lock()
+        self._wakeup: Event = Event()
+        self._thread: Optional[Thread] = None
+
+    def start(
+        self,
+        samples: Counter,
+        task: Optional[asyncio.Task] = None
+    ) -> None:
+        """Samples the calling thread into ``samples`` until ``stop``."""
+
+        with self._lock:
+            self._targets[get_ident(), task] = samples
+            if self._thread is None:
+                self._thread = Thread(
+                    target=self.run,
+                    name='profiling-sampler',
+                    daemon=True
+                )
+                self._thread.start()
+        self._wakeup.set()
+
+    def stop(self, task: Optional[asyncio.Task] = None) -> None:
+        with self._lock:
+            self._targets.pop((get_ident(), task), None)
+
+    def sample(self) -> None:
+        frames: dict[int, FrameType] = sys._current_frames()
+        with self._lock:
+            thread_id: int
+            task: Optional[asyncio.Task]
+            samples: Counter
+            for (thread_id, task), samples in self._targets.items():
+                if task is not None and (
+                    asyncio.current_task(task.get_loop()) is not task
+                ):
+                    continue
+                frame: Optional[FrameType] = frames.get(thread_id)
+                if frame is not None:
+                    samples[get_stack(frame, self.max_depth)] += 1
+
+    def run(self) -> None:
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while self._targets:
+                time.sleep(self.interval)
+                self.sample()
+
+
+class ProfileStore:
+    """Collapsed stacks and their sample counts per endpoint."""
+
+    def __init__(self, max_stacks: int = 5000) -> None:
+        self.max_stacks: int = max_stacks
+        self.stacks: dict[str, Counter] = {}
+        self.requests: Counter = Counter()
+        self._lock: Lock = Lock()
+
+    def add(self, endpoint: str, samples: Counter) -> None:
+        with self._lock:
+            self.requests[endpoint] += 1
+            stacks: Counter = self.stacks.setdefault(endpoint, Counter())
+            stack: str
+            count: int
+            for stack, count in samples.items():
+                if stack not in stacks and len(stacks) >= self.max_stacks:
+                    stack = TRUNCATED
+                stacks[stack] += count
+
+    def get_summary(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            return {
+                endpoint: {
+                    'requests': self.requests[endpoint],
+                    'samples': sum(stacks.values()),
+                }
+                for endpoint, stacks in self.stacks.items()
+            }
+
+    def get_collapsed(self, endpoint: str) -> str:
+        """Stacks in the collapsed format of flamegraph.pl and speedscope."""
+
+        with self._lock:
+            stacks: Counter = Counter(self.stacks.get(endpoint, ()))
+        return ''.join(
+            f'{stack} {count}\n' for stack, count in stacks.most_common()
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self.stacks.clear()
+            self.requests.clear()
+
+
+class Profiler:
+    """Decides which requests are sampled and keeps their profiles."""
+
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        interval: float = 0.005,
+        max_depth: int = 64,
+        max_stacks: int = 5000,
+        token_max_age: int = 60 * 60
+    ) -> None:
+
+        self.sample_rate: float = sample_rate
+        self.token_max_age: int = token_max_age
+        self.sampler: Sampler = Sampler(interval, max_depth)
+        self.store: ProfileStore = ProfileStore(max_stacks)
+
+    def get_token(self) -> str:
+        """Value of the header that has a request profiled."""
+
+        return signing.TimestampSigner(salt=PROFILE_SALT).sign('profile')
+
+    def is_signed(self, token: str) -> bool:
+        try:
+            signing.TimestampSigner(salt=PROFILE_SALT).unsign(
+                token,
+                max_age=self.token_max_age
+            )
+        except signing.BadSignature:
+            return False
+        return True
+
+
+@lru_cache(maxsize=None)
+def get_profiler() -> Profiler:
+    """Profiler configured by ``settings.PROFILER``."""
+
+    return Profiler(**{
+        key.lower(): value for key, value in settings.PROFILER.items()
+    })
+
+
+@receiver(setting_changed)
+def reset_profiler(setting: str, **kwargs: Any) -> None:
+    if setting == 'PROFILER':
+        get_profiler.cache_clear()
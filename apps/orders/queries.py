@@ -0,0 +1,122 @@
+# Python
+from typing import (
+    Any,
+    Callable,
+    Optional,
+)
+from types import FrameType
+import logging
+import sys
+import time
+
+# Django
+from django.conf import settings
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpRequest
+
+
+logger = logging.getLogger(__name__)
+
+# Frames of these modules are skipped when looking for a call site: the
+# libraries and the execute wrappers of this app.
+LIBRARY_MODULES = (
+    'django.',
+    'rest_framework.',
+    'asgiref.',
+    'contextlib',
+    __name__,
+    'orders.metrics',
+    'orders.tracing',
+)
+
+
+def get_call_site(frame: Optional[FrameType] = None) -> str:
+    """First frame outside the ORM and libraries, like ``module:line``."""
+
+    frame = frame or sys._getframe(1)
+    while frame is not None:
+        module: str = frame.f_globals.get('__name__', '')
+        if not module.startswith(LIBRARY_MODULES):
+            return (
+                f'{module}:{frame.f_lineno} in {frame.f_code.co_qualname}'
+            )
+        frame = frame.f_back
+    return 'unknown'
+
+
+def log_slow_query(
+    execute: Callable,
+    sql: str,
+    params: Any,
+    many: bool,
+    context: dict
+) -> Any:
+    """Database execute wrapper logging queries over the threshold."""
+
+    threshold: float = settings.QUERY_LOG['SLOW_THRESHOLD']
+    if not threshold:
+        return execute(sql, params, many, context)
+
+    start: float = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration: float = time.perf_counter() - start
+        if duration >= threshold:
+            call_site: str = get_call_site()
+            logger.warning(
+                'Slow query took %.3f seconds at %s',
+                duration,
+                call_site,
+                extra={
+                    'duration': round(duration, 6),
+                    'call_site': call_site,
+                    'sql': sql[:settings.QUERY_LOG['MAX_SQL_LENGTH']],
+                    'database': context['connection'].alias,
+                }
+            )
+
+
+@receiver(connection_created)
+def install_slow_query_logger(
+    connection: BaseDatabaseWrapper,
+    **kwargs: Any
+) -> None:
+    if log_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(log_slow_query)
+
+
+def get_url_name(request: HttpRequest) -> str:
+    """Namespaced URL name, like ``admin:orders_tax_changelist``."""
+
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else ''
+
+
+def get_query_budget(request: HttpRequest) -> Optional[int]:
+    """Most queries the view of the request may make, if declared."""
+
+    return settings.QUERY_BUDGETS.get(get_url_name(request))
+
+
+def check_query_budget(request: HttpRequest, count: int) -> bool:
+    """Logs the request when it made more queries than its budget."""
+
+    budget: Optional[int] = get_query_budget(request)
+    if budget is None or count <= budget:
+        return True
+
+    logger.warning(
+        'Query budget of %s exceeded: %d > %d',
+        get_url_name(request),
+        count,
+        budget,
+        extra={
+            'url_name': get_url_name(request),
+            'queries': count,
+            'budget': budget,
+        }
+    )
+    return False
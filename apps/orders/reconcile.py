@@ -0,0 +1,379 @@
+# Python
+from typing import (
+    Callable,
+    Iterable,
+    Optional,
+)
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass
+import datetime
+import logging
+import time
+
+# Django
+from django.db import transaction
+from django.utils import timezone
+
+# Stripe
+from stripe.stripe_object import StripeObject
+
+# Local
+from .caches import invalidate_version
+from .gateway import get_gateway
+from .models import (
+    Discount,
+    Order,
+    Payment,
+    ReconcileCursor,
+)
+from .webhooks import (
+    ORDER_STATUSES,
+    PAID_SESSION_STATUSES,
+)
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+PAYMENT_FIELDS = (
+    'order',
+    'stripe_payment_intent_id',
+    'status',
+    'amount_total',
+    'currency',
+    'event_created',
+    'updated_at',
+)
+
+# Payment statuses of one order's sessions, the first found wins.
+STATUS_PRIORITY = (
+    Payment.PAID,
+    Payment.PENDING,
+    Payment.FAILED,
+    Payment.EXPIRED,
+)
+
+
+@dataclass
+class ReconcileResult:
+    """Counters of one reconciliation run."""
+
+    pages: int = 0
+    checked: int = 0
+    fixed: int = 0
+
+
+def get_session_status(session: StripeObject) -> Optional[str]:
+    """Payment status of a checkout session, None while it is open."""
+
+    if session.get('status') == 'expired':
+        return Payment.EXPIRED
+    if session.get('status') != 'complete':
+        return None
+    if session.get('payment_status') in PAID_SESSION_STATUSES:
+        return Payment.PAID
+    return Payment.PENDING
+
+
+def get_created(obj: StripeObject) -> datetime.datetime:
+    """Creation time of a Stripe object.
+
+    Payments fixed from an object are dated by it rather than by the
+    run, so webhook events created after it still apply.
+    """
+
+    return datetime.datetime.fromtimestamp(
+        obj.get('created') or 0,
+        tz=datetime.timezone.utc
+    )
+
+
+def get_order_fixes(
+    statuses: dict[int, set[str]],
+    now: datetime.datetime
+) -> list[Order]:
+    """Orders whose status differs from what their payments say."""
+
+    fixed: list[Order] = []
+    order: Order
+    for order in Order.objects.filter(id__in=statuses).only('id', 'status'):
+        if order.status == Order.PAID:
+            continue
+
+        payment_statuses: set[str] = statuses[order.id]
+        status: str = ORDER_STATUSES[next(
+            status for status in STATUS_PRIORITY
+            if status in payment_statuses
+        )]
+        if order.status != status:
+            order.status = status
+            order.updated_at = now
+            fixed.append(order)
+
+    return fixed
+
+
+def save_order_fixes(orders: list[Order]) -> int:
+    if orders:
+        Order.objects.bulk_update(orders, ('status', 'updated_at'))
+        invalidate_version('order')
+    return len(orders)
+
+
+def reconcile_sessions(sessions: list[StripeObject]) -> int:
+    """Brings payments and orders in line with checkout sessions."""
+
+    now: datetime.datetime = timezone.now()
+    payments: dict[str, Payment] = Payment.objects.in_bulk(
+        [session.id for session in sessions],
+        field_name='stripe_session_id'
+    )
+    order_ids: set[int] = set(Order.objects.filter(
+        id__in={
+            int(session.get('client_reference_id')) for session in sessions
+            if (session.get('client_reference_id') or '').isdigit()
+        }
+    ).values_list('id', flat=True))
+
+    created: list[Payment] = []
+    changed: list[Payment] = []
+    statuses: dict[int, set[str]] = {}
+    session: StripeObject
+    for session in sessions:
+        status: Optional[str] = get_session_status(session)
+        if not status:
+            continue
+
+        reference: str = session.get('client_reference_id') or ''
+        order_id: Optional[int] = (
+            int(reference) if reference.isdigit()
+            and int(reference) in order_ids else None
+        )
+        fields: dict = {
+            'order_id': order_id,
+            'stripe_payment_intent_id': session.get('payment_intent') or '',
+            'status': status,
+            'amount_total': session.get('amount_total') or 0,
+            'currency': session.get('currency') or '',
+        }
+        payment: Optional[Payment] = payments.get(session.id)
+        if payment is None:
+            created.append(Payment(
+                stripe_session_id=session.id,
+                event_created=get_created(session),
+                **fields
+            ))
+        elif any(getattr(payment, k) != v for k, v in fields.items()):
+            for field, value in fields.items():
+                setattr(payment, field, value)
+            payment.event_created = max(
+                payment.event_created,
+                get_created(session)
+            )
+            payment.updated_at = now
+            changed.append(payment)
+
+        if order_id:
+            statuses.setdefault(order_id, set()).add(status)
+
+    Payment.objects.bulk_create(created)
+    Payment.objects.bulk_update(changed, PAYMENT_FIELDS)
+    return (
+        len(created)
+        + len(changed)
+        + save_order_fixes(get_order_fixes(statuses, now))
+    )
+
+
+def reconcile_payment_intents(intents: list[StripeObject]) -> int:
+    """Marks payments paid or failed by the state of their intents."""
+
+    now: datetime.datetime = timezone.now()
+    settled: dict[str, StripeObject] = {
+        intent.id: intent for intent in intents
+        if intent.status in ('succeeded', 'canceled')
+    }
+    intent_statuses: dict[str, str] = {
+        id: Payment.PAID if intent.status == 'succeeded'
+        else Payment.FAILED
+        for id, intent in settled.items()
+    }
+    changed: list[Payment] = []
+    statuses: dict[int, set[str]] = {}
+    payment: Payment
+    for payment in Payment.objects.filter(
+        stripe_payment_intent_id__in=intent_statuses
+    ):
+        status: str = intent_statuses[payment.stripe_payment_intent_id]
+        if payment.status != status and payment.status != Payment.PAID:
+            payment.status = status
+            payment.event_created = max(
+                payment.event_created,
+                get_created(settled[payment.stripe_payment_intent_id])
+            )
+            payment.updated_at = now
+            changed.append(payment)
+        if payment.order_id:
+            statuses.setdefault(payment.order_id, set()).add(status)
+
+    Payment.objects.bulk_update(changed, PAYMENT_FIELDS)
+    return len(changed) + save_order_fixes(get_order_fixes(statuses, now))
+
+
+def reconcile_coupons(coupons: list[StripeObject]) -> int:
+    """Forgets coupons that no longer match their discounts.
+
+    Cleared discounts get a fresh coupon on their next checkout, in
+    every process.
+    """
+
+    discounts: dict[str, Discount] = {
+        discount.stripe_coupon_id: discount
+        for discount in Discount.objects.filter(
+            stripe_coupon_id__in=[coupon.id for coupon in coupons]
+        )
+    }
+    stale: list[Discount] = []
+    coupon: StripeObject
+    for coupon in coupons:
+        discount: Optional[Discount] = discounts.get(coupon.id)
+        if discount and (
+            not coupon.get('valid', True)
+            or coupon.get('percent_off') != discount.persent
+        ):
+            stale.append(discount)
+
+    for discount in stale:
+        discount.stripe_coupon_id = ''
+        discount.stripe_fingerprint = ''
+    Discount.objects.bulk_update(
+        stale,
+        ('stripe_coupon_id', 'stripe_fingerprint')
+    )
+    if stale:
+        # Coupon ids are cached per process and in cached discounts.
+        invalidate_version('coupon')
+        invalidate_version('discount')
+    return len(stale)
+
+
+# Resource name -> Stripe object name and its reconcile function.
+RESOURCES: dict[str, tuple[str, Callable[[list], int]]] = {
+    'sessions': ('checkout.Session', reconcile_sessions),
+    'payment_intents': ('PaymentIntent', reconcile_payment_intents),
+    'coupons': ('Coupon', reconcile_coupons),
+}
+
+
+class Reconciler:
+    """Pages through Stripe objects of one resource and fixes local state.
+
+    The created-time range is split into windows paged concurrently,
+    each with its own cursor. Pages are applied in the calling thread,
+    and a cursor is saved with the fixes of its page, so an interrupted
+    run resumes where it stopped.
+    """
+
+    def __init__(
+        self,
+        resource: str,
+        since: int,
+        until: int,
+        partitions: int = 8,
+        page_size: int = 100,
+        workers: int = 8
+    ) -> None:
+
+        self.resource: str = resource
+        self.stripe_resource: str
+        self.reconcile: Callable[[list], int]
+        self.stripe_resource, self.reconcile = RESOURCES[resource]
+        self.since: int = since
+        self.until: int = until
+        self.partitions: int = partitions
+        self.page_size: int = page_size
+        self.workers: int = workers
+
+    def get_cursors(self) -> list[ReconcileCursor]:
+        """Unfinished cursors of the resource, or new ones if none."""
+
+        cursors: list[ReconcileCursor] = list(
+            ReconcileCursor.objects.filter(
+                resource=self.resource,
+                done=False
+            )
+        )
+        if cursors:
+            return cursors
+
+        ReconcileCursor.objects.filter(resource=self.resource).delete()
+        step: float = (self.until - self.since) / self.partitions
+        bounds: list[int] = sorted({
+            self.since + int(step * i) for i in range(self.partitions)
+        } | {self.until})
+        ReconcileCursor.objects.bulk_create(
+            ReconcileCursor(
+                resource=self.resource,
+                created_gte=gte,
+                created_lt=lt
+            ) for gte, lt in zip(bounds, bounds[1:])
+        )
+        return list(ReconcileCursor.objects.filter(resource=self.resource))
+
+    def fetch(self, cursor: ReconcileCursor) -> StripeObject:
+        params: dict = {
+            'limit': self.page_size,
+            'created': {
+                'gte': cursor.created_gte,
+                'lt': cursor.created_lt,
+            },
+        }
+        if cursor.starting_after:
+            params['starting_after'] = cursor.starting_after
+
+        return get_gateway().list_objects(self.stripe_resource, **params)
+
+    def apply(self, cursor: ReconcileCursor, page: StripeObject) -> int:
+        with transaction.atomic():
+            fixed: int = self.reconcile(page.data) if page.data else 0
+            if page.data:
+                cursor.starting_after = page.data[-1].id
+            cursor.done = not page.has_more
+            cursor.save(update_fields=('starting_after', 'done', 'updated_at'))
+
+        return fixed
+
+    def run(self) -> ReconcileResult:
+        result: ReconcileResult = ReconcileResult()
+        start: float = time.monotonic()
+        with ThreadPoolExecutor(self.workers) as executor:
+            futures: dict[Future, ReconcileCursor] = {
+                executor.submit(self.fetch, cursor): cursor
+                for cursor in self.get_cursors()
+            }
+            while futures:
+                done: Iterable[Future]
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                future: Future
+                for future in done:
+                    cursor: ReconcileCursor = futures.pop(future)
+                    page: StripeObject = future.result()
+                    result.pages += 1
+                    result.checked += len(page.data)
+                    result.fixed += self.apply(cursor, page)
+                    if not cursor.done:
+                        futures[executor.submit(self.fetch, cursor)] = cursor
+
+        logger.info(
+            'Reconciled %s: %s objects in %s pages, %s fixes, %.1fs',
+            self.resource,
+            result.checked,
+            result.pages,
+            result.fixed,
+            time.monotonic() - start
+        )
+        return result
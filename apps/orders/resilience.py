@@ -0,0 +1,294 @@
+# Python
+from typing import (
+    Any,
+    Optional,
+)
+from collections import deque
+from threading import Lock
+import logging
+import random
+import time
+import uuid
+
+# Django
+from django.utils.module_loading import import_string
+
+# Stripe
+import stripe
+from stripe.stripe_object import StripeObject
+
+# Local
+from .gateway import StripeGateway
+from .http_client import request_deadline
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(stripe.error.StripeError):
+    """Raised without calling Stripe while the circuit is open."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(
+            f'Stripe circuit is open, retry after {retry_after:.0f}s'
+        )
+        self.retry_after: float = retry_after
+
+
+class CircuitBreaker:
+    """Fails fast once the error rate of recent calls is too high.
+
+    After ``reset_timeout`` seconds open, one probe call is let through;
+    its success closes the circuit and its failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        min_calls: int = 20,
+        window: float = 30.0,
+        reset_timeout: float = 30.0
+    ) -> None:
+
+        self.failure_rate: float = failure_rate
+        self.min_calls: int = min_calls
+        self.window: float = window
+        self.reset_timeout: float = reset_timeout
+        self.state: str = self.CLOSED
+        self.opened_at: float = 0.0
+        self._outcomes: deque[tuple[float, bool]] = deque()
+        self._probing: bool = False
+        self._lock: Lock = Lock()
+
+    def _prune(self, now: float) -> None:
+        while self._outcomes and self._outcomes[0][0] <= now - self.window:
+            self._outcomes.popleft()
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning('Stripe circuit %s -> %s', self.state, state)
+        self.state = state
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError unless a call may go through."""
+
+        with self._lock:
+            now: float = time.monotonic()
+            if self.state == self.OPEN:
+                retry_after: float = self.opened_at + self.reset_timeout - now
+                if retry_after > 0:
+                    raise CircuitOpenError(retry_after)
+                self._set_state(self.HALF_OPEN)
+
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpenError(self.reset_timeout)
+                self._probing = True
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            now: float = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                self._outcomes.clear()
+                if success:
+                    self._set_state(self.CLOSED)
+                else:
+                    self.opened_at = now
+                    self._set_state(self.OPEN)
+                return
+
+            self._outcomes.append((now, success))
+            self._prune(now)
+            failures: int = sum(not ok for _, ok in self._outcomes)
+            if (
+                self.state == self.CLOSED
+                and len(self._outcomes) >= self.min_calls
+                and failures >= self.failure_rate * len(self._outcomes)
+            ):
+                self.opened_at = now
+                self._set_state(self.OPEN)
+
+    def get_stats(self) -> dict[str, Any]:
+        with self._lock:
+            self._prune(time.monotonic())
+            return {
+                'state': self.state,
+                'calls': len(self._outcomes),
+                'failures': sum(not ok for _, ok in self._outcomes),
+            }
+
+
+class RetryBudget:
+    """Caps retries to a share of recent calls plus a small floor.
+
+    Keeps retries from multiplying load when Stripe is already
+    struggling, unlike a fixed retry count per call.
+    """
+
+    def __init__(
+        self,
+        ratio: float = 0.2,
+        min_per_second: float = 1.0,
+        window: float = 10.0
+    ) -> None:
+
+        self.ratio: float = ratio
+        self.min_per_second: float = min_per_second
+        self.window: float = window
+        self._calls: deque[float] = deque()
+        self._retries: deque[float] = deque()
+        self._lock: Lock = Lock()
+
+    def _prune(self, now: float) -> None:
+        for events in (self._calls, self._retries):
+            while events and events[0] <= now - self.window:
+                events.popleft()
+
+    def record_call(self) -> None:
+        with self._lock:
+            self._calls.append(time.monotonic())
+
+    def withdraw(self) -> bool:
+        """Takes one retry from the budget if any is left."""
+
+        with self._lock:
+            now: float = time.monotonic()
+            self._prune(now)
+            allowed: float = (
+                self.min_per_second * self.window
+                + self.ratio * len(self._calls)
+            )
+            if len(self._retries) >= allowed:
+                return False
+
+            self._retries.append(now)
+            return True
+
+    def get_stats(self) -> dict[str, int]:
+        with self._lock:
+            self._prune(time.monotonic())
+            return {
+                'calls': len(self._calls),
+                'retries': len(self._retries),
+            }
+
+
+class ResilientGateway(StripeGateway):
+    """Wraps another gateway with deadlines, retries and a breaker.
+
+    Connection errors, rate limits and Stripe server errors are
+    retried with jittered exponential backoff while the retry budget
+    and the call deadline allow. Creates get an idempotency key, so a
+    retried request never creates an object twice.
+    """
+
+    RETRYABLE_ERRORS = (
+        stripe.error.APIConnectionError,
+        stripe.error.RateLimitError,
+        stripe.error.APIError,
+    )
+
+    def __init__(
+        self,
+        backend: str = 'orders.gateway.StripeAPIGateway',
+        options: Optional[dict] = None,
+        deadline: float = 10.0,
+        max_retries: int = 2,
+        backoff: float = 0.2,
+        max_backoff: float = 2.0,
+        retry_ratio: float = 0.2,
+        failure_rate: float = 0.5,
+        min_calls: int = 20,
+        window: float = 30.0,
+        reset_timeout: float = 30.0
+    ) -> None:
+
+        self.backend: StripeGateway = import_string(backend)(
+            **(options or {})
+        )
+        self.deadline: float = deadline
+        self.max_retries: int = max_retries
+        self.backoff: float = backoff
+        self.max_backoff: float = max_backoff
+        self.breaker: CircuitBreaker = CircuitBreaker(
+            failure_rate=failure_rate,
+            min_calls=min_calls,
+            window=window,
+            reset_timeout=reset_timeout
+        )
+        self.budget: RetryBudget = RetryBudget(
+            ratio=retry_ratio,
+            window=window
+        )
+
+    def get_stats(self) -> dict[str, Any]:
+        """Breaker and retry budget state for monitoring."""
+
+        return {
+            'breaker': self.breaker.get_stats(),
+            'budget': self.budget.get_stats(),
+        }
+
+    def get_backoff(self, attempt: int) -> float:
+        return random.uniform(
+            0,
+            min(self.max_backoff, self.backoff * 2 ** attempt)
+        )
+
+    def call(
+        self,
+        method: str,
+        *args: Any,
+        **params: Any
+    ) -> StripeObject:
+
+        if method.endswith('.create') and self.max_retries:
+            params.setdefault('idempotency_key', uuid.uuid4().hex)
+
+        deadline: float = time.monotonic() + self.deadline
+        token = request_deadline.set(deadline)
+        self.budget.record_call()
+        try:
+            attempt: int = 0
+            while True:
+                self.breaker.before_call()
+                try:
+                    response: StripeObject = self.backend.call(
+                        method,
+                        *args,
+                        **params
+                    )
+                except self.RETRYABLE_ERRORS as e:
+                    self.breaker.record(False)
+                    delay: float = self.get_backoff(attempt)
+                    if (
+                        attempt >= self.max_retries
+                        or time.monotonic() + delay >= deadline
+                        or not self.budget.withdraw()
+                    ):
+                        raise
+                    logger.info(
+                        'Retrying %s after %s in %.2fs',
+                        method,
+                        type(e).__name__,
+                        delay
+                    )
+                    time.sleep(delay)
+                    attempt += 1
+                except stripe.error.StripeError:
+                    # Stripe answered, so it is up; the request was wrong
+                    self.breaker.record(True)
+                    raise
+                except Exception:
+                    self.breaker.record(False)
+                    raise
+                else:
+                    self.breaker.record(True)
+                    return response
+        finally:
+            request_deadline.reset(token)
@@ -0,0 +1,166 @@
+# Python
+from typing import (
+    Iterable,
+    Optional,
+)
+from threading import (
+    Event,
+    Thread,
+)
+import datetime
+import logging
+
+# Django
+from django.db.models import (
+    Min,
+    QuerySet,
+)
+from django.utils import timezone
+
+# Local
+from .caches import invalidate_version
+from .models import (
+    Item,
+    Discount,
+    DiscountItem,
+)
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+def refresh_effective_prices(
+    item_ids: Optional[Iterable[int]] = None,
+    now: Optional[datetime.datetime] = None,
+    batch_size: int = 500
+) -> int:
+    """Materializes discounted price of items, returns changed count."""
+
+    now = now or timezone.now()
+    items: QuerySet[Item] = Item.objects.only(
+        'id',
+        'price',
+        'effective_price',
+        'updated_at',
+    ).order_by('id')
+    if item_ids is not None:
+        items = items.filter(id__in=list(item_ids))
+
+    changed: int = 0
+    last_id: int = 0
+    while batch := list(items.filter(id__gt=last_id)[:batch_size]):
+        last_id = batch[-1].id
+        disconts: dict[int, Discount] = Discount.objects.active_for(
+            [item.id for item in batch],
+            now=now
+        )
+        updated: list[Item] = []
+        item: Item
+        for item in batch:
+            discont: Optional[Discount] = disconts.get(item.id)
+            price = discont.get_discounted_price(
+                item.price
+            ) if discont else item.price
+            if item.effective_price != price:
+                item.effective_price = price
+                item.updated_at = now
+                updated.append(item)
+
+        Item.objects.bulk_update(updated, ('effective_price', 'updated_at'))
+        changed += len(updated)
+
+    if changed:
+        invalidate_version('item')
+    return changed
+
+
+def get_next_boundary(
+    now: datetime.datetime
+) -> Optional[datetime.datetime]:
+    """Nearest moment when some discount ends."""
+
+    return DiscountItem.objects.filter(
+        datetime_ending__gt=now
+    ).aggregate(
+        boundary=Min('datetime_ending')
+    )['boundary']
+
+
+class DiscountScheduler:
+    """Expires discounts at their ending times without a broker.
+
+    Discounts start when they are saved (signals refresh prices right
+    away), so the scheduler only has to catch endings.
+    """
+
+    def __init__(self, poll_interval: float = 60) -> None:
+        self.poll_interval: float = poll_interval
+        self.last_run: Optional[datetime.datetime] = None
+        self._stop: Event = Event()
+
+    def run_once(
+        self,
+        now: Optional[datetime.datetime] = None
+    ) -> int:
+        """Refreshes items whose discounts ended since the last run."""
+
+        now = now or timezone.now()
+        item_ids: Optional[list[int]] = None
+        if self.last_run is not None:
+            item_ids = list(
+                DiscountItem.objects.filter(
+                    datetime_ending__gt=self.last_run,
+                    datetime_ending__lte=now
+                ).values_list(
+                    'item_id',
+                    flat=True
+                ).distinct()
+            )
+
+        changed: int = 0
+        if item_ids is None or item_ids:
+            changed = refresh_effective_prices(item_ids, now=now)
+            invalidate_version('discount')
+
+        self.last_run = now
+        return changed
+
+    def get_timeout(self, now: datetime.datetime) -> float:
+        boundary: Optional[datetime.datetime] = get_next_boundary(now)
+        if boundary is None:
+            return self.poll_interval
+
+        return max(
+            0.0,
+            min(
+                self.poll_interval,
+                (boundary - now).total_seconds()
+            )
+        )
+
+    def run(self) -> None:
+        """Runs until stopped, waking up at the next discount ending."""
+
+        while not self._stop.is_set():
+            try:
+                changed: int = self.run_once()
+                if changed:
+                    logger.info('Effective prices updated: %s', changed)
+            except Exception:
+                logger.exception('Discount scheduler run failed')
+
+            self._stop.wait(self.get_timeout(timezone.now()))
+
+    def start(self) -> Thread:
+        """Runs the scheduler in a daemon thread of this process."""
+
+        thread: Thread = Thread(
+            target=self.run,
+            name='discount-scheduler',
+            daemon=True
+        )
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,175 @@
+# Python
+from typing import (
+    Any,
+    Optional,
+)
+
+# Django
+from django.db.models.signals import (
+    post_save,
+    post_delete,
+    m2m_changed,
+)
+from django.db.models import (
+    OuterRef,
+    QuerySet,
+    Subquery,
+)
+from django.dispatch import receiver
+
+# Local
+from .caches import (
+    tax_rates_cache,
+    invalidate_version,
+)
+from .models import (
+    Item,
+    Order,
+    OrderLine,
+    Discount,
+    DiscountItem,
+    Tax,
+)
+from .scheduler import refresh_effective_prices
+
+
+@receiver(post_save, sender=Tax)
+@receiver(post_delete, sender=Tax)
+@receiver(m2m_changed, sender=Tax.item.through)
+def invalidate_tax_rates(**kwargs: dict) -> None:
+    """Drop cached Stripe TaxRate ids and pages when taxes change."""
+
+    tax_rates_cache.clear()
+    invalidate_version('tax')
+
+
+@receiver(m2m_changed, sender=DiscountItem)
+def fill_discount_item_endings(action: str, **kwargs: dict) -> None:
+    """Copies ending time to rows created by ``Discount.item.add``."""
+
+    if action != 'post_add':
+        return
+
+    DiscountItem.objects.filter(
+        datetime_ending__isnull=True
+    ).update(
+        datetime_ending=Subquery(
+            Discount.objects.filter(
+                id=OuterRef('discount_id')
+            ).values(
+                'datetime_ending'
+            )[:1]
+        )
+    )
+
+
+@receiver(post_delete, sender=OrderLine)
+def update_order_total(
+    instance: OrderLine,
+    **kwargs: dict
+) -> None:
+    """Recalculates the total after any delete, cascades included."""
+
+    Order.objects.update_total(instance.order_id)
+
+
+@receiver(post_save, sender=Item)
+def refresh_item_price(
+    instance: Item,
+    created: bool,
+    raw: bool = False,
+    **kwargs: dict
+) -> None:
+    """Recalculates effective price after the price changes."""
+
+    if not created and not raw:
+        refresh_effective_prices((instance.id,))
+
+
+@receiver(post_save, sender=Discount)
+def refresh_discount_prices(
+    instance: Discount,
+    raw: bool = False,
+    **kwargs: dict
+) -> None:
+    """Copies the ending time to the links, then reprices the items.
+
+    Endings go first: prices are refreshed from the links.
+    """
+
+    if raw:
+        return
+
+    links: QuerySet[DiscountItem] = DiscountItem.objects.filter(
+        discount=instance
+    )
+    links.exclude(
+        datetime_ending=instance.datetime_ending
+    ).update(
+        datetime_ending=instance.datetime_ending
+    )
+    refresh_effective_prices(links.values_list('item_id', flat=True))
+
+
+@receiver(post_save, sender=DiscountItem)
+@receiver(post_delete, sender=DiscountItem)
+def refresh_discount_item_price(
+    instance: DiscountItem,
+    raw: bool = False,
+    **kwargs: dict
+) -> None:
+    if not raw:
+        refresh_effective_prices((instance.item_id,))
+
+
+@receiver(m2m_changed, sender=DiscountItem)
+def refresh_discount_items_prices(
+    instance: Any,
+    action: str,
+    reverse: bool,
+    pk_set: Optional[set],
+    **kwargs: dict
+) -> None:
+    """Refreshes prices of items linked or unlinked via the M2M API."""
+
+    if action == 'pre_clear':
+        instance._cleared_item_ids = (
+            (instance.id,) if reverse else list(
+                instance.item.values_list('id', flat=True)
+            )
+        )
+    elif action == 'post_clear':
+        refresh_effective_prices(instance._cleared_item_ids)
+    elif action in ('post_add', 'post_remove'):
+        refresh_effective_prices(
+            (instance.id,) if reverse else pk_set
+        )
+
+
+@receiver(post_save, sender=Discount)
+@receiver(post_delete, sender=Discount)
+@receiver(post_save, sender=DiscountItem)
+@receiver(post_delete, sender=DiscountItem)
+@receiver(m2m_changed, sender=DiscountItem)
+def invalidate_discounts(**kwargs: dict) -> None:
+    """Drop cached active discounts when discounts change."""
+
+    invalidate_version('discount')
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_items(**kwargs: dict) -> None:
+    """Drop cached pages when items change."""
+
+    invalidate_version('item')
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=OrderLine)
+@receiver(post_delete, sender=OrderLine)
+def invalidate_orders(**kwargs: dict) -> None:
+    """Drop cached pages when orders change."""
+
+    invalidate_version('order')
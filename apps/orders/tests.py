@@ -1,19 +1,162 @@
 # Python
 import unittest
+from unittest import mock
+from typing import Any
+from decimal import Decimal
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from threading import (
+    Event,
+    Thread,
+)
+import asyncio
+import collections
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
 import random
+import sys
+import tempfile
+import time
+import uuid
 
 # Django
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.test import (
+    TestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import (
+    IntegrityError,
+    connection,
+    transaction,
+)
 from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.utils import timezone
+
+# Stripe
+import stripe
 
 # Local
 from .models import (
     Order,
+    OrderLine,
     Item,
+    Tax,
+    Discount,
+    DiscountItem,
+    Payment,
+    ReconcileCursor,
+    WebhookEvent,
+)
+from .caches import (
+    SingleFlight,
+    bump_version,
+    coupons_cache,
+    get_version,
+    tax_rates_cache,
+)
+from .cart import CheckoutCart
+from .catalog import sync_catalog
+from .exports import (
+    EXPORT_FIELDS,
+    iter_order_rows,
+)
+from .gateway import (
+    FakeStripeGateway,
+    RecordReplayGateway,
+    StripeAPIGateway,
+    get_gateway,
+)
+from .logs import (
+    BackgroundHandler,
+    JsonFormatter,
+    RequestIdFilter,
+    request_id,
+)
+from .metrics import (
+    CACHE_REQUESTS,
+    DB_QUERIES,
+    REQUEST_DURATION,
+    Histogram,
+    Metric,
+    registry,
+)
+from .importer import (
+    IMPORTERS,
+    ImportResult,
+    read_rows,
+)
+from .http_client import (
+    PooledRequestsClient,
+    request_deadline,
+)
+from .profiling import (
+    PROFILE_HEADER,
+    ProfileStore,
+    Sampler,
+    get_profiler,
+    get_stack,
+)
+from .tracing import (
+    NOOP_SPAN,
+    current_span,
+    get_tracer,
+    parse_traceparent,
+    start_span,
+)
+from .reconcile import (
+    Reconciler,
+    ReconcileResult,
+)
+from .webhooks import (
+    process_events,
+    process_queue,
 )
+from .throttling import (
+    LocalBucketStore,
+    TokenBucket,
+)
+from .resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientGateway,
+    RetryBudget,
+)
+from .scheduler import DiscountScheduler
+
+
+class FakeGatewayMixin:
+    """Runs Stripe calls against a fresh in-process fake gateway."""
 
+    def setUp(self):
+        super().setUp()
+        gateway_settings = override_settings(STRIPE_GATEWAY={
+            'BACKEND': 'orders.gateway.FakeStripeGateway',
+        })
+        gateway_settings.enable()
+        self.addCleanup(gateway_settings.disable)
+        self.gateway: FakeStripeGateway = get_gateway()
 
-class ItemTestCase(TestCase):
+    def get_calls(self, method: str) -> list[tuple[tuple, dict]]:
+        return [
+            (args, params)
+            for name, args, params in self.gateway.calls
+            if name == method
+        ]
+
+
+class ItemTestCase(FakeGatewayMixin, TestCase):
 
     @classmethod
     def setUpTestData(cls):
@@ -51,34 +194,2282 @@ class ItemTestCase(TestCase):
             None
         )
 
-    def test_get_stripe_dict(self):
+    def test_get_line_items(self):
         item: Item = Item.objects.create(
             name='Temp',
             description='Temp description',
             price=10,
             currency='usd'
         )
-        temp_list: list[dict] = []
-        temp_list = item.get_stripe_dict(temp_list)
-        temp_list = item.get_stripe_dict(temp_list)
-        temp_list = item.get_stripe_dict(temp_list)
+        cart: CheckoutCart = CheckoutCart([item, item, item])
         self.assertEqual(
-            len(temp_list),
+            len(cart.get_line_items()),
             1
         )
 
-    def test_get_stripe_dict_quantity(self):
+    def test_get_line_items_quantity(self):
         item: Item = Item.objects.create(
             name='Temp',
             description='Temp description',
             price=10,
             currency='usd'
         )
-        temp_list: list[dict] = []
-        temp_list = item.get_stripe_dict(temp_list)
-        temp_list = item.get_stripe_dict(temp_list)
-        temp_list = item.get_stripe_dict(temp_list)
+        cart: CheckoutCart = CheckoutCart([item, item, item])
         self.assertEqual(
-            temp_list[0].get('quantity'),
+            cart.get_line_items()[0].get('quantity'),
             3
         )
+
+    def test_get_line_items_other_instances(self):
+        item: Item = Item.objects.create(
+            name='Temp',
+            description='Temp description',
+            price=10,
+            currency='usd'
+        )
+        cart: CheckoutCart = CheckoutCart()
+        cart.add(item)
+        cart.add(Item.objects.get(id=item.id), quantity=2)
+        line_items: list[dict] = cart.get_line_items()
+        self.assertEqual(len(line_items), 1)
+        self.assertEqual(line_items[0]['quantity'], 3)
+
+
+class TaxTestCase(FakeGatewayMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.item: Item = Item.objects.create(
+            name='Temp',
+            description='Temp description',
+            price=10,
+            currency='usd'
+        )
+        self.tax: Tax = Tax.objects.create(
+            display_name='VAT',
+            percentage=20,
+            country='US',
+            description='Temp tax'
+        )
+        self.tax.item.add(self.item)
+
+    def test_tax_rate_created_once(self):
+        for _ in range(3):
+            line_items: list[dict] = CheckoutCart(
+                [self.item]
+            ).get_line_items()
+
+        self.assertEqual(len(self.get_calls('TaxRate.create')), 1)
+        self.assertEqual(line_items[0]['tax_rates'], ['txr_1'])
+        self.tax.refresh_from_db()
+        self.assertEqual(self.tax.stripe_id, 'txr_1')
+
+    def test_tax_rate_recreated_on_change(self):
+        self.tax.sync_stripe()
+
+        self.tax.percentage = 10
+        self.tax.save()
+        line_items: list[dict] = CheckoutCart(
+            [self.item]
+        ).get_line_items()
+
+        self.assertEqual(line_items[0]['tax_rates'], ['txr_2'])
+        self.assertEqual(
+            self.get_calls('TaxRate.modify'),
+            [(('txr_1',), {'active': False})]
+        )
+
+    def test_tax_change_in_other_process(self):
+        CheckoutCart([self.item]).get_line_items()
+
+        # Another worker recreates the TaxRate and bumps the shared
+        # version; the local cache of this one is not cleared.
+        Tax.objects.filter(id=self.tax.id).update(stripe_id='txr_9')
+        bump_version('tax')
+        line_items: list[dict] = CheckoutCart(
+            [self.item]
+        ).get_line_items()
+
+        self.assertEqual(line_items[0]['tax_rates'], ['txr_9'])
+
+
+class DiscountTestCase(FakeGatewayMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        coupons_cache.clear()
+        self.item: Item = Item.objects.create(
+            name='Temp',
+            description='Temp description',
+            price=10,
+            currency='usd'
+        )
+        self.discount: Discount = Discount.objects.create(
+            persent=15,
+            datetime_ending=timezone.now() + timezone.timedelta(days=1)
+        )
+        self.discount.item.add(self.item)
+        self.item.refresh_from_db()
+
+    def test_coupon_created_once(self):
+        for _ in range(3):
+            CheckoutCart([self.item]).get_stripe_session()
+
+        self.assertEqual(self.get_calls('Coupon.create'), [((), {
+            'percent_off': 15,
+            'duration': 'once',
+            'redeem_by': int(self.discount.datetime_ending.timestamp()),
+        })])
+        self.assertEqual(
+            self.get_calls('checkout.Session.create')[-1][1]['discounts'],
+            [{'coupon': 'co_1'}]
+        )
+
+    def test_coupon_dropped_in_other_process(self):
+        CheckoutCart([self.item]).get_stripe_session()
+
+        # Another worker forgets the coupon and bumps the shared
+        # versions; the local cache of this one is not cleared.
+        Discount.objects.filter(id=self.discount.id).update(
+            stripe_coupon_id='',
+            stripe_fingerprint=''
+        )
+        bump_version('coupon')
+        bump_version('discount')
+
+        self.assertEqual(CheckoutCart([self.item]).get_coupon_id(), 'co_2')
+        self.assertEqual(len(self.get_calls('Coupon.create')), 2)
+
+    def test_expired_discount_has_no_coupon(self):
+        self.discount.datetime_ending = timezone.now()
+        self.discount.save()
+
+        self.assertIsNone(self.discount.get_stripe_coupon_id())
+        self.assertEqual(self.get_calls('Coupon.create'), [])
+
+
+class CatalogTestCase(FakeGatewayMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.item: Item = Item.objects.create(
+            name='Temp',
+            description='Temp description',
+            price=10,
+            currency='usd'
+        )
+
+    def test_line_item_uses_price_id(self):
+        line_items: list[dict] = CheckoutCart(
+            [self.item]
+        ).get_line_items()
+
+        self.assertEqual(
+            line_items,
+            [{'price': 'price_1', 'quantity': 1, 'tax_rates': []}]
+        )
+
+    def test_new_price_on_price_change(self):
+        self.item.sync_stripe()
+        self.item.price = 20
+        self.item.sync_stripe()
+
+        self.assertEqual(len(self.get_calls('Product.create')), 1)
+        self.assertEqual(self.item.stripe_price_id, 'price_2')
+        self.assertEqual(
+            self.get_calls('Price.modify'),
+            [(('price_1',), {'active': False})]
+        )
+
+    def test_sync_catalog(self):
+        result = sync_catalog(Item.objects.all(), batch_size=2, workers=2)
+
+        self.assertEqual(result.synced, 1)
+        self.assertEqual(result.failed, [])
+        self.item.refresh_from_db()
+        self.assertTrue(self.item.is_stripe_synced)
+        self.assertEqual(sync_catalog(Item.objects.all()).synced, 0)
+
+
+class CheckoutQueriesTestCase(FakeGatewayMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.items: list[Item] = Item.objects.bulk_create(
+            Item(
+                name=f'Item {i}',
+                description='Temp description',
+                price=10 + i % 50,
+                currency='usd',
+            ) for i in range(500)
+        )
+        for item in cls.items:
+            item.stripe_product_id = f'prod_{item.id}'
+            item.stripe_product_fingerprint = item.product_fingerprint
+            item.stripe_price_id = f'price_{item.id}'
+            item.stripe_price_key = item.price_key
+        Item.objects.bulk_update(cls.items, Item.STRIPE_FIELDS)
+
+        tax: Tax = Tax.objects.create(
+            display_name='VAT',
+            percentage=20,
+            country='US',
+            description='Temp tax',
+        )
+        tax.item.add(*cls.items)
+        discount: Discount = Discount.objects.create(
+            persent=10,
+            datetime_ending=timezone.now() + timezone.timedelta(days=1)
+        )
+        discount.item.add(*cls.items[::2])
+        cls.items = list(Item.objects.order_by('id'))
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        coupons_cache.clear()
+
+    def make_order(self, size: int) -> Order:
+        order: Order = Order.objects.create()
+        OrderLine.objects.bulk_create(
+            OrderLine(
+                order=order,
+                item=item,
+                quantity=2,
+                unit_amount=item.amount
+            ) for item in self.items[:size]
+        )
+        Order.objects.update_total(order.id)
+        return order
+
+    def count_queries(self, size: int) -> int:
+        order: Order = self.make_order(size)
+        tax_rates_cache.clear()
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/buy/order/{order.id}')
+
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_flat(self):
+        self.count_queries(1)
+        self.assertEqual(
+            self.count_queries(1),
+            self.count_queries(500)
+        )
+
+    def test_per_item_discounts(self):
+        cart: CheckoutCart = CheckoutCart(self.items[:2])
+        line_items: list[dict] = cart.get_line_items()
+
+        self.assertEqual(cart.get_discounts(), [])
+        self.assertEqual(line_items[0]['price_data'], {
+            'currency': 'usd',
+            'product': self.items[0].stripe_product_id,
+            'unit_amount': self.items[0].amount * 90 // 100,
+        })
+        self.assertEqual(
+            line_items[1]['price'],
+            self.items[1].stripe_price_id
+        )
+
+    def test_shared_discount_uses_coupon(self):
+        cart: CheckoutCart = CheckoutCart(self.items[:1])
+
+        self.assertEqual(cart.get_discounts(), [{'coupon': 'co_1'}])
+        self.assertEqual(
+            cart.get_line_items()[0]['price'],
+            self.items[0].stripe_price_id
+        )
+
+    def test_order_checkout_view(self):
+        order: Order = self.make_order(3)
+        response = self.client.get(f'/buy/order/{order.id}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'id': 'cs_1'})
+        line_items: list[dict] = self.get_calls(
+            'checkout.Session.create'
+        )[-1][1]['line_items']
+        self.assertEqual(len(line_items), 3)
+        self.assertEqual(line_items[1]['quantity'], 2)
+
+
+class OrderTestCase(TestCase):
+
+    def setUp(self):
+        self.item: Item = Item.objects.create(
+            name='Temp',
+            description='Temp description',
+            price=10,
+            currency='usd'
+        )
+        self.order: Order = Order.objects.create()
+
+    def test_total_follows_lines(self):
+        line: OrderLine = OrderLine.objects.create(
+            order=self.order,
+            item=self.item,
+            quantity=3
+        )
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, 3000)
+
+        line.quantity = 1
+        line.save()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, 1000)
+
+        line.delete()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, 0)
+
+    def test_total_follows_cascades(self):
+        other: Item = Item.objects.create(
+            name='Other',
+            description='Other description',
+            price=5,
+            currency='usd'
+        )
+        for item in (self.item, other):
+            OrderLine.objects.create(order=self.order, item=item)
+
+        other.delete()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, 1000)
+
+        OrderLine.objects.filter(order=self.order).delete()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, 0)
+
+    def test_price_snapshot(self):
+        line: OrderLine = OrderLine.objects.create(
+            order=self.order,
+            item=self.item,
+        )
+        Item.objects.filter(id=self.item.id).update(price=20)
+        line.quantity = 2
+        line.save()
+        self.order.refresh_from_db()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.order.full_price, 20.0)
+
+    def test_order_page(self):
+        OrderLine.objects.create(
+            order=self.order,
+            item=self.item,
+            quantity=2
+        )
+        response = self.client.get(f'/order/{self.order.id}/')
+
+        self.assertContains(response, 'Quantity: 2')
+        self.assertContains(response, 'Total: 20.0')
+
+
+class ActiveDiscountTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.items: list[Item] = [
+            Item.objects.create(
+                name=f'Temp {i}',
+                description='Temp description',
+                price=10,
+                currency='usd'
+            ) for i in range(3)
+        ]
+
+    def create_discount(self, persent: int, hours: int) -> Discount:
+        discount: Discount = Discount.objects.create(
+            persent=persent,
+            datetime_ending=self.now + timezone.timedelta(hours=hours)
+        )
+        discount.item.add(*self.items[:2])
+        return discount
+
+    def test_best_active_discount(self):
+        self.create_discount(10, 2)
+        best: Discount = self.create_discount(30, 1)
+        self.create_discount(50, -1)
+
+        with self.assertNumQueries(1):
+            result: dict = Discount.objects.active_for(
+                [item.id for item in self.items]
+            )
+
+        self.assertEqual(result, {
+            self.items[0].id: best,
+            self.items[1].id: best,
+        })
+
+    def test_ending_synced_to_through_table(self):
+        discount: Discount = self.create_discount(10, 2)
+        discount.datetime_ending = self.now
+        discount.save()
+
+        self.assertFalse(
+            DiscountItem.objects.exclude(
+                datetime_ending=self.now
+            ).exists()
+        )
+
+    def test_cached_until_change(self):
+        self.create_discount(10, 2)
+        item_ids: list[int] = [item.id for item in self.items]
+        Discount.objects.active_for(item_ids)
+
+        with self.assertNumQueries(0):
+            Discount.objects.active_for(item_ids)
+
+        best: Discount = self.create_discount(20, 2)
+        self.assertEqual(
+            Discount.objects.active_for(item_ids)[self.items[0].id],
+            best
+        )
+
+    def test_cache_expires_at_earliest_ending(self):
+        self.create_discount(10, 1)
+        with mock.patch.object(cache, 'set_many') as set_many:
+            Discount.objects.active_for([self.items[0].id])
+
+        timeout: int = set_many.call_args.args[1]
+        self.assertTrue(3590 <= timeout <= 3600)
+
+
+class EffectivePriceTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.item: Item = Item.objects.create(
+            name='Temp',
+            description='Temp description',
+            price=10,
+            currency='usd'
+        )
+        self.discount: Discount = Discount.objects.create(
+            persent=15,
+            datetime_ending=timezone.now() + timezone.timedelta(hours=1)
+        )
+
+    def test_price_follows_discount(self):
+        self.discount.item.add(self.item)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.effective_price, Decimal('8.50'))
+        self.assertEqual(self.item.discount_persent, 15)
+
+        self.discount.item.remove(self.item)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.effective_price, Decimal('10.00'))
+
+    def test_scheduler_expires_discount(self):
+        self.discount.item.add(self.item)
+        scheduler: DiscountScheduler = DiscountScheduler()
+        scheduler.run_once()
+
+        scheduler.run_once(
+            self.discount.datetime_ending + timezone.timedelta(seconds=1)
+        )
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.effective_price, Decimal('10.00'))
+        self.assertEqual(
+            scheduler.get_timeout(timezone.now()),
+            scheduler.poll_interval
+        )
+
+    def test_extended_discount_applies_again(self):
+        self.discount.item.add(self.item)
+        self.discount.datetime_ending = timezone.now() - timezone.timedelta(
+            seconds=1
+        )
+        self.discount.save()
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.effective_price, Decimal('10.00'))
+
+        self.discount.datetime_ending = timezone.now() + timezone.timedelta(
+            days=5
+        )
+        self.discount.save()
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.effective_price, Decimal('8.50'))
+        self.assertEqual(
+            DiscountItem.objects.get(discount=self.discount).datetime_ending,
+            self.discount.datetime_ending
+        )
+
+    def test_shortened_discount_stops_applying(self):
+        self.discount.item.add(self.item)
+        self.discount.datetime_ending = timezone.now() - timezone.timedelta(
+            seconds=1
+        )
+        self.discount.save()
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.effective_price, Decimal('10.00'))
+        self.assertFalse(Discount.objects.active_for([self.item.id]))
+
+    def test_item_page_reads_effective_price(self):
+        self.discount.item.add(self.item)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/item/{self.item.id}/')
+
+        self.assertContains(response, 'SALE -15%')
+        self.assertContains(response, 'Price: 8.50')
+
+
+class PageCacheTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.item: Item = Item.objects.create(
+            name='Temp',
+            description='Temp description',
+            price=10,
+            currency='usd'
+        )
+        self.order: Order = Order.objects.create()
+        OrderLine.objects.create(order=self.order, item=self.item)
+
+    def test_item_page_cached(self):
+        self.client.get(f'/item/{self.item.id}/')
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/item/{self.item.id}/')
+
+        self.assertContains(response, 'Temp description')
+
+    def test_item_page_invalidated(self):
+        self.client.get(f'/item/{self.item.id}/')
+        self.item.description = 'New description'
+        self.item.save()
+
+        self.assertContains(
+            self.client.get(f'/item/{self.item.id}/'),
+            'New description'
+        )
+
+    def test_order_page_invalidated(self):
+        self.client.get(f'/order/{self.order.id}/')
+        with self.assertNumQueries(0):
+            self.client.get(f'/order/{self.order.id}/')
+
+        line: OrderLine = self.order.lines.get()
+        line.quantity = 5
+        line.save()
+        self.assertContains(
+            self.client.get(f'/order/{self.order.id}/'),
+            'Quantity: 5'
+        )
+
+    def test_discount_invalidates_item_page(self):
+        self.client.get(f'/item/{self.item.id}/')
+        discount: Discount = Discount.objects.create(
+            persent=50,
+            datetime_ending=timezone.now() + timezone.timedelta(hours=1)
+        )
+        discount.item.add(self.item)
+
+        self.assertContains(
+            self.client.get(f'/item/{self.item.id}/'),
+            'SALE -50%'
+        )
+
+
+class ConditionalGetTestCase(FakeGatewayMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.item: Item = Item.objects.create(
+            name='Temp',
+            description='Temp description',
+            price=10,
+            currency='usd'
+        )
+        self.order: Order = Order.objects.create()
+        OrderLine.objects.create(order=self.order, item=self.item)
+
+    def assertNotModified(self, url: str) -> None:
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                url,
+                HTTP_IF_NONE_MATCH=response['ETag'],
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_item_page(self):
+        self.assertNotModified(f'/item/{self.item.id}/')
+
+    def test_order_page(self):
+        self.assertNotModified(f'/order/{self.order.id}/')
+
+    def test_last_modified(self):
+        response = self.client.get(f'/item/{self.item.id}/')
+        response = self.client.get(
+            f'/item/{self.item.id}/',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_modified_without_render(self):
+        response = self.client.get(f'/item/{self.item.id}/')
+        cache.clear()
+
+        with mock.patch('django.template.loader.get_template') as loader:
+            response = self.client.get(
+                f'/item/{self.item.id}/',
+                HTTP_IF_NONE_MATCH=response['ETag'],
+            )
+
+        self.assertEqual(response.status_code, 304)
+        loader.assert_not_called()
+
+    def test_checkout_not_modified_skips_stripe(self):
+        response = self.client.get(f'/buy/{self.item.id}')
+        response = self.client.get(
+            f'/buy/{self.item.id}',
+            HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(
+            len(self.get_calls('checkout.Session.create')),
+            1
+        )
+
+    def test_etag_changes_with_discount(self):
+        etag: str = self.client.get(f'/item/{self.item.id}/')['ETag']
+        discount: Discount = Discount.objects.create(
+            persent=50,
+            datetime_ending=timezone.now() + timezone.timedelta(hours=1)
+        )
+        discount.item.add(self.item)
+
+        response = self.client.get(
+            f'/item/{self.item.id}/',
+            HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class GatewayTestCase(TestCase):
+
+    def test_fake_failure_rate(self):
+        gateway: FakeStripeGateway = FakeStripeGateway(
+            failure_rate=1.0
+        )
+        with self.assertRaises(stripe.error.APIConnectionError):
+            gateway.create_coupon(percent_off=10, duration='once')
+
+    def test_fake_objects(self):
+        gateway: FakeStripeGateway = FakeStripeGateway()
+        price = gateway.create_price(unit_amount=1000, currency='usd')
+        gateway.archive_price(price.id)
+
+        self.assertEqual(price.id, 'price_1')
+        self.assertFalse(gateway.objects['Price'][price.id]['active'])
+        with self.assertRaises(stripe.error.InvalidRequestError):
+            gateway.archive_price('price_404')
+
+    def test_record_replay(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path: str = os.path.join(directory, 'stripe.jsonl')
+            recorder: RecordReplayGateway = RecordReplayGateway(
+                path,
+                mode='record',
+                backend='orders.gateway.FakeStripeGateway'
+            )
+            session = recorder.create_checkout_session(mode='payment')
+
+            replayer: RecordReplayGateway = RecordReplayGateway(path)
+            replayed = replayer.create_checkout_session(mode='payment')
+            self.assertEqual(replayed.id, session.id)
+            self.assertEqual(replayed.url, session.url)
+            with self.assertRaises(stripe.error.APIConnectionError):
+                replayer.create_checkout_session(mode='setup')
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body: bytes = b'{"id": "co_1", "object": "coupon"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PooledHTTPClientTestCase(TestCase):
+
+    def setUp(self):
+        self.server: ThreadingHTTPServer = ThreadingHTTPServer(
+            ('127.0.0.1', 0),
+            KeepAliveHandler
+        )
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url: str = f'http://127.0.0.1:{self.server.server_port}/'
+
+    def test_connections_are_reused(self):
+        client: PooledRequestsClient = PooledRequestsClient(pool_maxsize=2)
+        self.addCleanup(client.close)
+
+        threads: list[Thread] = [
+            Thread(
+                target=client.request,
+                args=('post', self.url, {}, 'a=1')
+            )
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        stats: dict = client.get_stats()[
+            f'http://127.0.0.1:{self.server.server_port}'
+        ]
+
+        self.assertEqual(stats['requests'], 4)
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(stats['idle'], 1)
+
+    def test_api_gateway_installs_client(self):
+        default_client = stripe.default_http_client
+        self.addCleanup(setattr, stripe, 'default_http_client', default_client)
+
+        gateway: StripeAPIGateway = StripeAPIGateway(
+            api_key='sk_test',
+            http_client={'POOL_MAXSIZE': 3, 'READ_TIMEOUT': 2.0}
+        )
+
+        self.assertIs(stripe.default_http_client, gateway.http_client)
+        self.assertEqual(gateway.http_client._timeout, (5.0, 2.0))
+        self.assertEqual(gateway.http_client.adapter._pool_maxsize, 3)
+
+
+class AsyncCheckoutTestCase(TestCase):
+
+    def setUp(self):
+        gateway_settings = override_settings(STRIPE_GATEWAY={
+            'BACKEND': 'orders.gateway.FakeStripeGateway',
+            'OPTIONS': {'latency': 0.05},
+        })
+        gateway_settings.enable()
+        self.addCleanup(gateway_settings.disable)
+        self.gateway: FakeStripeGateway = get_gateway()
+        for local_cache in (cache, tax_rates_cache, coupons_cache):
+            local_cache.clear()
+            self.addCleanup(local_cache.clear)
+
+        self.items: list[Item] = [
+            Item.objects.create(
+                name=f'Temp {i}',
+                description='Temp description',
+                price=10 + i,
+                currency='usd'
+            ) for i in range(3)
+        ]
+        for percentage in (10, 20):
+            Tax.objects.create(
+                display_name=f'VAT {percentage}',
+                percentage=percentage,
+                country='US',
+                description='Temp tax',
+            ).item.add(*self.items)
+        self.order: Order = Order.objects.create()
+        for item in self.items:
+            OrderLine.objects.create(order=self.order, item=item, quantity=2)
+
+    async def test_order_checkout_runs_stripe_calls_concurrently(self):
+        response = await self.async_client.get(
+            f'/buy/order/async/{self.order.id}'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'id': 'cs_1'})
+        self.assertGreater(self.gateway.max_in_flight, 1)
+
+        params: dict = self.gateway.calls[-1][2]
+        self.assertEqual(
+            [line['quantity'] for line in params['line_items']],
+            [2, 2, 2]
+        )
+        self.assertCountEqual(
+            params['line_items'][0]['tax_rates'],
+            ['txr_1', 'txr_2']
+        )
+        synced: list[Item] = [
+            item async for item in Item.objects.order_by('id')
+        ]
+        self.assertTrue(all(item.is_stripe_synced for item in synced))
+        self.assertTrue(await Tax.objects.exclude(stripe_id='').aexists())
+
+    async def test_item_checkout_with_coupon(self):
+        discount: Discount = await Discount.objects.acreate(
+            persent=15,
+            datetime_ending=timezone.now() + timezone.timedelta(days=1)
+        )
+        await DiscountItem.objects.acreate(
+            discount=discount,
+            item=self.items[0]
+        )
+
+        response = await self.async_client.get(
+            f'/buy/async/{self.items[0].id}'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.gateway.calls[-1][2]['discounts'],
+            [{'coupon': 'co_1'}]
+        )
+        discount = await Discount.objects.aget(id=discount.id)
+        self.assertEqual(discount.stripe_coupon_id, 'co_1')
+
+    async def test_session_of_cart_without_loaded_discounts(self):
+        discount: Discount = await Discount.objects.acreate(
+            persent=15,
+            datetime_ending=timezone.now() + timezone.timedelta(days=1)
+        )
+        await DiscountItem.objects.acreate(
+            discount=discount,
+            item=self.items[0]
+        )
+        item: Item = await Item.objects.aget(id=self.items[0].id)
+
+        await CheckoutCart([item]).acreate_stripe_session('key')
+
+        self.assertEqual(
+            self.gateway.calls[-1][2]['discounts'],
+            [{'coupon': 'co_1'}]
+        )
+
+    async def test_missing_object(self):
+        response = await self.async_client.get('/buy/order/async/0')
+
+        self.assertEqual(response.json(), {'message': 'Object 0 does not exist'})
+
+
+class SessionReuseTestCase(TestCase):
+
+    def setUp(self):
+        gateway_settings = override_settings(STRIPE_GATEWAY={
+            'BACKEND': 'orders.gateway.FakeStripeGateway',
+            'OPTIONS': {'latency': 0.05},
+        })
+        gateway_settings.enable()
+        self.addCleanup(gateway_settings.disable)
+        self.gateway: FakeStripeGateway = get_gateway()
+        for local_cache in (cache, tax_rates_cache, coupons_cache):
+            local_cache.clear()
+            self.addCleanup(local_cache.clear)
+
+        self.item: Item = Item.objects.create(
+            name='Temp',
+            description='Temp description',
+            price=10,
+            currency='usd'
+        )
+        self.item.sync_stripe()
+        tax_rates_cache.set((get_version('tax'), self.item.id), ())
+        self.gateway.calls.clear()
+
+    def get_idempotency_keys(self) -> list[str]:
+        return [
+            params['idempotency_key']
+            for method, args, params in self.gateway.calls
+            if method == 'checkout.Session.create'
+        ]
+
+    def test_session_is_reused_from_cache(self):
+        first = CheckoutCart([self.item]).get_stripe_session()
+        second = CheckoutCart([self.item]).get_stripe_session()
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(len(self.get_idempotency_keys()), 1)
+
+    def test_concurrent_checkouts_coalesce(self):
+        sessions: list = []
+        threads: list[Thread] = [
+            Thread(
+                target=lambda: sessions.append(
+                    CheckoutCart([self.item]).get_stripe_session()
+                )
+            )
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual({session.id for session in sessions}, {'cs_1'})
+        self.assertEqual(len(self.get_idempotency_keys()), 1)
+
+    def test_idempotency_key_without_cache(self):
+        first = CheckoutCart([self.item]).get_stripe_session()
+        cache.clear()
+        second = CheckoutCart([self.item]).get_stripe_session()
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(len(set(self.get_idempotency_keys())), 1)
+        self.assertEqual(len(self.gateway.objects['checkout.Session']), 1)
+
+    def test_orders_get_own_sessions(self):
+        sessions: dict[int, Any] = {}
+        for _ in range(2):
+            order: Order = Order.objects.create()
+            OrderLine.objects.create(order=order, item=self.item)
+            order = Order.objects.prefetch_related('lines__item').get(
+                id=order.id
+            )
+            sessions[order.id] = CheckoutCart.from_order(
+                order
+            ).get_stripe_session()
+
+        self.assertEqual(
+            [session.client_reference_id for session in sessions.values()],
+            [str(order_id) for order_id in sessions]
+        )
+        self.assertEqual(len(self.get_idempotency_keys()), 2)
+
+    async def test_async_checkouts_coalesce(self):
+        sessions: list = await asyncio.gather(*(
+            CheckoutCart([self.item]).aget_stripe_session()
+            for _ in range(5)
+        ))
+
+        self.assertEqual({session.id for session in sessions}, {'cs_1'})
+        self.assertEqual(len(self.get_idempotency_keys()), 1)
+
+
+class SingleFlightTestCase(TestCase):
+
+    def test_waiters_share_exception(self):
+        flights: SingleFlight = SingleFlight()
+        started: Event = Event()
+        release: Event = Event()
+        errors: list[Exception] = []
+
+        def fail():
+            started.set()
+            release.wait()
+            raise ValueError('boom')
+
+        def run():
+            try:
+                flights.do('key', fail)
+            except ValueError as e:
+                errors.append(e)
+
+        leader: Thread = Thread(target=run)
+        leader.start()
+        started.wait()
+        follower: Thread = Thread(target=run)
+        follower.start()
+        time.sleep(0.05)
+        release.set()
+        leader.join()
+        follower.join()
+
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+        self.assertEqual(len(flights), 0)
+
+
+class ResilienceTestCase(TestCase):
+
+    def get_gateway(self, **options) -> ResilientGateway:
+        return ResilientGateway(
+            backend='orders.gateway.FakeStripeGateway',
+            options={'failure_rate': 1.0},
+            backoff=0,
+            **options
+        )
+
+    def test_retries_reuse_idempotency_key(self):
+        gateway: ResilientGateway = self.get_gateway(max_retries=2)
+
+        with self.assertLogs('orders.resilience', 'INFO'):
+            with self.assertRaises(stripe.error.APIConnectionError):
+                gateway.create_product(name='Temp')
+
+        keys: set[str] = {
+            params['idempotency_key']
+            for _, _, params in gateway.backend.calls
+        }
+        self.assertEqual(len(gateway.backend.calls), 3)
+        self.assertEqual(len(keys), 1)
+
+    def test_retry_budget(self):
+        budget: RetryBudget = RetryBudget(ratio=0.5, min_per_second=0)
+        budget.record_call()
+        budget.record_call()
+
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+
+    def test_breaker_opens_and_probes(self):
+        gateway: ResilientGateway = self.get_gateway(
+            max_retries=0,
+            min_calls=2,
+            reset_timeout=60
+        )
+        with self.assertLogs('orders.resilience', 'WARNING'):
+            for _ in range(2):
+                with self.assertRaises(stripe.error.APIConnectionError):
+                    gateway.create_coupon(percent_off=10)
+
+        with self.assertRaises(CircuitOpenError) as error:
+            gateway.create_coupon(percent_off=10)
+        self.assertGreater(error.exception.retry_after, 0)
+        self.assertEqual(len(gateway.backend.calls), 2)
+        self.assertEqual(gateway.get_stats()['breaker']['state'], 'open')
+
+        gateway.breaker.reset_timeout = 0
+        gateway.backend.failure_rate = 0
+        with self.assertLogs('orders.resilience', 'WARNING'):
+            gateway.create_coupon(percent_off=10)
+        self.assertEqual(gateway.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_client_errors_keep_circuit_closed(self):
+        breaker: CircuitBreaker = CircuitBreaker(min_calls=1)
+        gateway: ResilientGateway = self.get_gateway()
+        gateway.breaker = breaker
+        gateway.backend.failure_rate = 0
+
+        for _ in range(3):
+            with self.assertRaises(stripe.error.InvalidRequestError):
+                gateway.archive_price('price_404')
+
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_deadline_limits_socket_timeouts(self):
+        client: PooledRequestsClient = PooledRequestsClient(
+            connect_timeout=5,
+            read_timeout=30
+        )
+        token = request_deadline.set(time.monotonic() + 2)
+        try:
+            connect_timeout, read_timeout = client._timeout
+        finally:
+            request_deadline.reset(token)
+
+        self.assertLessEqual(connect_timeout, 2)
+        self.assertLessEqual(read_timeout, 2)
+        self.assertEqual(client._timeout, (5, 30))
+
+    def test_open_circuit_answers_503(self):
+        gateway_settings = override_settings(STRIPE_GATEWAY={
+            'BACKEND': 'orders.resilience.ResilientGateway',
+            'OPTIONS': {
+                'backend': 'orders.gateway.FakeStripeGateway',
+                'options': {'failure_rate': 1.0},
+                'max_retries': 0,
+                'min_calls': 1,
+            },
+        })
+        gateway_settings.enable()
+        self.addCleanup(gateway_settings.disable)
+        cache.clear()
+        item: Item = Item.objects.create(
+            name='Temp',
+            description='Temp description',
+            price=10,
+            currency='usd'
+        )
+
+        with self.assertLogs('orders', 'WARNING'),\
+                self.assertLogs('django.request', 'ERROR'):
+            response = self.client.get(f'/buy/{item.id}')
+        self.assertEqual(response.status_code, 500)
+
+        with self.assertLogs('django.request', 'WARNING'):
+            response = self.client.get(f'/buy/{item.id}')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+
+
+@override_settings(CHECKOUT_THROTTLE={
+    'BACKEND': 'local',
+    'KEY': 'ip',
+    'RATES': {
+        'checkout_item': '2/min',
+        'checkout_order': '1/min',
+    },
+})
+class ThrottleTestCase(FakeGatewayMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.item: Item = Item.objects.create(
+            name='Temp',
+            description='Temp description',
+            price=10,
+            currency='usd'
+        )
+        self.order: Order = Order.objects.create()
+        OrderLine.objects.create(order=self.order, item=self.item)
+
+    def assertThrottled(self, response, retry_after: str = '30') -> None:
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], retry_after)
+
+    def test_token_bucket(self):
+        bucket: TokenBucket = TokenBucket('test', 2, 60, LocalBucketStore())
+
+        self.assertEqual(bucket.consume('a'), 0)
+        self.assertEqual(bucket.consume('a'), 0)
+        self.assertAlmostEqual(bucket.consume('a'), 30, places=0)
+        self.assertEqual(bucket.consume('b'), 0)
+
+    def test_throttled_before_queries(self):
+        for _ in range(2):
+            self.client.get(f'/buy/{self.item.id}')
+
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/buy/{self.item.id}')
+
+        self.assertThrottled(response)
+        self.assertEqual(
+            len(self.get_calls('checkout.Session.create')),
+            1
+        )
+
+    def test_separate_budgets(self):
+        self.client.get(f'/buy/order/{self.order.id}')
+        response = self.client.get(f'/buy/{self.item.id}')
+
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/buy/order/{self.order.id}')
+        self.assertEqual(response.status_code, 429)
+
+    def test_clients_by_ip(self):
+        self.client.get(f'/buy/order/{self.order.id}')
+        response = self.client.get(
+            f'/buy/order/{self.order.id}',
+            REMOTE_ADDR='10.0.0.2'
+        )
+
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(CHECKOUT_THROTTLE={
+        'BACKEND': 'cache',
+        'KEY': 'session',
+        'RATES': {
+            'checkout_item': '1/min',
+        },
+    })
+    def test_cache_backend_by_session(self):
+        session = self.client.session
+        session.save()
+        self.client.get(f'/buy/{self.item.id}')
+        self.assertThrottled(self.client.get(f'/buy/{self.item.id}'), '60')
+
+        self.client.cookies.clear()
+        response = self.client.get(f'/buy/{self.item.id}')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(CHECKOUT_THROTTLE={
+        'BACKEND': 'local',
+        'KEY': 'session',
+        'RATES': {
+            'checkout_item': '1/min',
+        },
+    })
+    def test_rotated_session_cookies_share_ip_bucket(self):
+        for _ in range(2):
+            self.client.cookies[settings.SESSION_COOKIE_NAME] = (
+                uuid.uuid4().hex
+            )
+            response = self.client.get(f'/buy/{self.item.id}')
+
+        self.assertThrottled(response, '60')
+
+    @override_settings(CHECKOUT_THROTTLE={
+        'BACKEND': 'local',
+        'KEY': 'session',
+        'RATES': {
+            'checkout_order': '1/min',
+        },
+    })
+    async def test_async_view_by_session(self):
+        for _ in range(2):
+            self.async_client.cookies[settings.SESSION_COOKIE_NAME] = (
+                uuid.uuid4().hex
+            )
+            response = await self.async_client.get(
+                f'/buy/order/async/{self.order.id}'
+            )
+
+        self.assertThrottled(response, '60')
+
+    async def test_async_view(self):
+        await self.async_client.get(f'/buy/order/async/{self.order.id}')
+        response = await self.async_client.get(
+            f'/buy/order/async/{self.order.id}'
+        )
+
+        self.assertThrottled(response, '60')
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+class WebhookTestCase(FakeGatewayMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.order: Order = Order.objects.create()
+        self.created: int = int(time.time())
+
+    def get_event(
+        self,
+        id: str,
+        type: str = 'checkout.session.completed',
+        session_id: str = 'cs_1',
+        created: int = 0,
+        **session: Any
+    ) -> dict:
+
+        return {
+            'id': id,
+            'type': type,
+            'created': self.created + created,
+            'data': {
+                'object': {
+                    'id': session_id,
+                    'object': 'checkout.session',
+                    'client_reference_id': str(self.order.id),
+                    'payment_intent': 'pi_1',
+                    'payment_status': 'paid',
+                    'amount_total': 1000,
+                    'currency': 'usd',
+                    **session,
+                },
+            },
+        }
+
+    def post_event(self, event: dict, secret: str = 'whsec_test'):
+        payload: str = json.dumps(event)
+        timestamp: int = int(time.time())
+        signature: str = hmac.new(
+            secret.encode(),
+            f'{timestamp}.{payload}'.encode(),
+            hashlib.sha256
+        ).hexdigest()
+        return self.client.post(
+            '/stripe/webhook',
+            payload,
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}'
+        )
+
+    def queue(self, *events: dict) -> None:
+        WebhookEvent.objects.bulk_create(
+            WebhookEvent(stripe_id=e['id'], type=e['type'], payload=e)
+            for e in events
+        )
+
+    def test_ack_queues_event_once(self):
+        event: dict = self.get_event('evt_1')
+        with self.assertNumQueries(1):
+            response = self.post_event(event)
+        self.post_event(event)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertEqual(Payment.objects.count(), 0)
+
+    def test_invalid_signature(self):
+        response = self.post_event(self.get_event('evt_1'), 'whsec_other')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    @override_settings(STRIPE_WEBHOOK_SECRET='')
+    def test_unset_secret_refuses_events(self):
+        with self.assertLogs('orders.views', 'ERROR'):
+            response = self.post_event(self.get_event('evt_1'), '')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_completed_session_pays_order(self):
+        self.post_event(self.get_event('evt_1'))
+
+        self.assertEqual(process_queue(), 1)
+        payment: Payment = Payment.objects.get()
+        self.order.refresh_from_db()
+        self.assertEqual(payment.order, self.order)
+        self.assertEqual(payment.status, Payment.PAID)
+        self.assertEqual(payment.amount_total, 1000)
+        self.assertEqual(self.order.status, Order.PAID)
+        self.assertIsNotNone(WebhookEvent.objects.get().processed_at)
+        self.assertEqual(process_queue(), 0)
+
+    def test_out_of_order_events(self):
+        self.queue(self.get_event(
+            'evt_2',
+            type='checkout.session.async_payment_succeeded',
+            created=10
+        ))
+        process_events()
+        self.queue(self.get_event('evt_1', payment_status='unpaid'))
+        process_events()
+
+        self.assertEqual(Payment.objects.get().status, Payment.PAID)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.PAID)
+
+    def test_paid_order_is_not_downgraded(self):
+        self.queue(
+            self.get_event('evt_1'),
+            self.get_event(
+                'evt_2',
+                type='checkout.session.expired',
+                session_id='cs_2'
+            ),
+        )
+        process_events()
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.PAID)
+        self.assertEqual(Payment.objects.count(), 2)
+
+    def test_batch_queries_are_flat(self):
+        def count(size: int) -> int:
+            self.queue(*(
+                self.get_event(
+                    f'evt_{size}_{i}',
+                    session_id=f'cs_{size}_{i}'
+                ) for i in range(size)
+            ))
+            with CaptureQueriesContext(connection) as ctx:
+                process_events()
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count(2), count(50))
+
+    def test_completed_session_is_not_reused(self):
+        item: Item = Item.objects.create(
+            name='Temp',
+            description='Temp description',
+            price=10,
+            currency='usd'
+        )
+        session = CheckoutCart([item]).get_stripe_session()
+        self.queue(self.get_event(
+            'evt_1',
+            session_id=session.id,
+            metadata=session.metadata.to_dict()
+        ))
+        with self.captureOnCommitCallbacks(execute=True):
+            process_events()
+
+        self.assertNotEqual(
+            CheckoutCart([item]).get_stripe_session().id,
+            session.id
+        )
+
+
+class ReconcileTestCase(FakeGatewayMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.now: int = int(time.time())
+        self.orders: list[Order] = [Order.objects.create() for _ in range(12)]
+        for i, order in enumerate(self.orders):
+            self.gateway.create_checkout_session(
+                client_reference_id=str(order.id),
+                status='complete' if i % 3 else 'open',
+                payment_status='paid',
+                payment_intent=f'pi_{i}',
+                amount_total=1000,
+                currency='usd',
+                created=self.now - i * 5 * 60
+            )
+
+    def reconcile(self, resource: str = 'sessions') -> ReconcileResult:
+        return Reconciler(
+            resource,
+            since=self.now - 3600,
+            until=self.now + 1,
+            partitions=3,
+            page_size=2,
+            workers=3
+        ).run()
+
+    def test_sessions(self):
+        result: ReconcileResult = self.reconcile()
+
+        self.assertEqual(result.checked, 12)
+        self.assertEqual(result.fixed, 16)
+        self.assertEqual(Payment.objects.count(), 8)
+        self.assertEqual(
+            Order.objects.filter(status=Order.PAID).count(),
+            8
+        )
+        self.assertFalse(
+            ReconcileCursor.objects.filter(done=False).exists()
+        )
+        self.assertEqual(self.reconcile().fixed, 0)
+
+    def test_later_webhook_applies_after_reconcile(self):
+        self.reconcile()
+        session: dict = self.gateway.objects['checkout.Session']['cs_2']
+        payment: Payment = Payment.objects.get(stripe_session_id='cs_2')
+        self.assertEqual(payment.event_created.timestamp(), session['created'])
+
+        # Created before the reconcile run, delivered after it.
+        WebhookEvent.objects.create(
+            stripe_id='evt_1',
+            type='checkout.session.async_payment_failed',
+            payload={
+                'id': 'evt_1',
+                'type': 'checkout.session.async_payment_failed',
+                'created': session['created'] + 1,
+                'data': {'object': dict(session)},
+            }
+        )
+        process_queue()
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.FAILED)
+
+    def test_resumes_from_cursor(self):
+        fetch = Reconciler.fetch
+        pages: list[int] = []
+
+        def fail_after_three(reconciler, cursor):
+            if len(pages) == 3:
+                raise stripe.error.APIConnectionError('Network down')
+            pages.append(1)
+            return fetch(reconciler, cursor)
+
+        with mock.patch.object(Reconciler, 'fetch', fail_after_three):
+            with self.assertRaises(stripe.error.APIConnectionError):
+                self.reconcile()
+        saved: int = Payment.objects.count()
+        result: ReconcileResult = self.reconcile()
+
+        self.assertGreater(saved, 0)
+        self.assertLess(result.checked, 12)
+        self.assertEqual(Payment.objects.count(), 8)
+        self.assertFalse(
+            ReconcileCursor.objects.filter(done=False).exists()
+        )
+
+    def test_payment_intents(self):
+        self.gateway.objects['PaymentIntent']['pi_1'] = {
+            'id': 'pi_1',
+            'object': 'payment_intent',
+            'status': 'succeeded',
+            'created': self.now,
+        }
+        payment: Payment = Payment.objects.create(
+            order=self.orders[1],
+            stripe_session_id='cs_2',
+            stripe_payment_intent_id='pi_1',
+            status=Payment.PENDING,
+            event_created=timezone.now()
+        )
+
+        self.assertEqual(self.reconcile('payment_intents').fixed, 2)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.PAID)
+        self.orders[1].refresh_from_db()
+        self.assertEqual(self.orders[1].status, Order.PAID)
+
+    def test_coupons(self):
+        coupon = self.gateway.create_coupon(percent_off=10, duration='once')
+        discount: Discount = Discount.objects.create(
+            persent=15,
+            datetime_ending=timezone.now() + timezone.timedelta(days=1)
+        )
+        Discount.objects.filter(id=discount.id).update(
+            stripe_coupon_id=coupon.id,
+            stripe_fingerprint=discount.fingerprint
+        )
+        coupons_cache.clear()
+        discount.refresh_from_db()
+        self.assertEqual(discount.get_stripe_coupon_id(), coupon.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.reconcile('coupons').fixed, 1)
+        discount.refresh_from_db()
+        self.assertEqual(discount.stripe_coupon_id, '')
+        self.assertNotEqual(discount.get_stripe_coupon_id(), coupon.id)
+
+
+class ImportTestCase(FakeGatewayMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(tax_rates_cache.clear)
+        self.tax: Tax = Tax.objects.create(
+            display_name='VAT',
+            percentage=20,
+            country='US',
+            description='VAT'
+        )
+        self.discount: Discount = Discount.objects.create(
+            persent=50,
+            datetime_ending=timezone.now() + timezone.timedelta(days=1)
+        )
+        self.item: Item = Item.objects.create(
+            name='Old',
+            description='Old',
+            price=10,
+            currency='usd'
+        )
+
+    def import_rows(self, model: str, text: str, **kwargs) -> ImportResult:
+        fmt: str = 'csv' if text.startswith('id,') else 'jsonl'
+        return IMPORTERS[model](**kwargs).run(
+            read_rows(io.StringIO(text), fmt)
+        )
+
+    def test_items_csv(self):
+        result: ImportResult = self.import_rows(
+            'item',
+            'id,name,description,price,currency,taxes,discounts\n'
+            f'{self.item.id},New,New,30,usd,,\n'
+            f',Fresh,Fresh,20,eur,{self.tax.id},{self.discount.id}\n'
+            ',Bad,Bad,1000,usd,,\n'
+            ',Bad,Bad,10,rub,,\n'
+            ',Bad,Bad,10,usd,999999,\n'
+        )
+
+        self.assertEqual((result.created, result.updated), (1, 1))
+        self.assertEqual([line for line, _ in result.failed], [4, 5, 6])
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.name, 'New')
+        self.assertEqual(self.item.effective_price, Decimal('30.00'))
+        fresh: Item = Item.objects.get(name='Fresh')
+        self.assertEqual(list(fresh.tax.all()), [self.tax])
+        self.assertEqual(fresh.effective_price, Decimal('10.00'))
+        self.assertEqual(
+            DiscountItem.objects.get(item=fresh).datetime_ending,
+            self.discount.datetime_ending
+        )
+
+    def test_queries_do_not_grow_with_rows(self):
+        rows: str = ''.join(
+            f'{{"name": "Item {i}", "description": "-", "price": {i + 1},'
+            f' "currency": "usd", "taxes": [{self.tax.id}]}}\n'
+            for i in range(300)
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            result: ImportResult = self.import_rows(
+                'item',
+                rows,
+                batch_size=100
+            )
+
+        self.assertEqual(result.created, 300)
+        self.assertFalse(result.failed)
+        self.assertLess(len(queries), 60)
+        self.assertEqual(self.tax.item.count(), 300)
+
+    def test_discount_links_are_replaced(self):
+        other: Item = Item.objects.create(
+            name='Other',
+            description='Other',
+            price=20,
+            currency='usd'
+        )
+        self.discount.item.add(self.item)
+        ending = timezone.now() + timezone.timedelta(days=2)
+
+        result: ImportResult = self.import_rows(
+            'discount',
+            json.dumps({
+                'id': self.discount.id,
+                'persent': 25,
+                'datetime_ending': ending.isoformat(),
+                'items': [other.id],
+            })
+        )
+
+        self.assertEqual(result.updated, 1)
+        self.assertEqual(list(self.discount.item.all()), [other])
+        self.assertEqual(
+            DiscountItem.objects.get(item=other).datetime_ending,
+            ending
+        )
+        self.item.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.item.effective_price, Decimal('10.00'))
+        self.assertEqual(other.effective_price, Decimal('15.00'))
+
+    def test_price_range_constraint(self):
+        for price in (Item.MIN_PRICE, Item.MAX_PRICE):
+            with self.subTest(price), self.assertRaises(IntegrityError):
+                with transaction.atomic():
+                    Item.objects.bulk_create([Item(
+                        name='Bad',
+                        description='-',
+                        price=price,
+                        currency='usd'
+                    )])
+
+    def test_command_reads_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write(
+                'id,display_name,percentage,country,description,items\n'
+                f',Sales,5,US,Sales,{self.item.id}\n'
+            )
+            f.flush()
+            with mock.patch('builtins.print') as printed:
+                call_command(
+                    'import_catalog',
+                    'tax',
+                    f.name,
+                    stderr=io.StringIO()
+                )
+
+        self.assertIn(
+            'Imported: 1, created: 1, updated: 0, failed: 0',
+            printed.call_args_list[0].args
+        )
+        self.assertEqual(
+            list(self.item.tax.values_list('display_name', flat=True)),
+            ['Sales']
+        )
+
+
+class ExportTestCase(FakeGatewayMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        items: list[Item] = [
+            Item.objects.create(
+                name=f'Item {i}',
+                description='-',
+                price=10 + i,
+                currency='usd'
+            ) for i in range(2)
+        ]
+        self.orders: list[Order] = [Order.objects.create() for _ in range(3)]
+        OrderLine.objects.create(order=self.orders[0], item=items[0])
+        OrderLine.objects.create(
+            order=self.orders[0],
+            item=items[1],
+            quantity=2
+        )
+        OrderLine.objects.create(order=self.orders[2], item=items[1])
+
+    def test_rows_join_lines(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows: list[dict] = list(
+                iter_order_rows(Order.objects.all(), chunk_size=2)
+            )
+
+        self.assertEqual(len(queries), 5)
+        self.assertEqual(
+            [(row['order_id'], row.get('line_amount')) for row in rows],
+            [
+                (self.orders[0].id, 1000),
+                (self.orders[0].id, 2200),
+                (self.orders[1].id, None),
+                (self.orders[2].id, 1100),
+            ]
+        )
+        self.assertEqual(rows[0]['order_total'], 3200)
+        self.assertEqual(rows[1]['item_name'], 'Item 1')
+
+    def test_endpoint_is_staff_only(self):
+        response = self.client.get('/export/orders')
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(get_user_model().objects.create_user(
+            'staff',
+            password='-',
+            is_staff=True
+        ))
+        response = self.client.get('/export/orders?status=new')
+
+        self.assertTrue(response.streaming)
+        lines: list[str] = b''.join(
+            response.streaming_content
+        ).decode().splitlines()
+        self.assertEqual(lines[0].split(','), list(EXPORT_FIELDS))
+        self.assertEqual(len(lines), 5)
+        with self.assertLogs('django.request', 'WARNING'):
+            response = self.client.get('/export/orders?since=never')
+        self.assertEqual(response.status_code, 400)
+
+    def test_command_writes_jsonl(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.jsonl') as f:
+            call_command(
+                'export_orders',
+                format='jsonl',
+                output=f.name,
+                since='2000-01-01',
+                stderr=io.StringIO()
+            )
+            rows: list[dict] = [json.loads(line) for line in f]
+
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[-1]['order_id'], self.orders[2].id)
+
+
+class MetricsTestCase(FakeGatewayMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(cache.clear)
+        self.item: Item = Item.objects.create(
+            name='Item',
+            description='-',
+            price=10,
+            currency='usd'
+        )
+
+    def get_value(self, metric: Metric, **labels) -> Any:
+        return registry.collect()[metric.name].get(metric.get_labels(labels))
+
+    def test_histogram_exposition(self):
+        histogram: Histogram = Histogram('test_seconds', 'Test.', ('view',))
+        for value in (0.003, 0.02, 0.02, 20):
+            histogram.observe(value, view='a"b')
+
+        lines: list[str] = histogram.expose(histogram.snapshot())
+
+        self.assertIn('test_seconds_bucket{view="a\\"b",le="0.005"} 1', lines)
+        self.assertIn('test_seconds_bucket{view="a\\"b",le="0.025"} 3', lines)
+        self.assertIn('test_seconds_bucket{view="a\\"b",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_count{view="a\\"b"} 4', lines)
+
+    def test_merges_snapshots_of_other_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(METRICS={
+                **settings.METRICS,
+                'DIRECTORY': directory,
+            }):
+                before: float = self.get_value(
+                    CACHE_REQUESTS,
+                    cache='page',
+                    result='hit'
+                ) or 0
+                with open(f'{directory}/metrics-1.json', 'w') as file:
+                    json.dump({
+                        CACHE_REQUESTS.name: [[['page', 'hit'], 5]],
+                    }, file)
+                registry.flush()
+
+                self.assertEqual(
+                    self.get_value(CACHE_REQUESTS, cache='page', result='hit'),
+                    before + 5
+                )
+                self.assertIn(
+                    f'metrics-{os.getpid()}.json',
+                    os.listdir(directory)
+                )
+
+    def test_request_metrics(self):
+        labels: dict = {'view': 'ItemView', 'method': 'GET', 'status': '2xx'}
+        requests: list = self.get_value(REQUEST_DURATION, **labels) or [0]
+        hits: float = self.get_value(
+            CACHE_REQUESTS,
+            cache='page',
+            result='hit'
+        ) or 0
+        queries: list = self.get_value(DB_QUERIES, view='ItemView') or [0]
+
+        self.client.get(f'/item/{self.item.id}/')
+        self.client.get(f'/item/{self.item.id}/')
+        self.gateway.create_product(name='Item')
+        response = self.client.get('/metrics')
+
+        self.assertEqual(
+            sum(self.get_value(REQUEST_DURATION, **labels)[:-1]),
+            sum(requests[:-1]) + 2
+        )
+        self.assertEqual(
+            self.get_value(CACHE_REQUESTS, cache='page', result='hit'),
+            hits + 1
+        )
+        self.assertGreater(
+            self.get_value(DB_QUERIES, view='ItemView')[-1],
+            queries[-1]
+        )
+        text: str = response.content.decode()
+        self.assertIn('# TYPE orders_request_duration_seconds histogram', text)
+        self.assertIn('orders_db_queries_per_request_bucket{view="ItemView"', text)
+        self.assertIn(
+            'orders_stripe_call_duration_seconds_count'
+            '{method="Product.create"}',
+            text
+        )
+
+    @override_settings(METRICS={**settings.METRICS, 'TOKEN': 'secret'})
+    def test_token(self):
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(
+            self.client.get(
+                '/metrics',
+                HTTP_AUTHORIZATION='Bearer secret'
+            ).status_code,
+            200
+        )
+
+
+class LoggingTestCase(TestCase):
+
+    def get_record(self, **kwargs) -> logging.LogRecord:
+        record: logging.LogRecord = logging.getLogger('orders').makeRecord(
+            'orders',
+            logging.ERROR,
+            __file__,
+            1,
+            'Checkout of %s failed',
+            ('item',),
+            kwargs.pop('exc_info', None),
+            extra=kwargs
+        )
+        RequestIdFilter().filter(record)
+        return record
+
+    def test_json_formatter(self):
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record: logging.LogRecord = self.get_record(
+                exc_info=sys.exc_info(),
+                item_id=5
+            )
+
+        data: dict = json.loads(JsonFormatter().format(record))
+
+        self.assertEqual(data['message'], 'Checkout of item failed')
+        self.assertEqual(data['level'], 'ERROR')
+        self.assertEqual(data['item_id'], 5)
+        self.assertEqual(data['request_id'], '-')
+        self.assertIn('ValueError: boom', data['exception'])
+
+    def test_background_handler(self):
+        stream: io.StringIO = io.StringIO()
+        handler: BackgroundHandler = BackgroundHandler(stream, maxsize=100)
+        self.addCleanup(handler.close)
+        handler.setFormatter(JsonFormatter())
+
+        token = request_id.set('abc12345')
+        try:
+            handler.handle(self.get_record())
+        finally:
+            request_id.reset(token)
+        handler.flush()
+
+        self.assertEqual(
+            json.loads(stream.getvalue())['request_id'],
+            'abc12345'
+        )
+
+    def test_full_queue_drops_records(self):
+        handler: BackgroundHandler = BackgroundHandler(io.StringIO(), 1)
+        handler.close()
+        handler.enqueue(self.get_record())
+        handler.enqueue(self.get_record())
+
+        self.assertEqual(handler.dropped, 1)
+
+    def test_request_id_header(self):
+        response = self.client.get('/metrics', HTTP_X_REQUEST_ID='proxy-id-1')
+        self.assertEqual(response['X-Request-ID'], 'proxy-id-1')
+
+        response = self.client.get('/metrics', HTTP_X_REQUEST_ID='<bad>')
+        self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+
+
+class ProfilerTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(cache.clear)
+        self.addCleanup(get_profiler().store.clear)
+        self.item: Item = Item.objects.create(
+            name='Item',
+            description='-',
+            price=10,
+            currency='usd'
+        )
+        self.staff = get_user_model().objects.create_user(
+            'staff',
+            password='-',
+            is_staff=True
+        )
+
+    def test_collapsed_stack(self):
+        stack: str = get_stack(sys._getframe(), 2)
+
+        self.assertEqual(
+            stack.split(';')[-1],
+            'orders.tests:ProfilerTestCase.test_collapsed_stack'
+        )
+        self.assertEqual(len(stack.split(';')), 2)
+
+    def test_store_aggregates_and_truncates(self):
+        store: ProfileStore = ProfileStore(max_stacks=2)
+        store.add('ItemView', collections.Counter({'a;b': 2, 'a;c': 1}))
+        store.add('ItemView', collections.Counter({'a;b': 1, 'a;d': 4}))
+
+        self.assertEqual(
+            store.get_collapsed('ItemView'),
+            '[truncated] 4\na;b 3\na;c 1\n'
+        )
+        self.assertEqual(
+            store.get_summary(),
+            {'ItemView': {'requests': 2, 'samples': 8}}
+        )
+
+    def test_signed_header_profiles_request(self):
+        with override_settings(PROFILER={
+            **settings.PROFILER,
+            'INTERVAL': 0.0001,
+        }):
+            self.client.get(
+                f'/item/{self.item.pk}/',
+                HTTP_X_PROFILE='forged'
+            )
+            self.assertEqual(get_profiler().store.get_summary(), {})
+
+            self.client.force_login(self.staff)
+            token: str = self.client.get('/admin/profiles/').json()['token']
+            self.client.logout()
+
+            self.client.get(f'/item/{self.item.pk}/', HTTP_X_PROFILE=token)
+
+            summary: dict = get_profiler().store.get_summary()
+            self.assertEqual(summary['ItemView']['requests'], 1)
+
+    async def test_signed_header_profiles_async_request(self):
+        with override_settings(PROFILER={
+            **settings.PROFILER,
+            'INTERVAL': 0.0001,
+        }):
+            # AsyncClient of Django 4.1 takes raw header names.
+            await self.async_client.get(
+                f'/item/{self.item.pk}/',
+                **{PROFILE_HEADER: get_profiler().get_token()}
+            )
+
+            summary: dict = get_profiler().store.get_summary()
+            self.assertEqual(summary['ItemView']['requests'], 1)
+
+    def test_sampler_skips_other_tasks(self):
+        sampler: Sampler = Sampler()
+        samples: collections.Counter = collections.Counter()
+
+        async def profiled():
+            sampler.start(samples, asyncio.current_task())
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            sampler.sample()
+            sampler.stop(asyncio.current_task())
+
+        async def other():
+            await asyncio.sleep(0)
+            sampler.sample()
+
+        async def main():
+            await asyncio.gather(profiled(), other())
+
+        asyncio.run(main())
+        self.assertEqual(sum(samples.values()), 1)
+
+    def test_sample_rate(self):
+        with override_settings(PROFILER={
+            **settings.PROFILER,
+            'SAMPLE_RATE': 1.0,
+        }):
+            self.client.get(f'/item/{self.item.pk}/')
+            self.client.get(f'/item/{self.item.pk}/')
+
+            self.assertEqual(
+                get_profiler().store.get_summary()['ItemView']['requests'],
+                2
+            )
+
+    def test_endpoint_is_staff_only(self):
+        response = self.client.get('/admin/profiles/')
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.staff)
+        get_profiler().store.add(
+            'ItemView',
+            collections.Counter({'a;b': 3})
+        )
+
+        response = self.client.get('/admin/profiles/')
+        self.assertEqual(response.json()['header'], PROFILE_HEADER)
+        self.assertEqual(response.json()['views']['ItemView']['samples'], 3)
+
+        response = self.client.get('/admin/profiles/?view=ItemView')
+        self.assertEqual(response.content, b'a;b 3\n')
+
+        response = self.client.post('/admin/profiles/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(get_profiler().store.get_summary(), {})
+
+
+class QueryBudgetTestCase(FakeGatewayMixin, TestCase):
+    """Views stay within QUERY_BUDGETS on a seeded catalog.
+
+    Queries are counted like MetricsMiddleware counts them, including
+    those of worker threads. Checkouts run cold: their items, taxes
+    and discounts are not synced to Stripe yet.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        items: list[Item] = Item.objects.bulk_create(
+            Item(
+                name=f'Item {i}',
+                description='-',
+                price=10 + i % 50,
+                currency='usd',
+            ) for i in range(10000)
+        )
+        # Items of the first orders and items[40:60] stay unsynced.
+        item: Item
+        for item in items[60:]:
+            item.stripe_product_id = f'prod_{item.id}'
+            item.stripe_product_fingerprint = item.product_fingerprint
+            item.stripe_price_id = f'price_{item.id}'
+            item.stripe_price_key = item.price_key
+        Item.objects.bulk_update(items[60:], Item.STRIPE_FIELDS)
+        for i in range(150):
+            tax: Tax = Tax.objects.create(
+                display_name=f'Tax {i}',
+                percentage=1 + i % 30,
+                country='US',
+                description='-',
+            )
+            tax.item.add(*items[i::150])
+            discount: Discount = Discount.objects.create(
+                persent=1 + i % 50,
+                datetime_ending=timezone.now() + timezone.timedelta(days=1)
+            )
+            discount.item.add(*items[i::150])
+
+        cls.orders: list[Order] = []
+        for i in range(150):
+            order: Order = Order.objects.create()
+            OrderLine.objects.bulk_create(
+                OrderLine(
+                    order=order,
+                    item=item,
+                    quantity=1,
+                    unit_amount=item.price * 100
+                ) for item in items[i * 20:i * 20 + 20]
+            )
+            Payment.objects.create(
+                order=order,
+                stripe_session_id=f'cs_{i}',
+                status=Payment.PENDING,
+                event_created=timezone.now()
+            )
+            cls.orders.append(order)
+        # Each checkout gets its own items, so its taxes and discounts.
+        cls.items: list[Item] = items[40:42]
+        cls.staff = get_user_model().objects.create_superuser(
+            'admin',
+            password='-'
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(cache.clear)
+
+    def clear_caches(self):
+        cache.clear()
+        coupons_cache.clear()
+        tax_rates_cache.clear()
+
+    def get_urls(self) -> dict[str, str]:
+        return {
+            'item': f'/item/{self.items[0].id}/',
+            'order': f'/order/{self.orders[0].id}/',
+            'item-detail': f'/buy/{self.items[0].id}',
+            'order-detail': f'/buy/order/{self.orders[0].id}',
+            'buy-async': f'/buy/async/{self.items[1].id}',
+            'buy-order-async': f'/buy/order/async/{self.orders[1].id}',
+            **{
+                f'admin:orders_{model}_changelist':
+                    f'/admin/orders/{model}/'
+                for model in ('item', 'order', 'discount', 'tax', 'payment')
+            },
+        }
+
+    def get(self, name: str, url: str):
+        """Response of the url, async views through the ASGI handler."""
+
+        if name.endswith('-async'):
+            async def get():
+                return await self.async_client.get(url)
+
+            self.async_client.force_login(self.staff)
+            response = async_to_sync(get)()
+            response.request_stats = response.asgi_request.query_stats
+        else:
+            response = self.client.get(url)
+            response.request_stats = response.wsgi_request.query_stats
+        return response
+
+    def test_views_are_within_budget(self):
+        urls: dict[str, str] = self.get_urls()
+        self.assertEqual(set(urls), set(settings.QUERY_BUDGETS))
+
+        self.client.force_login(self.staff)
+        name: str
+        url: str
+        for name, url in urls.items():
+            with self.subTest(name):
+                self.clear_caches()
+                with self.assertNoLogs('orders.queries', 'WARNING'):
+                    response = self.get(name, url)
+
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(
+                    response.request_stats.count,
+                    settings.QUERY_BUDGETS[name]
+                )
+
+    def test_over_budget_request_is_logged(self):
+        with override_settings(QUERY_BUDGETS={'item': 0}):
+            with self.assertLogs('orders.queries', 'WARNING') as logs:
+                self.client.get(f'/item/{self.items[0].id}/')
+
+        self.assertEqual(logs.records[0].url_name, 'item')
+        self.assertEqual(logs.records[0].budget, 0)
+
+    def test_slow_query_is_logged_with_call_site(self):
+        with override_settings(QUERY_LOG={
+            **settings.QUERY_LOG,
+            'SLOW_THRESHOLD': 1e-9,
+        }):
+            with self.assertLogs('orders.queries', 'WARNING') as logs:
+                Item.objects.filter(id=self.items[0].id).exists()
+
+        self.assertTrue(logs.records[0].call_site.startswith(
+            'orders.tests:'
+        ))
+        self.assertIn('orders_item', logs.records[0].sql)
+
+
+class TracingTestCase(FakeGatewayMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.item: Item = Item.objects.create(
+            name='Item',
+            description='-',
+            price=10,
+            currency='usd'
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path: str = os.path.join(directory.name, 'traces.jsonl')
+        tracing = override_settings(TRACING={
+            **settings.TRACING,
+            'ENABLED': True,
+            'EXPORT_TO': self.path,
+        })
+        tracing.enable()
+        self.addCleanup(tracing.disable)
+
+    def get_spans(self) -> list[dict]:
+        get_tracer().exporter.flush()
+        with open(self.path) as file:
+            return [
+                span
+                for line in file
+                for resource in json.loads(line)['resourceSpans']
+                for scope in resource['scopeSpans']
+                for span in scope['spans']
+            ]
+
+    def get_attributes(self, span: dict) -> dict:
+        return {
+            attribute['key']: list(attribute['value'].values())[0]
+            for attribute in span['attributes']
+        }
+
+    def test_disabled_tracing_is_noop(self):
+        with override_settings(TRACING={**settings.TRACING, 'ENABLED': False}):
+            with start_span('checkout') as span:
+                self.assertIs(span, NOOP_SPAN)
+                self.assertIsNone(current_span.get())
+            self.assertIsNone(get_tracer().exporter)
+
+    def test_checkout_spans(self):
+        response = self.client.get(f'/buy/{self.item.id}')
+        self.assertEqual(response.status_code, 200)
+
+        spans: list[dict] = self.get_spans()
+        by_name: dict[str, dict] = {span['name']: span for span in spans}
+        request: dict = by_name['GET StripeItemView']
+        checkout: dict = by_name['checkout']
+        session: dict = by_name['stripe checkout.Session.create']
+
+        self.assertEqual({span['traceId'] for span in spans}, {
+            request['traceId'],
+        })
+        self.assertNotIn('parentSpanId', request)
+        self.assertEqual(checkout['parentSpanId'], request['spanId'])
+        self.assertEqual(
+            self.get_attributes(request)['http.status_code'],
+            '200'
+        )
+        self.assertEqual(
+            self.get_attributes(checkout)['orders.item_count'],
+            '1'
+        )
+        self.assertEqual(
+            self.get_attributes(session)['stripe.method'],
+            'checkout.Session.create'
+        )
+        self.assertIn('stripe Product.create', by_name)
+        self.assertTrue(any(
+            self.get_attributes(span).get('db.operation') == 'SELECT'
+            for span in spans
+        ))
+
+    def test_failed_stripe_call_span(self):
+        self.gateway.failure_rate = 1.0
+        with start_span('checkout'):
+            with self.assertRaises(stripe.error.StripeError):
+                self.gateway.create_product(name='Item')
+
+        span: dict = self.get_spans()[0]
+        self.assertEqual(span['name'], 'stripe Product.create')
+        self.assertEqual(span['status']['code'], 2)
+
+    def test_traceparent_continues_trace(self):
+        trace_id: str = '4bf92f3577b34da6a3ce929d0e0e4736'
+        self.client.get(
+            '/metrics',
+            HTTP_TRACEPARENT=f'00-{trace_id}-00f067aa0ba902b7-01'
+        )
+
+        span: dict = self.get_spans()[0]
+        self.assertEqual(span['traceId'], trace_id)
+        self.assertEqual(span['parentSpanId'], '00f067aa0ba902b7')
+        self.assertIsNone(parse_traceparent('00-' + '0' * 32 + '-1-01'))
@@ -0,0 +1,183 @@
+# Python
+from typing import (
+    Any,
+    Optional,
+)
+from contextlib import nullcontext
+from functools import lru_cache
+from threading import Lock
+import math
+import time
+
+# Django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpRequest
+
+# DRF
+from rest_framework.throttling import BaseThrottle
+
+# Local
+from .caches import LocalCache
+
+
+PERIODS = {
+    's': 1,
+    'm': 60,
+    'h': 60 * 60,
+    'd': 24 * 60 * 60,
+}
+
+
+class LocalBucketStore:
+    """Buckets of this process, least recently used ones evicted."""
+
+    def __init__(self, maxsize: int = 65536) -> None:
+        self.lock: Lock = Lock()
+        self._buckets: LocalCache = LocalCache(maxsize=maxsize)
+
+    def get(self, key: str) -> Optional[float]:
+        return self._buckets.get(key)
+
+    def set(self, key: str, value: float, timeout: int) -> None:
+        self._buckets.set(key, value, timeout)
+
+
+class CacheBucketStore:
+    """Buckets shared by all processes through the default cache.
+
+    Updates are read-then-write, so concurrent requests of one client
+    in different processes may overdraw a bucket by a token or two.
+    """
+
+    lock = nullcontext()
+
+    def get(self, key: str) -> Optional[float]:
+        return cache.get(f'orders:throttle:{key}')
+
+    def set(self, key: str, value: float, timeout: int) -> None:
+        cache.set(f'orders:throttle:{key}', value, timeout)
+
+
+class TokenBucket:
+    """Bucket of ``capacity`` tokens refilled evenly over ``period``.
+
+    Stores only the time the bucket will be full again (GCRA), so a
+    request costs one read and one write.
+    """
+
+    def __init__(
+        self,
+        scope: str,
+        capacity: int,
+        period: float,
+        store: Any
+    ) -> None:
+
+        self.scope: str = scope
+        self.capacity: int = capacity
+        self.interval: float = period / capacity
+        self.store: Any = store
+
+    def consume(self, key: str) -> float:
+        """Takes a token; returns 0 or seconds until one is available."""
+
+        key = f'{self.scope}:{key}'
+        with self.store.lock:
+            now: float = time.time()
+            full_at: float = max(self.store.get(key) or now, now)
+            wait: float = full_at - now - (self.capacity - 1) * self.interval
+            if wait > 0:
+                return wait
+
+            full_at += self.interval
+            self.store.set(key, full_at, math.ceil(full_at - now))
+            return 0.0
+
+
+def parse_rate(rate: str) -> tuple[int, int]:
+    """Capacity and period of a rate like ``'10/min'``."""
+
+    capacity, period = rate.split('/')
+    return int(capacity), PERIODS[period[0]]
+
+
+@lru_cache(maxsize=None)
+def get_bucket(scope: str) -> Optional[TokenBucket]:
+    """Bucket of a scope configured by ``settings.CHECKOUT_THROTTLE``."""
+
+    config: dict = settings.CHECKOUT_THROTTLE
+    rate: Optional[str] = config['RATES'].get(scope)
+    if not rate:
+        return None
+
+    capacity: int
+    period: int
+    capacity, period = parse_rate(rate)
+    return TokenBucket(
+        scope,
+        capacity,
+        period,
+        CacheBucketStore() if config['BACKEND'] == 'cache'
+        else LocalBucketStore()
+    )
+
+
+@receiver(setting_changed)
+def reset_buckets(setting: str, **kwargs: Any) -> None:
+    if setting == 'CHECKOUT_THROTTLE':
+        get_bucket.cache_clear()
+
+
+class CheckoutThrottle(BaseThrottle):
+    """Token-bucket throttle of checkouts by client IP or session.
+
+    Needs no authentication, and by IP no database, so throttled
+    requests are answered before any query or Stripe call. By session
+    it reads the session store once.
+    """
+
+    scope: str = ''
+
+    def get_client_key(self, request: HttpRequest) -> str:
+        """Session of the client if the store knows it, else its IP.
+
+        The session key comes from a cookie the client controls, so a
+        new random one per request would otherwise get a fresh bucket.
+        """
+
+        if settings.CHECKOUT_THROTTLE['KEY'] == 'session':
+            session_key: Optional[str] = request.session.session_key
+            if session_key and request.session.exists(session_key):
+                return f'session:{session_key}'
+
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request: HttpRequest, view: Any) -> bool:
+        self.wait_time: float = 0.0
+        bucket: Optional[TokenBucket] = get_bucket(self.scope)
+        if bucket:
+            self.wait_time = bucket.consume(self.get_client_key(request))
+
+        return not self.wait_time
+
+    async def aallow_request(self, request: HttpRequest, view: Any) -> bool:
+        """Async ``allow_request``, reading the session store off the loop."""
+
+        if settings.CHECKOUT_THROTTLE['KEY'] == 'session':
+            return await sync_to_async(self.allow_request)(request, view)
+        return self.allow_request(request, view)
+
+    def wait(self) -> float:
+        return self.wait_time
+
+
+class ItemCheckoutThrottle(CheckoutThrottle):
+    scope = 'checkout_item'
+
+
+class OrderCheckoutThrottle(CheckoutThrottle):
+    scope = 'checkout_order'
@@ -0,0 +1,383 @@
+# Python
+from typing import (
+    Any,
+    Callable,
+    Iterator,
+    Optional,
+    Union,
+)
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import (
+    lru_cache,
+    wraps,
+)
+from threading import Thread
+import atexit
+import json
+import logging
+import queue
+import random
+import re
+import time
+import urllib.request
+
+# Django
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+# Span kinds of OTLP.
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_ERROR = 2
+
+# W3C trace context of an incoming request: version-trace-parent-flags.
+TRACEPARENT_PATTERN = re.compile(
+    r'00-(?P<trace_id>[0-9a-f]{32})-(?P<span_id>[0-9a-f]{16})-[0-9a-f]{2}'
+)
+
+
+def get_otlp_value(value: Any) -> dict[str, Any]:
+    """Attribute value in the OTLP JSON encoding."""
+
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def get_otlp_attributes(attributes: dict[str, Any]) -> list[dict]:
+    return [
+        {'key': key, 'value': get_otlp_value(value)}
+        for key, value in attributes.items()
+    ]
+
+
+class Span:
+    """Timed operation of a trace, exported once it ends."""
+
+    def __init__(
+        self,
+        name: str,
+        kind: int,
+        trace_id: str,
+        parent_id: str = '',
+        attributes: Optional[dict[str, Any]] = None
+    ) -> None:
+
+        self.name: str = name
+        self.kind: int = kind
+        self.trace_id: str = trace_id
+        self.span_id: str = '%016x' % random.getrandbits(64)
+        self.parent_id: str = parent_id
+        self.attributes: dict[str, Any] = dict(attributes or {})
+        self.error: Optional[str] = None
+        self.start: int = time.time_ns()
+        self.end: int = 0
+
+    def update_name(self, name: str) -> None:
+        self.name = name
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, message: str) -> None:
+        self.error = message
+
+    def to_otlp(self) -> dict[str, Any]:
+        data: dict[str, Any] = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end),
+            'attributes': get_otlp_attributes(self.attributes),
+        }
+        if self.parent_id:
+            data['parentSpanId'] = self.parent_id
+        if self.error is not None:
+            data['status'] = {'code': STATUS_ERROR, 'message': self.error}
+        return data
+
+
+class NoopSpan:
+    """Span of disabled tracing; every method does nothing."""
+
+    def update_name(self, name: str) -> None:
+        pass
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_error(self, message: str) -> None:
+        pass
+
+
+NOOP_SPAN: NoopSpan = NoopSpan()
+
+# Span being recorded; copied into tasks and sync_to_async threads.
+current_span: ContextVar[Optional[Span]] = ContextVar(
+    'current_span',
+    default=None
+)
+
+
+class SpanExporter:
+    """Thread exporting ended spans in batches as OTLP JSON.
+
+    ``export_to`` is either an OTLP/HTTP url of a collector, like
+    ``http://localhost:4318/v1/traces``, or a file that gets one
+    request per line, as the collector's ``otlpjsonfile`` receiver
+    reads. Spans are dropped and counted when the queue is full.
+    """
+
+    def __init__(
+        self,
+        export_to: str,
+        service_name: str,
+        batch_size: int = 512,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000
+    ) -> None:
+
+        self.export_to: str = export_to
+        self.service_name: str = service_name
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.queue: queue.Queue = queue.Queue(max_queue)
+        self.dropped: int = 0
+        self._thread: Thread = Thread(
+            target=self.run,
+            name='tracing-exporter',
+            daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def export(self, span: Span) -> None:
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def get_payload(self, spans: list[Span]) -> dict[str, Any]:
+        """``ExportTraceServiceRequest`` of the spans."""
+
+        return {'resourceSpans': [{
+            'resource': {'attributes': get_otlp_attributes({
+                'service.name': self.service_name,
+            })},
+            'scopeSpans': [{
+                'scope': {'name': 'orders'},
+                'spans': [span.to_otlp() for span in spans],
+            }],
+        }]}
+
+    def write(self, spans: list[Span]) -> None:
+        data: bytes = json.dumps(self.get_payload(spans)).encode()
+        if self.export_to.startswith(('http://', 'https://')):
+            with urllib.request.urlopen(urllib.request.Request(
+                self.export_to,
+                data=data,
+                headers={'Content-Type': 'application/json'}
+            ), timeout=10):
+                return
+
+        with open(self.export_to, 'ab') as file:
+            file.write(data + b'\n')
+
+    def get_batch(self) -> list[Optional[Span]]:
+        """Spans queued within the flush interval; None stops the thread."""
+
+        batch: list[Optional[Span]] = []
+        try:
+            batch.append(self.queue.get(timeout=self.flush_interval))
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def run(self) -> None:
+        while True:
+            batch: list[Optional[Span]] = self.get_batch()
+            spans: list[Span] = [span for span in batch if span is not None]
+            if spans:
+                try:
+                    self.write(spans)
+                except Exception as e:
+                    logger.warning(
+                        'Export of %d spans failed: %s',
+                        len(spans),
+                        e
+                    )
+            for _ in batch:
+                self.queue.task_done()
+            if batch and batch[-1] is None:
+                return
+
+    def flush(self) -> None:
+        """Waits until queued spans are exported."""
+
+        if self._thread.is_alive():
+            self.queue.join()
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout=self.flush_interval + 10)
+
+
+class Tracer:
+    """Tracing configuration with the exporter of enabled tracing."""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        service_name: str = 'orders',
+        export_to: str = 'traces.jsonl',
+        batch_size: int = 512,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+        max_statement_length: int = 1000
+    ) -> None:
+
+        self.enabled: bool = enabled
+        self.max_statement_length: int = max_statement_length
+        self.exporter: Optional[SpanExporter] = SpanExporter(
+            export_to,
+            service_name,
+            batch_size,
+            flush_interval,
+            max_queue
+        ) if enabled else None
+
+
+@lru_cache(maxsize=None)
+def get_tracer() -> Tracer:
+    """Tracer configured by ``settings.TRACING``."""
+
+    return Tracer(**{
+        key.lower(): value for key, value in settings.TRACING.items()
+    })
+
+
+@receiver(setting_changed)
+def reset_tracer(setting: str, **kwargs: Any) -> None:
+    if setting == 'TRACING':
+        if get_tracer.cache_info().currsize and get_tracer().exporter:
+            get_tracer().exporter.close()
+        get_tracer.cache_clear()
+
+
+def parse_traceparent(header: str) -> Optional[tuple[str, str]]:
+    """Trace and parent span ids of a W3C ``traceparent`` header."""
+
+    match = TRACEPARENT_PATTERN.fullmatch(header)
+    if match is None or not int(match['trace_id'], 16) or (
+        not int(match['span_id'], 16)
+    ):
+        return None
+    return match['trace_id'], match['span_id']
+
+
+@contextmanager
+def start_span(
+    name: str,
+    kind: int = SPAN_KIND_INTERNAL,
+    attributes: Optional[dict[str, Any]] = None,
+    parent: Optional[tuple[str, str]] = None
+) -> Iterator[Union[Span, NoopSpan]]:
+    """Records the block as a child of the current span or ``parent``.
+
+    Yields a no-op span while tracing is disabled. Exceptions leaving
+    the block mark the span as failed.
+    """
+
+    tracer: Tracer = get_tracer()
+    if not tracer.enabled:
+        yield NOOP_SPAN
+        return
+
+    trace_id: str
+    parent_id: str
+    current: Optional[Span] = current_span.get()
+    if parent is not None:
+        trace_id, parent_id = parent
+    elif current is not None:
+        trace_id, parent_id = current.trace_id, current.span_id
+    else:
+        trace_id, parent_id = '%032x' % random.getrandbits(128), ''
+
+    span: Span = Span(name, kind, trace_id, parent_id, attributes)
+    token = current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.set_attribute('exception.type', type(e).__name__)
+        span.set_error(str(e))
+        raise
+    finally:
+        current_span.reset(token)
+        span.end = time.time_ns()
+        tracer.exporter.export(span)
+
+
+def trace_query(
+    execute: Callable,
+    sql: str,
+    params: Any,
+    many: bool,
+    context: dict
+) -> Any:
+    """Database execute wrapper opening a span per query of a trace."""
+
+    if current_span.get() is None:
+        return execute(sql, params, many, context)
+
+    operation: str = sql.split(None, 1)[0].upper() if sql else ''
+    attributes: dict[str, Any] = {
+        'db.system': context['connection'].vendor,
+        'db.operation': operation,
+        'db.statement': sql[:get_tracer().max_statement_length],
+    }
+    if many:
+        attributes['db.executemany'] = True
+    with start_span(f'db {operation}', SPAN_KIND_CLIENT, attributes):
+        return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_tracer(
+    connection: BaseDatabaseWrapper,
+    **kwargs: Any
+) -> None:
+    if trace_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(trace_query)
+
+
+def trace_stripe_call(call: Callable) -> Callable:
+    """Decorates gateway ``call`` to record it as a client span."""
+
+    @wraps(call)
+    def wrapper(self: Any, method: str, *args: Any, **params: Any) -> Any:
+        with start_span(
+            f'stripe {method}',
+            SPAN_KIND_CLIENT,
+            {'stripe.method': method}
+        ):
+            return call(self, method, *args, **params)
+
+    return wrapper
@@ -1,10 +1,35 @@
+# Python
+from typing import (
+    Any,
+    Optional,
+)
+import datetime
+import logging
+import math
+import time
+
 # Django
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import (
+    require_GET,
+    require_POST,
+)
+from django.core.exceptions import ImproperlyConfigured
 from django.core.handlers.wsgi import WSGIRequest
-from django.http import HttpResponse
+from django.http import (
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.conf import settings
-from django.db.models import QuerySet
+from django.db.models import (
+    QuerySet,
+    Prefetch,
+)
 
 # DRF
 from rest_framework.viewsets import ViewSet
@@ -15,95 +40,167 @@ from rest_framework.response import Response as DRF_Response
 import stripe
 
 # Local
+from .cart import CheckoutCart
+from .caches import get_version
+from .exports import (
+    FORMATS,
+    get_export_orders,
+    iter_order_rows,
+    parse_moment,
+)
+from .metrics import registry
 from .mixins import (
-    HttpResponseMixin,
+    CachedHttpResponseMixin,
+    ConditionalResponseMixin,
     JsonResponseMixin,
 )
 from .models import (
     Item,
     Order,
-    Discount
+    OrderLine,
+    get_fingerprint,
+)
+from .profiling import (
+    PROFILE_HEADER,
+    Profiler,
+    get_profiler,
 )
+from .resilience import CircuitOpenError
+from .throttling import (
+    CheckoutThrottle,
+    ItemCheckoutThrottle,
+    OrderCheckoutThrottle,
+)
+from .webhooks import receive_event
+
 
+logger: logging.Logger = logging.getLogger(__name__)
 
-stripe.api_key = settings.STRIPE_PRIVATE_KEY
 
-class ItemView(View, HttpResponseMixin):
+class ItemView(View, CachedHttpResponseMixin):
     """View by Item."""
 
     template_name = 'orders/item.html'
+    cache_prefix = 'item'
+    cache_versions = (
+        'item',
+        'discount',
+        'tax',
+    )
 
-    def get(
+    def get_object(self, pk: int) -> Optional[Item]:
+        return Item.objects.get_if_exist(pk)
+
+    def get_validators(
         self,
-        request: WSGIRequest,
-        pk: int,
-        *args: tuple,
-        **kwargs: dict
-    ) -> HttpResponse:
-        
-        item: Item = Item.objects.get_if_exist(pk)
-        discount_price: int = None
-        if not item:
-            return self.get_http_error(
-                request=request,
-                error_message=f"Object {pk} does not exist"
-            )
+        item: Item
+    ) -> tuple[str, datetime.datetime]:
 
-        disconts: QuerySet[Discount] = Discount.objects.filter(
-            item=item.id
-        )
-        if disconts:
-            discount_price =\
-                item.price * disconts.last().persent / 100 
-            discount_price = item.price - discount_price
-
-        return self.get_http_response(
-            request=request,
-            template_name=self.template_name,
-            context={
-                "ctx_obj": item,
-                "ctx_discount_price": discount_price,
-                "ctx_discount": disconts.last(),
-                "ctx_stripe_pk": settings.STRIPE_PUBLIC_KEY
-            }
-        )
+        return get_fingerprint(
+            item.id,
+            item.updated_at,
+            item.effective_price,
+        ), item.updated_at
+
+    def get_context_data(self, item: Item) -> dict:
+        return {
+            "ctx_obj": item,
+            "ctx_discount_price": (
+                item.effective_price if item.is_discounted else None
+            ),
+            "ctx_discount_persent": item.discount_persent,
+            "ctx_stripe_pk": settings.STRIPE_PUBLIC_KEY
+        }
 
 
-class OrderView(View, HttpResponseMixin):
+class OrderView(View, CachedHttpResponseMixin):
     """View by Item."""
 
     template_name = 'orders/order.html'
+    cache_prefix = 'order'
+    cache_versions = (
+        'order',
+        'item',
+        'discount',
+        'tax',
+    )
 
-    def get(
-        self,
-        request: WSGIRequest,
-        pk: int,
-        *args: tuple,
-        **kwargs: dict
-    ) -> HttpResponse:
-        
-        order: Order = Order.objects.get_if_exist(pk)
-        if not order:
-            return self.get_http_error(
-                request=request,
-                error_message=f"Object {pk} does not exist"
+    def get_object(self, pk: int) -> Optional[Order]:
+        return Order.objects.prefetch_related(
+            Prefetch(
+                'lines',
+                queryset=OrderLine.objects.select_related('item')
             )
+        ).filter(
+            id=pk
+        ).first()
+
+    def get_validators(
+        self,
+        order: Order
+    ) -> tuple[str, datetime.datetime]:
 
-        return self.get_http_response(
-            request=request,
-            template_name=self.template_name,
-            context={
-                "ctx_order": order,
-                "ctx_objs": order.item.get_queryset(),
-                "ctx_stripe_pk": settings.STRIPE_PUBLIC_KEY
-            }
+        lines: list[OrderLine] = order.lines.all()
+        return get_fingerprint(
+            order.id,
+            order.updated_at,
+            [
+                (line.id, line.quantity, line.item.updated_at)
+                for line in lines
+            ],
+        ), max(
+            [order.updated_at] + [line.item.updated_at for line in lines]
         )
 
+    def get_context_data(self, order: Order) -> dict:
+        return {
+            "ctx_order": order,
+            "ctx_lines": order.lines.all(),
+            "ctx_stripe_pk": settings.STRIPE_PUBLIC_KEY
+        }
+
+
+def get_checkout_etag(*parts: Any) -> str:
+    """ETag of a checkout response, valid within one reuse window.
+
+    The window keeps browsers from reusing a session id far longer
+    than the session stays open.
+    """
+
+    return get_fingerprint(
+        *parts,
+        get_version('tax'),
+        int(time.time() // settings.CHECKOUT_ETAG_WINDOW),
+    )
 
-class StripeItemView(ViewSet, JsonResponseMixin):
+
+def get_item_checkout_etag(item: Item) -> str:
+    return get_checkout_etag(
+        'item',
+        item.id,
+        item.updated_at,
+        item.effective_price,
+    )
+
+
+def get_order_checkout_etag(order: Order) -> str:
+    return get_checkout_etag(
+        'order',
+        order.id,
+        order.updated_at,
+        [
+            (line.id, line.quantity, line.item.effective_price)
+            for line in order.lines.all()
+        ],
+    )
+
+
+class StripeItemView(ViewSet, JsonResponseMixin, ConditionalResponseMixin):
     """REST view for Stripe."""
 
     queryset: QuerySet[Item] = Item.objects.all()
+    authentication_classes = ()
+    throttle_classes = (ItemCheckoutThrottle,)
 
     def retrieve(
         self, 
@@ -112,7 +209,6 @@ class StripeItemView(ViewSet, JsonResponseMixin):
     ) -> DRF_Response:
         """Handles GET-request with ID to show stripe id."""
 
-        line_items: list[dict] = []
         item: Item = None
         try:
             item = self.queryset.get(id=pk)
@@ -121,22 +217,40 @@ class StripeItemView(ViewSet, JsonResponseMixin):
                 'message': f'Object {pk} does not exist'
             })
 
-        line_items = item.get_stripe_dict(line_items)
-        checkout_session = item.get_stripe_session(line_items)
+        etag: str = get_item_checkout_etag(item)
+        not_modified: Optional[HttpResponse] =\
+            self.get_not_modified_response(request, etag)
+        if not_modified:
+            return self.set_validators(not_modified, etag)
+
+        try:
+            checkout_session = CheckoutCart([item]).get_stripe_session()
+        except CircuitOpenError as e:
+            return self.get_unavailable_response(e.retry_after)
         if not checkout_session:
             return self.get_json_response({
                 'message': 'Server error'
             }, 500)
         
-        return self.get_json_response({
-            "id": checkout_session.id
-        })
+        return self.set_validators(
+            self.get_json_response({
+                "id": checkout_session.id
+            }),
+            etag
+        )
 
 
-class StripeOrderView(ViewSet, JsonResponseMixin):
+class StripeOrderView(ViewSet, JsonResponseMixin, ConditionalResponseMixin):
     """REST view for Stripe."""
 
-    queryset: QuerySet[Order] = Order.objects.all()
+    queryset: QuerySet[Order] = Order.objects.prefetch_related(
+        Prefetch(
+            'lines',
+            queryset=OrderLine.objects.select_related('item')
+        )
+    )
+    authentication_classes = ()
+    throttle_classes = (OrderCheckoutThrottle,)
 
     def retrieve(
         self, 
@@ -145,25 +259,241 @@ class StripeOrderView(ViewSet, JsonResponseMixin):
     ) -> DRF_Response:
         """Handles GET-request with ID to show stripe id."""
 
-        line_items: list[dict] = []
         order: Order = None
         try:
-            items = self.queryset.get(id=pk).item.get_queryset()
-        except Item.DoesNotExist:
+            order = self.queryset.get(id=pk)
+        except Order.DoesNotExist:
             return self.get_json_response({
                 'message': f'Object {pk} does not exist'
             })
-        
-        item: Item
-        for item in items:
-            line_items = item.get_stripe_dict(line_items)
 
-        checkout_session = item.get_stripe_session(line_items)
+        etag: str = get_order_checkout_etag(order)
+        not_modified: Optional[HttpResponse] =\
+            self.get_not_modified_response(request, etag)
+        if not_modified:
+            return self.set_validators(not_modified, etag)
+
+        try:
+            checkout_session = CheckoutCart.from_order(
+                order
+            ).get_stripe_session()
+        except CircuitOpenError as e:
+            return self.get_unavailable_response(e.retry_after)
         if not checkout_session:
             return self.get_json_response({
                 'message': 'Server error'
             }, 501)
         
-        return self.get_json_response({
-            "id": checkout_session.id
-        })
+        return self.set_validators(
+            self.get_json_response({
+                "id": checkout_session.id
+            }),
+            etag
+        )
+
+
+class AsyncStripeView(View, ConditionalResponseMixin):
+    """Async checkout view for the ASGI stack.
+
+    Stripe calls run concurrently in worker threads, so one event loop
+    holds many checkouts in flight instead of a thread per checkout.
+    """
+
+    error_code: int = 500
+    throttle_class: type[CheckoutThrottle] = CheckoutThrottle
+
+    async def get_object(self, pk: int) -> Optional[Any]:
+        raise NotImplementedError
+
+    def get_etag(self, obj: Any) -> str:
+        raise NotImplementedError
+
+    def get_cart(self, obj: Any) -> CheckoutCart:
+        raise NotImplementedError
+
+    async def get(
+        self,
+        request: WSGIRequest,
+        pk: int,
+        *args: tuple,
+        **kwargs: dict
+    ) -> HttpResponse:
+        """Handles GET-request with ID to show stripe id."""
+
+        throttle: CheckoutThrottle = self.throttle_class()
+        if not await throttle.aallow_request(request, self):
+            wait: str = str(math.ceil(throttle.wait()))
+            response: HttpResponse = JsonResponse({
+                'detail': (
+                    'Request was throttled. '
+                    f'Expected available in {wait} seconds.'
+                )
+            }, status=429)
+            response['Retry-After'] = wait
+            return response
+
+        obj: Optional[Any] = await self.get_object(pk)
+        if not obj:
+            return JsonResponse({
+                'message': f'Object {pk} does not exist'
+            })
+
+        # Both may read the cache and related rows.
+        etag: str = await sync_to_async(self.get_etag)(obj)
+        not_modified: Optional[HttpResponse] =\
+            self.get_not_modified_response(request, etag)
+        if not_modified:
+            return self.set_validators(not_modified, etag)
+
+        cart: CheckoutCart = await sync_to_async(self.get_cart)(obj)
+        try:
+            checkout_session = await cart.aget_stripe_session()
+        except CircuitOpenError as e:
+            response = JsonResponse({
+                'message': 'Payment service unavailable'
+            }, status=503)
+            response['Retry-After'] = str(math.ceil(e.retry_after))
+            return response
+        if not checkout_session:
+            return JsonResponse({
+                'message': 'Server error'
+            }, status=self.error_code)
+
+        return self.set_validators(
+            JsonResponse({
+                "id": checkout_session.id
+            }),
+            etag
+        )
+
+
+class AsyncStripeItemView(AsyncStripeView):
+    """Async checkout of Item."""
+
+    throttle_class = ItemCheckoutThrottle
+
+    async def get_object(self, pk: int) -> Optional[Item]:
+        return await Item.objects.filter(id=pk).afirst()
+
+    def get_etag(self, item: Item) -> str:
+        return get_item_checkout_etag(item)
+
+    def get_cart(self, item: Item) -> CheckoutCart:
+        return CheckoutCart([item])
+
+
+class AsyncStripeOrderView(AsyncStripeView):
+    """Async checkout of Order."""
+
+    throttle_class = OrderCheckoutThrottle
+
+    error_code = 501
+
+    async def get_object(self, pk: int) -> Optional[Order]:
+        return await StripeOrderView.queryset.filter(id=pk).afirst()
+
+    def get_etag(self, order: Order) -> str:
+        return get_order_checkout_etag(order)
+
+    def get_cart(self, order: Order) -> CheckoutCart:
+        return CheckoutCart.from_order(order)
+
+
+@csrf_exempt
+@require_POST
+def stripe_webhook(request: WSGIRequest) -> HttpResponse:
+    """Acknowledges a Stripe event after queueing it for workers."""
+
+    try:
+        receive_event(
+            request.body,
+            request.headers.get('Stripe-Signature', '')
+        )
+    except (ValueError, KeyError, stripe.error.SignatureVerificationError):
+        return JsonResponse({
+            'message': 'Invalid event'
+        }, status=400)
+    except ImproperlyConfigured as e:
+        logger.error('Stripe webhook refused: %s', e)
+        return JsonResponse({
+            'message': 'Webhooks are not configured'
+        }, status=503)
+
+    return JsonResponse({
+        'received': True
+    })
+
+
+@staff_member_required
+@require_GET
+def export_orders(request: WSGIRequest) -> HttpResponse:
+    """Streams order lines as CSV or JSON Lines for reporting."""
+
+    format: str = request.GET.get('format', 'csv')
+    bounds: dict[str, Optional[datetime.datetime]] = {
+        name: parse_moment(request.GET[name])
+        for name in ('since', 'until')
+        if request.GET.get(name)
+    }
+    if format not in FORMATS or None in bounds.values():
+        return JsonResponse({
+            'message': 'Invalid export parameters'
+        }, status=400)
+
+    encode, content_type = FORMATS[format]
+    response: StreamingHttpResponse = StreamingHttpResponse(
+        encode(iter_order_rows(get_export_orders(
+            status=request.GET.get('status'),
+            **bounds
+        ))),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="orders.{format}"'
+    )
+    return response
+
+
+@require_GET
+def metrics(request: WSGIRequest) -> HttpResponse:
+    """Metrics of all worker processes in the Prometheus text format."""
+
+    token: str = settings.METRICS['TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=403)
+
+    return HttpResponse(
+        registry.expose(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+@staff_member_required
+def profiles(request: WSGIRequest) -> HttpResponse:
+    """Stack profiles of sampled requests, per view.
+
+    GET lists the profiled views with a token for the ``X-Profile``
+    header; with ``?view=`` it returns the collapsed stacks of a view
+    for flamegraph.pl or speedscope. POST clears the profiles.
+    """
+
+    profiler: Profiler = get_profiler()
+    if request.method == 'POST':
+        profiler.store.clear()
+        return HttpResponse(status=204)
+    if request.method != 'GET':
+        return HttpResponse(status=405, headers={'Allow': 'GET, POST'})
+
+    view: Optional[str] = request.GET.get('view')
+    if view is not None:
+        return HttpResponse(
+            profiler.store.get_collapsed(view),
+            content_type='text/plain; charset=utf-8'
+        )
+
+    return JsonResponse({
+        'sample_rate': profiler.sample_rate,
+        'header': PROFILE_HEADER,
+        'token': profiler.get_token(),
+        'views': profiler.store.get_summary(),
+    })
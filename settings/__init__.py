@@ -3,15 +3,22 @@ from typing import (
     Any, 
     Type,
 )
-from decouple import config
+from decouple import (
+    config,
+    undefined,
+)
 
 # Django
 from django.core.exceptions import ImproperlyConfigured
 
 
-def get_env_variable(env_variable: str, type: Type) -> Any:
+def get_env_variable(
+    env_variable: str,
+    type: Type,
+    default: Any = undefined
+) -> Any:
     try:
-        return config(env_variable, cast=type)
+        return config(env_variable, cast=type, default=default)
     except KeyError:
         raise ImproperlyConfigured(
             f'Set {env_variable} environment variable'
@@ -27,6 +27,10 @@ PROJECT_APPS = [
 INSTALLED_APPS = DJANGO_AND_THIRD_PARTY_APPS + PROJECT_APPS
 
 MIDDLEWARE = [
+    'orders.middleware.RequestIdMiddleware',
+    'orders.middleware.TracingMiddleware',
+    'orders.middleware.MetricsMiddleware',
+    'orders.middleware.ProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
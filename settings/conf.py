@@ -1,5 +1,6 @@
 # Python
 from pathlib import Path
+import json
 import sys
 import os
 
@@ -37,6 +38,70 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Logging
+
+# Records are written as JSON ("json") or plain lines ("text") to stderr by a
+# background thread, so logging never blocks a request on I/O
+LOG_FORMAT = get_env_variable('LOG_FORMAT', str, 'json')
+
+LOG_LEVEL = get_env_variable('LOG_LEVEL', str, 'INFO')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {
+            '()': 'orders.logs.RequestIdFilter',
+        },
+    },
+    'formatters': {
+        'json': {
+            '()': 'orders.logs.JsonFormatter',
+        },
+        'text': {
+            'format': (
+                '%(asctime)s %(levelname)s %(name)s '
+                '[%(request_id)s] %(message)s'
+            ),
+        },
+    },
+    'handlers': {
+        'background': {
+            '()': 'orders.logs.BackgroundHandler',
+            'formatter': LOG_FORMAT,
+            'filters': ['request_id'],
+        },
+    },
+    'root': {
+        'handlers': ['background'],
+        'level': LOG_LEVEL,
+    },
+    'loggers': {
+        'django': {
+            'handlers': [],
+            'level': get_env_variable('DJANGO_LOG_LEVEL', str, LOG_LEVEL),
+        },
+        'orders': {
+            'level': get_env_variable('ORDERS_LOG_LEVEL', str, LOG_LEVEL),
+        },
+    },
+}
+
+# Cache
+
+CACHES = {
+    'default': {
+        'BACKEND': get_env_variable(
+            'CACHE_BACKEND',
+            str,
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': get_env_variable('CACHE_LOCATION', str, ''),
+    }
+}
+
+PAGE_CACHE_TIMEOUT = get_env_variable('PAGE_CACHE_TIMEOUT', int, 60 * 60)
+
 # SHELL_PLUS
 
 SHELL_PLUS = "ipython"
@@ -94,3 +159,131 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 STRIPE_PUBLIC_KEY = get_env_variable('STRIPE_PUBLIC_KEY', str)
 
 STRIPE_PRIVATE_KEY = get_env_variable('STRIPE_PRIVATE_KEY', str)
+
+# orders.gateway.StripeAPIGateway, FakeStripeGateway or RecordReplayGateway,
+# by default wrapped by orders.resilience.ResilientGateway with OPTIONS
+# {"backend": ..., "deadline": ..., "max_retries": ..., "failure_rate": ...}
+STRIPE_GATEWAY = {
+    'BACKEND': get_env_variable(
+        'STRIPE_GATEWAY_BACKEND',
+        str,
+        'orders.resilience.ResilientGateway'
+    ),
+    'OPTIONS': get_env_variable('STRIPE_GATEWAY_OPTIONS', json.loads, '{}'),
+}
+
+# Webhooks are refused with 503 until it is set: an empty key verifies any
+# signature
+STRIPE_WEBHOOK_SECRET = get_env_variable('STRIPE_WEBHOOK_SECRET', str, '')
+
+# Seconds a signed webhook stays acceptable, against replays
+STRIPE_WEBHOOK_TOLERANCE = get_env_variable(
+    'STRIPE_WEBHOOK_TOLERANCE',
+    int,
+    5 * 60
+)
+
+# Shared keep-alive connection pool for the Stripe API
+STRIPE_HTTP_CLIENT = {
+    'POOL_CONNECTIONS': get_env_variable('STRIPE_POOL_CONNECTIONS', int, 4),
+    'POOL_MAXSIZE': get_env_variable('STRIPE_POOL_MAXSIZE', int, 16),
+    'POOL_BLOCK': get_env_variable('STRIPE_POOL_BLOCK', bool, False),
+    'CONNECT_TIMEOUT': get_env_variable('STRIPE_CONNECT_TIMEOUT', float, 5.0),
+    'READ_TIMEOUT': get_env_variable('STRIPE_READ_TIMEOUT', float, 30.0),
+    'KEEPALIVE': get_env_variable('STRIPE_KEEPALIVE', int, 60),
+}
+
+# Seconds a browser may revalidate a checkout session id with ETag
+CHECKOUT_ETAG_WINDOW = get_env_variable('CHECKOUT_ETAG_WINDOW', int, 10 * 60)
+
+# Token buckets of checkout endpoints per client IP or stored session (unknown
+# session cookies fall back to the IP), kept in this process ("local") or
+# shared through the cache ("cache")
+CHECKOUT_THROTTLE = {
+    'BACKEND': get_env_variable('CHECKOUT_THROTTLE_BACKEND', str, 'local'),
+    'KEY': get_env_variable('CHECKOUT_THROTTLE_KEY', str, 'ip'),
+    'RATES': {
+        'checkout_item': get_env_variable(
+            'CHECKOUT_ITEM_RATE',
+            str,
+            '30/min'
+        ),
+        'checkout_order': get_env_variable(
+            'CHECKOUT_ORDER_RATE',
+            str,
+            '10/min'
+        ),
+    },
+}
+
+# Seconds before expiry a cached checkout session stops being reused
+CHECKOUT_SESSION_MARGIN = get_env_variable(
+    'CHECKOUT_SESSION_MARGIN',
+    int,
+    5 * 60
+)
+
+# Seconds one Stripe idempotency key is used for identical checkouts
+CHECKOUT_IDEMPOTENCY_WINDOW = get_env_variable(
+    'CHECKOUT_IDEMPOTENCY_WINDOW',
+    int,
+    10 * 60
+)
+
+# Metrics scraped at /metrics. Worker processes of one host merge their
+# counters through snapshot files in DIRECTORY; TOKEN, if set, is required
+# as "Authorization: Bearer <token>"
+METRICS = {
+    'DIRECTORY': get_env_variable('METRICS_DIRECTORY', str, ''),
+    'FLUSH_INTERVAL': get_env_variable('METRICS_FLUSH_INTERVAL', float, 5.0),
+    'TOKEN': get_env_variable('METRICS_TOKEN', str, ''),
+}
+
+# Sampling profiler of a share of requests, and of requests whose X-Profile
+# header holds a token from the staff-only admin/profiles/ view
+PROFILER = {
+    'SAMPLE_RATE': get_env_variable('PROFILER_SAMPLE_RATE', float, 0.0),
+    'INTERVAL': get_env_variable('PROFILER_INTERVAL', float, 0.005),
+    'MAX_DEPTH': get_env_variable('PROFILER_MAX_DEPTH', int, 64),
+    'MAX_STACKS': get_env_variable('PROFILER_MAX_STACKS', int, 5000),
+    'TOKEN_MAX_AGE': get_env_variable('PROFILER_TOKEN_MAX_AGE', int, 60 * 60),
+}
+
+# Queries slower than SLOW_THRESHOLD seconds are logged with their call site
+QUERY_LOG = {
+    'SLOW_THRESHOLD': get_env_variable('SLOW_QUERY_THRESHOLD', float, 0.5),
+    'MAX_SQL_LENGTH': get_env_variable('SLOW_QUERY_MAX_SQL', int, 2000),
+}
+
+# Most queries a request may make, by URL name; requests over it are logged
+# and QueryBudgetTestCase fails on a seeded catalog. Checkouts include the
+# updates saving Stripe ids of items, taxes and discounts synced on the way
+QUERY_BUDGETS = {
+    'item': 1,
+    'order': 2,
+    'item-detail': 6,
+    'order-detail': 6,
+    'buy-async': 6,
+    'buy-order-async': 6,
+    'admin:orders_item_changelist': 5,
+    'admin:orders_order_changelist': 5,
+    'admin:orders_discount_changelist': 6,
+    'admin:orders_tax_changelist': 6,
+    'admin:orders_payment_changelist': 5,
+}
+
+# Spans of requests, queries and Stripe calls as OTLP JSON, appended to a
+# file or posted to a collector url like http://localhost:4318/v1/traces
+TRACING = {
+    'ENABLED': get_env_variable('TRACING_ENABLED', bool, False),
+    'SERVICE_NAME': get_env_variable('TRACING_SERVICE_NAME', str, 'orders'),
+    'EXPORT_TO': get_env_variable('TRACING_EXPORT_TO', str, 'traces.jsonl'),
+    'BATCH_SIZE': get_env_variable('TRACING_BATCH_SIZE', int, 512),
+    'FLUSH_INTERVAL': get_env_variable('TRACING_FLUSH_INTERVAL', float, 1.0),
+    'MAX_QUEUE': get_env_variable('TRACING_MAX_QUEUE', int, 10000),
+    'MAX_STATEMENT_LENGTH': get_env_variable(
+        'TRACING_MAX_STATEMENT_LENGTH',
+        int,
+        1000
+    ),
+}
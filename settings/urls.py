@@ -16,13 +16,23 @@ from orders.views import (
     StripeItemView,
     OrderView,
     StripeOrderView,
+    AsyncStripeItemView,
+    AsyncStripeOrderView,
+    stripe_webhook,
+    export_orders,
+    metrics,
+    profiles,
 )
 
 
 urlpatterns = [
+    path('admin/profiles/', profiles, name='profiles'),
     path('admin/', admin.site.urls),
     path('item/<int:pk>/', ItemView.as_view(), name='item'),
     path('order/<int:pk>/', OrderView.as_view(), name='order'),
+    path('stripe/webhook', stripe_webhook, name='stripe-webhook'),
+    path('export/orders', export_orders, name='export-orders'),
+    path('metrics', metrics, name='metrics'),
     path('api-auth/', include('rest_framework.urls'))
 ] + static(
     settings.STATIC_URL, 
@@ -47,5 +57,15 @@ router.register('buy', StripeItemView)
 router.register('buy/order', StripeOrderView)
 
 urlpatterns += [
+    path(
+        'buy/async/<int:pk>',
+        AsyncStripeItemView.as_view(),
+        name='buy-async'
+    ),
+    path(
+        'buy/order/async/<int:pk>',
+        AsyncStripeOrderView.as_view(),
+        name='buy-order-async'
+    ),
     path('',include(router.urls)),
 ]